@@ -0,0 +1,121 @@
+"""Benchmark Textract cell text resolution with and without the block index.
+
+The index is timed with its pure Python grid and, when NumPy is installed,
+with the vectorized per-page overlap matrix.
+
+Usage:
+    python -m benchmarks.bench_block_index [--blocks 5000]
+"""
+
+import argparse
+import time
+
+from benchmarks.synthetic import make_textract_response
+from waybill import textract_index
+from waybill.textract_index import BlockIndex
+
+
+def legacy_text_for_cell(cell, blocks):
+    """The original linear scan: every WORD block is checked for every cell"""
+    if "Text" in cell:
+        return cell["Text"]
+
+    cell_box = cell["Geometry"]["BoundingBox"]
+    cell_text = []
+
+    margin = 0.005
+    cell_left = cell_box["Left"] - margin
+    cell_right = cell_box["Left"] + cell_box["Width"] + margin
+    cell_top = cell_box["Top"] - margin
+    cell_bottom = cell_box["Top"] + cell_box["Height"] + margin
+
+    for block in blocks:
+        if block["BlockType"] == "WORD":
+            word_box = block["Geometry"]["BoundingBox"]
+            word_left = word_box["Left"]
+            word_right = word_box["Left"] + word_box["Width"]
+            word_top = word_box["Top"]
+            word_bottom = word_box["Top"] + word_box["Height"]
+
+            horizontal_overlap = word_right > cell_left and word_left < cell_right
+            vertical_overlap = word_bottom > cell_top and word_top < cell_bottom
+
+            if horizontal_overlap and vertical_overlap:
+                overlap_width = min(word_right, cell_right) - max(word_left, cell_left)
+                overlap_height = min(word_bottom, cell_bottom) - max(
+                    word_top, cell_top
+                )
+                word_area = word_box["Width"] * word_box["Height"]
+                overlap_area = max(0, overlap_width) * max(0, overlap_height)
+                if overlap_area > 0.3 * word_area:
+                    cell_text.append(block["Text"])
+
+    return " ".join(cell_text)
+
+
+def legacy_resolve(blocks):
+    results = []
+    for table in (b for b in blocks if b["BlockType"] == "TABLE"):
+        cell_ids = []
+        for relationship in table.get("Relationships", []):
+            if relationship["Type"] == "CHILD":
+                cell_ids.extend(relationship["Ids"])
+        for block in blocks:
+            if block["Id"] in cell_ids and block["BlockType"] == "CELL":
+                results.append(legacy_text_for_cell(block, blocks))
+    for block in blocks:
+        if block["BlockType"] == "LINE":
+            results.append(legacy_text_for_cell(block, blocks))
+    return results
+
+
+def indexed_resolve(blocks, vectorized=False):
+    index = BlockIndex(blocks, vectorized=vectorized)
+    results = []
+    for table in index.of_type("TABLE"):
+        for cell in index.related(table, "CHILD", block_type="CELL"):
+            results.append(index.text_for(cell))
+    for line in index.of_type("LINE"):
+        results.append(index.text_for(line))
+    return results
+
+
+def timed(func, blocks):
+    start = time.perf_counter()
+    result = func(blocks)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=5000)
+    args = parser.parse_args()
+
+    blocks = make_textract_response(args.blocks)["Blocks"]
+    print(f"Synthetic response: {len(blocks)} blocks")
+
+    legacy, legacy_time = timed(legacy_resolve, blocks)
+    indexed, indexed_time = timed(indexed_resolve, blocks)
+
+    if legacy != indexed:
+        raise SystemExit("Indexed results differ from the linear scan")
+
+    print(f"Linear scan:  {legacy_time * 1000:10.1f} ms")
+    print(f"Block index:  {indexed_time * 1000:10.1f} ms")
+    print(f"Speedup:      {legacy_time / indexed_time:10.1f}x")
+
+    if textract_index.numpy is None:
+        print("NumPy is not installed; skipping the vectorized index")
+        return
+
+    vectorized, vectorized_time = timed(
+        lambda blocks: indexed_resolve(blocks, vectorized=True), blocks
+    )
+    if vectorized != legacy:
+        raise SystemExit("Vectorized results differ from the linear scan")
+    print(f"Vectorized:   {vectorized_time * 1000:10.1f} ms")
+    print(f"Speedup:      {legacy_time / vectorized_time:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Benchmark peak RSS and time of the Excel export, in-memory vs streaming.
+
+Each scenario runs in its own subprocess so peak RSS is measured in
+isolation. Waybills are plain objects, so no database is needed.
+
+Usage:
+    python -m benchmarks.bench_excel_export [--sizes 1000 10000]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "waybill_project.settings")
+
+
+def make_waybills(count):
+    """Textract-shaped waybills with one 10x6 table and a few form fields"""
+    model = SimpleNamespace(name="AWS Textract")
+    extracted = {
+        "tables": [
+            {
+                "rows": [[f"'r{r}c{c}" for c in range(6)] for r in range(10)],
+                "confidence_scores": [[95.0 + c for c in range(6)] for _ in range(10)],
+            }
+        ],
+        "forms": {
+            f"Field {i}": {"value": f"Value {i}", "confidence": 90.0} for i in range(8)
+        },
+        "raw_text": "Tracking ABC123\n" * 20,
+    }
+    for idx in range(count):
+        yield SimpleNamespace(
+            id=idx + 1,
+            uploaded_at=datetime.now(),
+            extraction_model=model,
+            processed=True,
+            status="done",
+            extracteddata=SimpleNamespace(extracted_data=extracted),
+        )
+
+
+def legacy_export(waybills, output):
+    """The previous approach: a full in-memory workbook written cell by cell"""
+    from openpyxl import Workbook
+
+    waybills = list(waybills)
+    wb = Workbook()
+    summary = wb.active
+    summary.title = "Summary"
+    summary["A1"] = "Waybill Extraction Summary"
+    row = 6
+    for waybill in waybills:
+        summary[f"A{row}"] = waybill.id
+        summary[f"B{row}"] = waybill.uploaded_at.strftime("%Y-%m-%d %H:%M:%S")
+        summary[f"C{row}"] = waybill.extraction_model.name
+        summary[f"D{row}"] = "Yes"
+        row += 1
+    for waybill in waybills:
+        data = waybill.extracteddata.extracted_data
+        for table_idx, table in enumerate(data["tables"], 1):
+            sheet = wb.create_sheet(title=f"Table_{table_idx}")
+            for r, row_data in enumerate(table["rows"]):
+                for c, value in enumerate(row_data):
+                    sheet.cell(row=r + 1, column=c + 1, value=value[1:])
+            offset = len(table["rows"]) + 2
+            for r, row_data in enumerate(table["confidence_scores"]):
+                for c, value in enumerate(row_data):
+                    sheet.cell(row=offset + r + 1, column=c + 1, value=f"{value:.8f}")
+        info = wb.create_sheet(title="Forms_and_Text")
+        row = 3
+        for key, field in data["forms"].items():
+            info[f"A{row}"] = key
+            info[f"B{row}"] = field["value"]
+            info[f"C{row}"] = f"{field['confidence']:.8f}"
+            row += 1
+        info[f"A{row + 3}"] = data["raw_text"]
+    wb.save(output)
+
+
+def run_scenario(mode, count):
+    django.setup()
+    from waybill.exports import write_workbook
+
+    writer = write_workbook if mode == "streaming" else legacy_export
+    start = time.perf_counter()
+    with tempfile.TemporaryFile() as output:
+        writer(make_waybills(count), output)
+        size = output.tell()
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "waybills": count,
+                "seconds": round(elapsed, 2),
+                "peak_rss_mb": round(peak_rss_mb, 1),
+                "file_mb": round(size / 1024 / 1024, 2),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument(
+        "--timeout", type=int, default=900, help="Seconds allowed per scenario"
+    )
+    parser.add_argument("--scenario", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_scenario(args.scenario[0], int(args.scenario[1]))
+        return
+
+    print(f"{'mode':<10} {'waybills':>9} {'seconds':>8} {'peak RSS MB':>12} {'file MB':>8}")
+    for count in args.sizes:
+        for mode in ("in-memory", "streaming"):
+            try:
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "benchmarks.bench_excel_export",
+                        "--scenario",
+                        mode,
+                        str(count),
+                    ],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                    timeout=args.timeout,
+                ).stdout
+            except subprocess.TimeoutExpired:
+                print(f"{mode:<10} {count:>9}  did not finish in {args.timeout}s")
+                continue
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{mode:<10} {count:>9} {result['seconds']:>8} "
+                f"{result['peak_rss_mb']:>12} {result['file_mb']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
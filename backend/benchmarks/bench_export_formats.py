@@ -0,0 +1,63 @@
+"""Benchmark export throughput and size for xlsx, csv, ndjson and parquet.
+
+Waybills are plain objects, so no database is needed. Parquet is skipped
+when pyarrow is not installed.
+
+Usage:
+    python -m benchmarks.bench_export_formats [--count 2000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import django
+
+from .bench_excel_export import make_waybills
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "waybill_project.settings")
+
+
+def write_chunks(chunks, output):
+    for chunk in chunks:
+        output.write(chunk.encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000)
+    args = parser.parse_args()
+
+    django.setup()
+    from waybill import exports
+
+    writers = {
+        "xlsx": exports.write_workbook,
+        "csv": lambda waybills, output: write_chunks(
+            exports.stream_csv(waybills), output
+        ),
+        "ndjson": lambda waybills, output: write_chunks(
+            exports.stream_ndjson(waybills), output
+        ),
+    }
+    if exports.pyarrow is not None:
+        writers["parquet"] = exports.write_parquet
+
+    rows = sum(1 for _ in exports.iter_export_rows(make_waybills(args.count)))
+    print(f"{args.count} waybills, {rows} rows in the flat formats")
+    print(f"{'format':<8} {'seconds':>8} {'waybills/s':>11} {'file MB':>8}")
+    for name, writer in writers.items():
+        start = time.perf_counter()
+        with tempfile.TemporaryFile() as output:
+            writer(make_waybills(args.count), output)
+            size = output.tell()
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<8} {elapsed:>8.2f} {args.count / elapsed:>11.0f} "
+            f"{size / 1024 / 1024:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark field extraction from Mistral markdown with the compiled rules.
+
+Times the original line-by-line heuristic (substring checks on each
+lowercased line) against the single-pass rule engine over long
+multi-page markdown.
+
+Usage:
+    python -m benchmarks.bench_field_rules [--pages 50] [--repeat 20]
+"""
+
+import argparse
+import time
+
+from benchmarks.synthetic import make_mistral_markdown
+from waybill.extractors import rules
+
+
+def legacy_analyze_text(extracted_text):
+    """The original heuristic: the last line containing a keyword wins"""
+    analysis = {
+        "sender": {},
+        "recipient": {},
+        "shipment": {},
+    }
+
+    lines = extracted_text.split("\n")
+    for line in lines:
+        line = line.strip()
+        if "sender" in line.lower() or "from" in line.lower():
+            analysis["sender"]["info"] = line
+        elif "recipient" in line.lower() or "to" in line.lower():
+            analysis["recipient"]["info"] = line
+        elif "tracking" in line.lower() or "waybill" in line.lower():
+            analysis["shipment"]["tracking_number"] = line
+        elif "date" in line.lower():
+            analysis["shipment"]["date"] = line
+        elif "weight" in line.lower():
+            analysis["shipment"]["weight"] = line
+
+    return analysis
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = make_mistral_markdown(args.pages)
+    page_starts = []
+    offset = 0
+    for markdown in pages:
+        page_starts.append(offset)
+        offset += len(markdown) + 1
+    text = "".join(markdown + "\n" for markdown in pages)
+    print(f"Synthetic markdown: {args.pages} pages, {len(text) / 1024:.0f} KB")
+
+    rule_set = rules.compile_rules()
+    legacy, legacy_time = timed(lambda: legacy_analyze_text(text), args.repeat)
+    fields, rules_time = timed(
+        lambda: rule_set.extract(text, page_starts), args.repeat
+    )
+
+    # The heuristic only tests five substrings per line; the rules also
+    # read table columns and parse every value, so compare per page cost
+    print(f"Line heuristic: {legacy_time * 1000:10.2f} ms")
+    print(f"Compiled rules: {rules_time * 1000:10.2f} ms")
+    print(f"Rules per page: {rules_time * 1000 / args.pages:10.3f} ms")
+    print(f"Typed fields:   {len(fields):10d} ({len(fields) / rules_time:.0f}/s)")
+    print(f"Heuristic recipient: {legacy['recipient'].get('info', '')[:60]!r}")
+    print(f"Rules recipient:     {rules.analysis(fields)['recipient'].get('name')!r}")
+
+
+if __name__ == "__main__":
+    main()
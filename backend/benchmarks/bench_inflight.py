@@ -0,0 +1,174 @@
+"""In-flight provider calls one worker process sustains, threads vs event loop.
+
+Queues --images uploads through the app, then extracts them against the
+stub Mistral OCR provider with one `run_extraction_workers` process, twice:
+with worker threads (--workers, each blocking on a call) and with the
+async job runner (--async-concurrency jobs on one event loop). Provider
+limits are raised out of the way, so the runner is the only bound. Reports
+the peak number of calls the stub saw in flight, extraction throughput,
+and the worker's threads and peak RSS.
+
+Usage:
+    python -m benchmarks.bench_inflight [--images 300] [--latency 2]
+        [--threads 2] [--concurrency 200] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import Namespace
+
+import requests
+
+from . import stub_server
+from .bench_load import (
+    BACKEND_DIR,
+    App,
+    git_commit,
+    peak_rss_mb,
+    scenario_extraction,
+    scenario_upload,
+)
+
+
+def thread_count(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def start_worker(mode, args, env):
+    """manage.py run_extraction_workers with the runner under test"""
+    if mode == "threads":
+        runner = ["--workers", str(args.threads)]
+    else:
+        runner = ["--async-concurrency", str(args.concurrency)]
+    return subprocess.Popen(
+        [sys.executable, "manage.py", "run_extraction_workers", *runner],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def stop_worker(process):
+    os.killpg(process.pid, signal.SIGKILL)
+    process.wait()
+
+
+def run(mode, args):
+    stub, stub_url = stub_server.start(latency=args.latency, jitter=0.0)
+    scratch = tempfile.TemporaryDirectory(prefix="waybill-inflight-")
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "waybill_project.settings",
+        "DEBUG": "False",
+        "SQLITE_PATH": os.path.join(scratch.name, "db.sqlite3"),
+        "MEDIA_ROOT": os.path.join(scratch.name, "media"),
+        "MISTRAL_SERVER_URL": stub_url,
+        "MISTRAL_API_KEY": "stub",
+        "MISTRAL_CONCURRENCY": "10000",
+        "MISTRAL_RATE_LIMIT": "10000",
+        # Only the worker process under test extracts
+        "EXTRACTION_WORKERS": "0",
+        "EXTRACTION_POLL_INTERVAL": "0.2",
+        "LOG_LEVEL": "WARNING",
+    }
+    app = App(1, env)
+    app.start()
+    # Few batches, so polling their status stays out of the way
+    load = Namespace(
+        uploads=10,
+        images_per_upload=max(args.images // 10, 1),
+        image_size=400,
+        clients=8,
+        timeout=args.timeout,
+        poll_interval=0.5,
+    )
+    worker = None
+    try:
+        session = requests.Session()
+        models = session.get(f"{app.url}/api/extraction-models/").json()
+        model_id = next(model["id"] for model in models if model["engine"] == "mistral")
+        # Queue everything first; uploading is not what is measured
+        _, batches = scenario_upload(session, app, load, model_id)
+
+        worker = start_worker(mode, args, env)
+        started_at = time.monotonic()
+        for batch in batches:
+            batch["sent_at"] = started_at
+        extraction = scenario_extraction(session, app, load, batches)
+        threads = thread_count(worker.pid)
+        peak_rss = peak_rss_mb(worker.pid)
+    finally:
+        if worker is not None:
+            stop_worker(worker)
+        app.stop()
+        stub.shutdown()
+        scratch.cleanup()
+
+    stats = stub.provider.stats()
+    return {
+        "runner": (
+            f"{args.threads} worker threads"
+            if mode == "threads"
+            else f"event loop, {args.concurrency} concurrent jobs"
+        ),
+        "peak_in_flight": stats["peak_in_flight"],
+        "provider_calls": stats["mistral"],
+        "images_per_second": round(extraction["images"] / extraction["seconds"], 2),
+        "extraction_seconds": extraction["seconds"],
+        "unfinished_batches": extraction["errors"],
+        "worker_threads": threads,
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds per call")
+    parser.add_argument("--threads", type=int, default=2, help="EXTRACTION_WORKERS")
+    parser.add_argument(
+        "--concurrency", type=int, default=200, help="EXTRACTION_ASYNC_CONCURRENCY"
+    )
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="JSON results file")
+    args = parser.parse_args()
+    # Run the cleanup in `finally` blocks when killed, too
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(1))
+
+    results = {"commit": git_commit(), "config": vars(args), "runs": {}}
+    print(f"{args.images} images, {args.latency}s per provider call, one worker")
+    print(
+        f"{'runner':<34} {'in flight':>9} {'images/s':>9} {'threads':>8} "
+        f"{'RSS MB':>7}"
+    )
+    for mode in ("threads", "async"):
+        result = run(mode, args)
+        results["runs"][mode] = result
+        print(
+            f"{result['runner']:<34} {result['peak_in_flight']:>9} "
+            f"{result['images_per_second']:>9} {result['worker_threads']:>8} "
+            f"{result['peak_rss_mb']:>7}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
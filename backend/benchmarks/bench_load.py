@@ -0,0 +1,465 @@
+"""Load test the ASGI app end to end against the stub OCR provider.
+
+Starts the stub provider (benchmarks/stub_server.py) and uvicorn with
+--workers processes on a scratch database and media directory, then runs
+the scenarios with --clients concurrent clients:
+
+    upload          POST /api/waybills/bulk_upload/ with unique images
+    extraction      time from upload until its batch has finished
+    download_excel  GET /api/waybills/download_excel/ for single batches
+    export_csv      GET /api/waybills/export/?format=csv of every waybill
+
+Each scenario reports p50/p95/p99 latency and throughput; the peak RSS of
+every uvicorn worker is read at the end. Results are written as JSON
+(--output) so runs can be compared across commits with --compare.
+
+Usage:
+    python -m benchmarks.bench_load [--engine textract] [--workers 2]
+        [--clients 8] [--uploads 40] [--latency 0.3] [--error-rate 0.02]
+        [--output results.json] [--compare previous.json]
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from PIL import Image, ImageDraw
+
+from . import stub_server
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ["upload", "extraction", "download_excel", "export_csv"]
+ENGINES = {"textract": "AWS Textract", "mistral": "Mistral", "fake": "Fake"}
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def make_image(seed, size):
+    """A PNG waybill-like page, unique per seed so the OCR cache never hits"""
+    rng = random.Random(seed)
+    image = Image.new("L", (size, int(size * 1.3)), 255)
+    draw = ImageDraw.Draw(image)
+    for row in range(30):
+        top = 40 + row * size // 25
+        draw.text((40, top), f"Parcel {seed}-{row} {rng.randrange(10**6)}", fill=0)
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    return output.getvalue()
+
+
+def summarize(latencies, errors, seconds):
+    """Latency percentiles in ms and throughput of one scenario"""
+    summary = {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput": round(len(latencies) / seconds, 2) if seconds else 0.0,
+    }
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        summary["latency_ms"] = {
+            "p50": round(cuts[49] * 1000, 1),
+            "p95": round(cuts[94] * 1000, 1),
+            "p99": round(cuts[98] * 1000, 1),
+            "mean": round(statistics.fmean(latencies) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1),
+        }
+    elif latencies:
+        value = round(latencies[0] * 1000, 1)
+        summary["latency_ms"] = {
+            key: value for key in ("p50", "p95", "p99", "mean", "max")
+        }
+    return summary
+
+
+def run_concurrently(func, items, clients):
+    """Call func on every item from `clients` threads; func returns success.
+
+    Returns the latencies of successful calls, the error count and the
+    wall-clock seconds.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(item):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = func(item)
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(timed, items))
+    return latencies, errors, time.perf_counter() - start
+
+
+def worker_pids(parent):
+    """uvicorn worker processes of the master `parent`, from /proc (Linux only)"""
+    pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as stat:
+                # The command name may contain spaces; fields follow its ")"
+                fields = stat.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{name}/cmdline", "rb") as cmdline:
+                command = cmdline.read()
+        except OSError:
+            continue
+        # Skip the multiprocessing resource tracker next to the workers
+        if int(fields[1]) == parent and b"spawn_main" in command:
+            pids.append(int(name))
+    return pids
+
+
+def peak_rss_mb(pid):
+    """VmHWM (peak resident set size) of a process, in MB"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class App:
+    """uvicorn serving the project on a scratch database and media root"""
+
+    def __init__(self, workers, env):
+        self.workers = workers
+        self.env = env
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+
+    def manage(self, *args):
+        subprocess.run(
+            [sys.executable, "manage.py", *args],
+            cwd=BACKEND_DIR,
+            env=self.env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+    def start(self, timeout=60):
+        self.manage("migrate", "--noinput")
+        self.manage("create_extraction_models", "--fake")
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "waybill_project.asgi:application",
+                "--port",
+                str(self.port),
+                "--workers",
+                str(self.workers),
+                "--log-level",
+                "warning",
+                "--no-access-log",
+            ],
+            cwd=BACKEND_DIR,
+            env=self.env,
+            # Own process group, so stop() also reaches the preprocessing
+            # pools the workers spawn
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(f"{self.url}/api/extraction-models/").ok:
+                    return
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise SystemExit("The app did not start in time")
+
+    def worker_memory(self):
+        pids = worker_pids(self.process.pid) if self.workers > 1 else []
+        pids = pids or [self.process.pid]
+        return [{"pid": pid, "peak_rss_mb": peak_rss_mb(pid)} for pid in pids]
+
+    def stop(self):
+        if self.process is None:
+            return
+        os.killpg(self.process.pid, signal.SIGTERM)
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+
+
+def scenario_upload(session, app, args, model_id):
+    """Concurrent bulk uploads; returns the summary and the batches queued"""
+    payloads = [
+        [
+            make_image(upload * args.images_per_upload + index, args.image_size)
+            for index in range(args.images_per_upload)
+        ]
+        for upload in range(args.uploads)
+    ]
+    batches = []
+    lock = threading.Lock()
+
+    def upload(images):
+        sent_at = time.monotonic()
+        response = session.post(
+            f"{app.url}/api/waybills/bulk_upload/",
+            data={"extraction_model": model_id},
+            files=[
+                ("images", (f"waybill_{index}.png", image, "image/png"))
+                for index, image in enumerate(images)
+            ],
+        )
+        if response.status_code != 202:
+            return False
+        with lock:
+            batches.append({"sent_at": sent_at, **response.json()})
+        return True
+
+    summary = summarize(*run_concurrently(upload, payloads, args.clients))
+    return summary, batches
+
+
+def scenario_extraction(session, app, args, batches):
+    """Seconds from sending each upload until its batch finished"""
+    pending = {batch["batch_id"]: batch for batch in batches}
+    latencies = []
+    failed = 0
+    start = time.monotonic()
+    deadline = start + args.timeout
+    while pending and time.monotonic() < deadline:
+        for batch_id, batch in list(pending.items()):
+            status = session.get(f"{app.url}/api/{batch['status_url']}").json()
+            if status.get("finished"):
+                latencies.append(time.monotonic() - batch["sent_at"])
+                failed += status["counts"].get("failed", 0)
+                del pending[batch_id]
+        time.sleep(args.poll_interval)
+
+    # Measured from the first upload, like throughput of the whole pipeline
+    first_sent = min((batch["sent_at"] for batch in batches), default=start)
+    summary = summarize(latencies, len(pending), time.monotonic() - first_sent)
+    summary["failed_jobs"] = failed
+    summary["images"] = len(latencies) * args.images_per_upload
+    return summary
+
+
+def scenario_download_excel(session, app, args, batches):
+    rng = random.Random(0)
+    targets = [rng.choice(batches)["ids"] for _ in range(args.downloads)]
+
+    def download(ids):
+        response = session.get(
+            f"{app.url}/api/waybills/download_excel/",
+            params={"ids": ",".join(map(str, ids))},
+        )
+        return response.status_code == 200 and len(response.content) > 0
+
+    return summarize(*run_concurrently(download, targets, args.clients))
+
+
+def scenario_export_csv(session, app, args, batches):
+    def export(_):
+        response = session.get(f"{app.url}/api/waybills/export/?format=csv")
+        return response.status_code == 200 and len(response.content) > 0
+
+    return summarize(*run_concurrently(export, range(args.downloads), args.clients))
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results, previous_path):
+    with open(previous_path) as source:
+        previous = json.load(source)
+    print(f"\nCompared with {previous.get('commit') or previous_path}:")
+    print(f"{'scenario':<15} {'metric':<11} {'before':>10} {'after':>10} {'change':>8}")
+    for name, summary in results["scenarios"].items():
+        before = previous.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        metrics = [("throughput", before.get("throughput"), summary["throughput"])]
+        for key in ("p50", "p95", "p99"):
+            metrics.append(
+                (
+                    key,
+                    before.get("latency_ms", {}).get(key),
+                    summary.get("latency_ms", {}).get(key),
+                )
+            )
+        for metric, old, new in metrics:
+            if not old or new is None:
+                continue
+            print(
+                f"{name:<15} {metric:<11} {old:>10} {new:>10} "
+                f"{(new - old) / old * 100:>+7.1f}%"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="textract")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn workers")
+    parser.add_argument(
+        "--extraction-workers",
+        type=int,
+        default=4,
+        help="Extraction threads per uvicorn worker",
+    )
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--uploads", type=int, default=40)
+    parser.add_argument("--images-per-upload", type=int, default=1)
+    parser.add_argument("--image-size", type=int, default=1000, help="Width in px")
+    parser.add_argument("--downloads", type=int, default=40)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    parser.add_argument("--output", help="JSON results file")
+    parser.add_argument("--compare", help="Earlier JSON results to compare with")
+    stub_server.add_arguments(parser)
+    args = parser.parse_args()
+    # Run the cleanup in `finally` blocks when killed, too
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(1))
+
+    stub, stub_url = stub_server.start(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        blocks=args.blocks,
+    )
+    scratch = tempfile.TemporaryDirectory(prefix="waybill-load-")
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "waybill_project.settings",
+        "DEBUG": "False",
+        "SQLITE_PATH": os.path.join(scratch.name, "db.sqlite3"),
+        "MEDIA_ROOT": os.path.join(scratch.name, "media"),
+        "EXTRACTION_WORKERS": str(args.extraction_workers),
+        "TEXTRACT_ENDPOINT_URL": stub_url,
+        "MISTRAL_SERVER_URL": stub_url,
+        "AWS_ACCESS_KEY_ID": "stub",
+        "AWS_SECRET_ACCESS_KEY": "stub",
+        "MISTRAL_API_KEY": "stub",
+        "LOG_LEVEL": "WARNING",
+    }
+    app = App(args.workers, env)
+    app.start()
+
+    results = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": vars(args),
+        "scenarios": {},
+    }
+    try:
+        session = requests.Session()
+        session.mount(
+            "http://",
+            requests.adapters.HTTPAdapter(pool_maxsize=max(args.clients, 10)),
+        )
+        models = session.get(f"{app.url}/api/extraction-models/").json()
+        model_id = next(
+            model["id"] for model in models if model["engine"] == args.engine
+        )
+
+        print("Uploading...", flush=True)
+        summary, batches = scenario_upload(session, app, args, model_id)
+        if "upload" in args.scenarios:
+            results["scenarios"]["upload"] = summary
+        # The other scenarios need the uploads to have been extracted
+        print("Waiting for the extraction of the uploads...", flush=True)
+        extraction = scenario_extraction(session, app, args, batches)
+        if "extraction" in args.scenarios:
+            results["scenarios"]["extraction"] = extraction
+        print("Downloading...", flush=True)
+        if batches and "download_excel" in args.scenarios:
+            results["scenarios"]["download_excel"] = scenario_download_excel(
+                session, app, args, batches
+            )
+        if "export_csv" in args.scenarios:
+            results["scenarios"]["export_csv"] = scenario_export_csv(
+                session, app, args, batches
+            )
+        results["workers"] = app.worker_memory()
+    finally:
+        app.stop()
+        stub.shutdown()
+        scratch.cleanup()
+    results["stub"] = stub.provider.stats()
+
+    print(
+        f"{args.engine}: {args.uploads} uploads x {args.images_per_upload} images, "
+        f"{args.clients} clients, {args.workers} workers, "
+        f"provider latency {args.latency}s, error rate {args.error_rate}"
+    )
+    print(
+        f"{'scenario':<15} {'requests':>8} {'errors':>6} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for name, summary in results["scenarios"].items():
+        latency = summary.get("latency_ms", {})
+        print(
+            f"{name:<15} {summary['requests']:>8} {summary['errors']:>6} "
+            f"{summary['throughput']:>8} {latency.get('p50', '-'):>8} "
+            f"{latency.get('p95', '-'):>8} {latency.get('p99', '-'):>8}"
+        )
+    for worker in results["workers"]:
+        print(f"worker {worker['pid']}: peak RSS {worker['peak_rss_mb']} MB")
+    print(f"stub provider calls: {results['stub']}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark decoding and parsing of archived provider responses.
+
+Replays the response archive (in the media storage by default) through
+each engine's parse(), the local hot path that `manage.py reprocess` runs,
+without calling any provider. With an empty archive, synthetic Textract
+responses are encoded with every available codec and replayed instead.
+
+Usage:
+    python -m benchmarks.bench_replay [--dir PATH] [--limit 500] [--repeat 3]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+from collections import defaultdict
+
+import django
+
+from .synthetic import make_textract_response
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "waybill_project.settings")
+
+
+def archived_files(directory, limit):
+    """(codec, compressed bytes) of up to limit archived responses"""
+    from waybill import response_archive
+
+    files = []
+    if not os.path.isdir(directory):
+        return files
+    for name in sorted(os.listdir(directory))[:limit]:
+        try:
+            codec = response_archive.codec_for(name)
+        except ValueError:
+            continue
+        with open(os.path.join(directory, name), "rb") as source:
+            files.append((codec, source.read()))
+    return files
+
+
+def stored_files(limit):
+    """(codec, compressed bytes) of up to limit responses in the media storage"""
+    from waybill import response_archive
+    from waybill.models import ProviderResponse
+
+    files = []
+    for response in ProviderResponse.objects.order_by("id")[:limit]:
+        try:
+            files.append((response.codec, response_archive.read(response)))
+        except OSError:
+            continue
+    return files
+
+
+def synthetic_files(count):
+    """Textract responses of about 2000 blocks, encoded with each codec"""
+    from waybill import response_archive
+
+    codecs = ["gzip"] + (["zstd"] if response_archive.zstandard else [])
+    files = []
+    for seed in range(count):
+        blocks = make_textract_response(2000, with_children=True, seed=seed)["Blocks"]
+        for codec in codecs:
+            data, _ = response_archive.encode("textract", {"blocks": blocks}, codec)
+            files.append((codec, data))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", help="Archive directory to replay")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    django.setup()
+    from waybill import extractors, response_archive
+
+    if args.dir:
+        directory = args.dir
+        files = archived_files(directory, args.limit)
+    else:
+        directory = "the media storage"
+        files = stored_files(args.limit)
+    if files:
+        print(f"Replaying {len(files)} archived responses from {directory}")
+    else:
+        files = synthetic_files(min(args.limit, 50))
+        print(f"No archive at {directory}; replaying {len(files)} synthetic responses")
+
+    stats = defaultdict(lambda: defaultdict(float))
+    for _ in range(args.repeat):
+        for codec, data in files:
+            start = time.perf_counter()
+            engine, raw = response_archive.decode(data, codec)
+            decoded = time.perf_counter()
+            # Engines print progress while parsing; keep it out of the timings
+            with contextlib.redirect_stdout(io.StringIO()):
+                extractors.for_slug(engine).parse(raw)
+            parsed = time.perf_counter()
+
+            row = stats[(engine, codec)]
+            row["responses"] += 1
+            row["compressed"] += len(data)
+            row["decode"] += decoded - start
+            row["parse"] += parsed - decoded
+
+    print(
+        f"{'engine':<18} {'codec':<5} {'responses':>9} {'KB each':>8} "
+        f"{'decode ms':>9} {'parse ms':>9} {'per s':>8}"
+    )
+    for (engine, codec), row in sorted(stats.items()):
+        count = row["responses"]
+        total = row["decode"] + row["parse"]
+        print(
+            f"{engine:<18} {codec:<5} {count:>9.0f} "
+            f"{row['compressed'] / count / 1024:>8.1f} "
+            f"{row['decode'] / count * 1000:>9.2f} "
+            f"{row['parse'] / count * 1000:>9.2f} {count / total:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark page throughput of the local Tesseract engine by pool size.
+
+Renders synthetic waybill pages (a few "Label: value" lines and a table),
+then OCRs them through TesseractExtractor with several threads submitting
+to pools of increasing size. Needs the tesseract binary and pytesseract.
+
+Usage:
+    python -m benchmarks.bench_tesseract [--pages 40] [--workers 1 2 4]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from PIL import Image, ImageDraw, ImageFont
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "waybill_project.settings")
+
+
+def render_page(path, seed):
+    """A 1700x2200 (A4 at 200 DPI) waybill page with forms and a table"""
+    rng = random.Random(seed)
+    image = Image.new("L", (1700, 2200), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=36)
+
+    lines = [
+        f"Tracking No: TRK{rng.randrange(10**9):09d}",
+        f"Sender: Warehouse {rng.randrange(100)}",
+        f"Recipient: Customer {rng.randrange(1000)}",
+        f"Date: 2025-03-{rng.randrange(1, 29):02d}",
+    ]
+    for index, line in enumerate(lines):
+        draw.text((120, 150 + index * 80), line, fill=0, font=font)
+
+    rows = [["Item", "Pieces", "Weight"]]
+    for row in range(1, 12):
+        rows.append(
+            [f"Parcel {row}", str(rng.randrange(1, 9)), f"{rng.randrange(1, 40)} kg"]
+        )
+    for row, cells in enumerate(rows):
+        for column, text in enumerate(cells):
+            draw.text((120 + column * 500, 600 + row * 90), text, fill=0, font=font)
+
+    image.save(path, dpi=(200, 200))
+
+
+def run(paths, workers, threads):
+    from django.conf import settings
+    from waybill.extractors import Document, tesseract
+
+    settings.TESSERACT_WORKERS = workers
+    tesseract._executor = None
+    engine = tesseract.TesseractExtractor()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(
+            pool.map(lambda path: engine.extract(Document.from_path(path)), paths)
+        )
+    elapsed = time.perf_counter() - start
+    if tesseract._executor is not None:
+        tesseract._executor.shutdown()
+
+    fields = sum(len(result.data["forms"]) for result in results)
+    return elapsed, fields
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, max(1, (os.cpu_count() or 1) // 2), os.cpu_count() or 1}),
+    )
+    parser.add_argument(
+        "--threads", type=int, default=8, help="Extraction threads submitting pages"
+    )
+    args = parser.parse_args()
+
+    django.setup()
+    from waybill.extractors import TesseractExtractor
+
+    if not TesseractExtractor().is_configured():
+        print("Tesseract is not available; install it and pytesseract first")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index in range(args.pages):
+            path = os.path.join(directory, f"waybill_{index}.png")
+            render_page(path, index)
+            paths.append(path)
+
+        print(f"{args.pages} pages, {args.threads} extraction threads")
+        print(f"{'workers':>7} {'seconds':>8} {'pages/s':>8} {'form fields':>12}")
+        for workers in args.workers:
+            elapsed, fields = run(paths, workers, args.threads)
+            print(
+                f"{workers:>7} {elapsed:>8.2f} {args.pages / elapsed:>8.1f} "
+                f"{fields:>12}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Local stand-in for the Textract and Mistral OCR APIs, for load tests.
+
+Textract AnalyzeDocument requests (AWS JSON protocol, any path) get a
+synthetic response of --blocks blocks; Mistral POST /v1/ocr requests get
+one markdown page per call. Every call waits --latency seconds (plus up
+to --jitter), and fails with --error-rate probability as the real APIs do
+when throttling: Textract with a 400 ThrottlingException and Mistral with
+a 429. GET /stats returns call counters and the peak of calls in flight.
+
+Point the app at it with TEXTRACT_ENDPOINT_URL=http://127.0.0.1:PORT and
+MISTRAL_SERVER_URL=http://127.0.0.1:PORT, with any non-empty credentials.
+
+Usage:
+    python -m benchmarks.stub_server [--port 8765] [--latency 0.3]
+        [--jitter 0.1] [--error-rate 0.02] [--blocks 400]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .synthetic import make_mistral_markdown, make_textract_response
+
+
+class StubProvider:
+    """Behaviour and counters shared by the request handler threads"""
+
+    def __init__(self, latency=0.3, jitter=0.1, error_rate=0.0, blocks=400):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.blocks = blocks
+        self.counts = {"textract": 0, "mistral": 0, "errors": 0, "peak_in_flight": 0}
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        # Responses only depend on the document, so build each shape once
+        self._textract = {}
+        self._markdown = make_mistral_markdown(pages=1)[0]
+
+    def call(self, provider):
+        """Wait like the provider would; False when this call should fail"""
+        with self._lock:
+            self.counts[provider] += 1
+            failed = self._random.random() < self.error_rate
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if failed:
+                self.counts["errors"] += 1
+            self.in_flight += 1
+            self.counts["peak_in_flight"] = max(
+                self.counts["peak_in_flight"], self.in_flight
+            )
+        time.sleep(delay)
+        with self._lock:
+            self.in_flight -= 1
+        return not failed
+
+    def textract_response(self, document_bytes):
+        seed = int(hashlib.sha256(document_bytes).hexdigest()[:8], 16) % 16
+        if seed not in self._textract:
+            response = make_textract_response(
+                self.blocks, with_children=True, seed=seed
+            )
+            response["DocumentMetadata"] = {"Pages": 1}
+            self._textract[seed] = json.dumps(response).encode("utf-8")
+        return self._textract[seed]
+
+    def mistral_response(self, size):
+        return json.dumps(
+            {
+                "pages": [
+                    {
+                        "index": 0,
+                        "markdown": self._markdown,
+                        "images": [],
+                        "dimensions": {"dpi": 200, "height": 2200, "width": 1700},
+                    }
+                ],
+                "model": "mistral-ocr-latest",
+                "usage_info": {"pages_processed": 1, "doc_size_bytes": size},
+            }
+        ).encode("utf-8")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    provider = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self.reply(200, json.dumps(self.provider.stats()).encode("utf-8"))
+        else:
+            self.reply(404, b"{}")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        target = self.headers.get("X-Amz-Target", "")
+
+        if target.endswith("AnalyzeDocument"):
+            if not self.provider.call("textract"):
+                error = {"__type": "ThrottlingException", "message": "Rate exceeded"}
+                self.reply(
+                    400,
+                    json.dumps(error).encode("utf-8"),
+                    "application/x-amz-json-1.1",
+                )
+                return
+            document = json.loads(body)["Document"].get("Bytes", "")
+            self.reply(
+                200,
+                self.provider.textract_response(document.encode("utf-8")),
+                "application/x-amz-json-1.1",
+            )
+        elif self.path.rstrip("/").endswith("/v1/ocr"):
+            if not self.provider.call("mistral"):
+                self.reply(429, b'{"message": "Rate limit exceeded"}')
+                return
+            self.reply(200, self.provider.mistral_response(len(body)))
+        else:
+            self.reply(404, b'{"message": "Not emulated"}')
+
+
+def start(port=0, **options):
+    """Serve a StubProvider on a background thread; returns (server, url)"""
+    provider = StubProvider(**options)
+    handler = type("Handler", (StubHandler,), {"provider": provider})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.provider = provider
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds per call")
+    parser.add_argument(
+        "--jitter", type=float, default=0.1, help="Extra random seconds per call"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Share of throttled calls"
+    )
+    parser.add_argument(
+        "--blocks", type=int, default=400, help="Blocks per Textract response"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start(
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        blocks=args.blocks,
+    )
+    print(f"Stub Textract/Mistral provider at {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
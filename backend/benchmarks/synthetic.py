@@ -0,0 +1,142 @@
+"""Synthetic provider responses for benchmarks and load tests."""
+
+import random
+
+
+def _box(left, top, width, height):
+    return {
+        "BoundingBox": {"Left": left, "Top": top, "Width": width, "Height": height}
+    }
+
+
+def make_textract_response(target_blocks=5000, with_children=False, seed=0):
+    """Build an analyze_document style response with roughly target_blocks blocks.
+
+    The page is split into a stack of tables. Every cell holds two words and
+    every table row is also emitted as a LINE. With with_children=False the
+    CELL blocks carry no CHILD relationships, which forces the geometry path.
+    """
+    rng = random.Random(seed)
+    blocks = [{"Id": "page-1", "BlockType": "PAGE", "Geometry": _box(0, 0, 1, 1)}]
+    counter = 0
+
+    def next_id(prefix):
+        nonlocal counter
+        counter += 1
+        return f"{prefix}-{counter}"
+
+    rows, cols = 10, 8
+    # cell + 2 words per cell, one line per row, one table block
+    per_table = rows * cols * 3 + rows + 1
+    table_count = max(1, round(target_blocks / per_table))
+    table_height = 1.0 / table_count
+    row_height = table_height / rows
+    col_width = 1.0 / cols
+
+    for table_idx in range(table_count):
+        table_id = next_id("table")
+        table_top = table_idx * table_height
+        cell_ids = []
+        row_blocks = []
+
+        for row in range(rows):
+            top = table_top + row * row_height
+            line_word_ids = []
+            line_words = []
+
+            for col in range(cols):
+                left = col * col_width
+                word_ids = []
+                for word_idx in range(2):
+                    word_id = next_id("word")
+                    text = f"w{table_idx}_{row}_{col}_{word_idx}"
+                    blocks.append(
+                        {
+                            "Id": word_id,
+                            "BlockType": "WORD",
+                            "Text": text,
+                            "Confidence": rng.uniform(80, 100),
+                            "Page": 1,
+                            "Geometry": _box(
+                                left + col_width * (0.1 + 0.4 * word_idx),
+                                top + row_height * 0.2,
+                                col_width * 0.35,
+                                row_height * 0.6,
+                            ),
+                        }
+                    )
+                    word_ids.append(word_id)
+                    line_word_ids.append(word_id)
+                    line_words.append(text)
+
+                cell = {
+                    "Id": next_id("cell"),
+                    "BlockType": "CELL",
+                    "RowIndex": row + 1,
+                    "ColumnIndex": col + 1,
+                    "Confidence": rng.uniform(50, 100),
+                    "Page": 1,
+                    "Geometry": _box(left, top, col_width, row_height),
+                }
+                if with_children:
+                    cell["Relationships"] = [{"Type": "CHILD", "Ids": word_ids}]
+                cell_ids.append(cell["Id"])
+                row_blocks.append(cell)
+
+            row_blocks.append(
+                {
+                    "Id": next_id("line"),
+                    "BlockType": "LINE",
+                    "Text": " ".join(line_words),
+                    "Confidence": rng.uniform(80, 100),
+                    "Page": 1,
+                    "Geometry": _box(0, top, 1, row_height),
+                    "Relationships": [{"Type": "CHILD", "Ids": line_word_ids}],
+                }
+            )
+
+        blocks.append(
+            {
+                "Id": table_id,
+                "BlockType": "TABLE",
+                "Page": 1,
+                "Geometry": _box(0, table_top, 1, table_height),
+                "Relationships": [{"Type": "CHILD", "Ids": cell_ids}],
+            }
+        )
+        blocks.extend(row_blocks)
+
+    return {"Blocks": blocks}
+
+
+def make_mistral_markdown(pages=50, seed=0):
+    """Markdown pages like Mistral OCR output of a long multi-page waybill.
+
+    Each page has a heading, a few "Label: value" lines, prose that mentions
+    labels mid-sentence, and an item table with a weight column.
+    """
+    rng = random.Random(seed)
+    markdown = []
+    for page in range(pages):
+        lines = [
+            f"# Waybill page {page + 1}",
+            "",
+            f"**Tracking No.:** TRK{rng.randrange(10**9):09d}",
+            f"From: Warehouse {rng.randrange(100)}, Toronto",
+            f"To: Customer {rng.randrange(1000)}<br>{rng.randrange(1, 999)} Main St",
+            f"Date: {rng.randrange(1, 29):02d}/{rng.randrange(1, 13):02d}/2025",
+            "",
+            "Parcels are delivered to the door; the sender is notified by email "
+            "once the recipient signs. Tracking updates follow every scan.",
+            "",
+            "| Item | Pieces | Weight |",
+            "|---|---|---|",
+        ]
+        for row in range(40):
+            lines.append(
+                f"| Parcel {row + 1} | {rng.randrange(1, 9)} | "
+                f"{rng.randrange(1, 400) / 10} kg |"
+            )
+        lines += ["", "| Service | Express |", "| Total Weight | 120 kg |"]
+        markdown.append("\n".join(lines))
+    return markdown
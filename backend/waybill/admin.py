@@ -1,22 +1,114 @@
 from django.contrib import admin
-from .models import ExtractionModel, WaybillImage, ExtractedData
+from django.utils.html import format_html
+from . import derivatives
+from .models import (
+    ExtractionModel,
+    WaybillImage,
+    ExtractedData,
+    ExtractedField,
+    ExtractionStage,
+    UploadBatch,
+    ExtractionJob,
+    CachedExtraction,
+    ExportJob,
+)
 
 
 @admin.register(ExtractionModel)
 class ExtractionModelAdmin(admin.ModelAdmin):
-    list_display = ("name", "description", "is_active")
+    list_display = (
+        "name",
+        "engine",
+        "escalation_engine",
+        "escalation_threshold",
+        "description",
+        "is_active",
+    )
     search_fields = ("name", "description")
-    list_filter = ("is_active",)
+    list_filter = ("engine", "is_active")
 
 
 @admin.register(WaybillImage)
 class WaybillImageAdmin(admin.ModelAdmin):
-    list_display = ("id", "uploaded_at", "processed", "extraction_model")
-    list_filter = ("processed", "extraction_model")
+    list_display = ("id", "thumbnail", "uploaded_at", "status", "extraction_model")
+    list_filter = ("status", "extraction_model")
     date_hierarchy = "uploaded_at"
+    readonly_fields = ("preview",)
+
+    @admin.display(description="Thumbnail")
+    def thumbnail(self, obj):
+        url = derivatives.url(obj, "thumbnail")
+        return format_html('<img src="{}" height="48">', url) if url else "-"
+
+    @admin.display(description="Preview")
+    def preview(self, obj):
+        url = derivatives.url(obj, "preview")
+        return format_html('<img src="{}" style="max-width: 100%">', url) if url else "-"
 
 
 @admin.register(ExtractedData)
 class ExtractedDataAdmin(admin.ModelAdmin):
     list_display = ("id", "waybill_image", "extracted_at")
     date_hierarchy = "extracted_at"
+
+
+@admin.register(ExtractedField)
+class ExtractedFieldAdmin(admin.ModelAdmin):
+    list_display = ("waybill_image", "provider", "source", "key", "value", "confidence")
+    list_filter = ("provider", "source")
+    search_fields = ("name", "lookup_value")
+
+
+@admin.register(ExtractionStage)
+class ExtractionStageAdmin(admin.ModelAdmin):
+    list_display = (
+        "waybill_image",
+        "extraction_model",
+        "stage",
+        "engine",
+        "pages",
+        "escalated_pages",
+        "calls",
+        "seconds",
+        "cost",
+    )
+    list_filter = ("extraction_model", "stage", "engine")
+    date_hierarchy = "created_at"
+
+
+@admin.register(UploadBatch)
+class UploadBatchAdmin(admin.ModelAdmin):
+    list_display = ("id", "extraction_model", "created_at")
+    date_hierarchy = "created_at"
+
+
+@admin.register(ExtractionJob)
+class ExtractionJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "waybill_image",
+        "batch",
+        "status",
+        "attempts",
+        "worker",
+        "started_at",
+        "finished_at",
+    )
+    list_filter = ("status",)
+    search_fields = ("error", "worker")
+
+
+@admin.register(CachedExtraction)
+class CachedExtractionAdmin(admin.ModelAdmin):
+    list_display = ("content_hash", "extraction_model", "hits", "created_at")
+    list_filter = ("extraction_model",)
+    search_fields = ("content_hash",)
+    date_hierarchy = "created_at"
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ("key", "status", "size", "created_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("key",)
+    exclude = ("waybill_ids",)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class WaybillConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'waybill'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,317 @@
+import asyncio
+import logging
+import threading
+import weakref
+
+import boto3
+import httpx
+from botocore.config import Config
+from django.conf import settings
+from mistralai import Mistral
+from mistralai.utils.retries import RetryConfig
+
+
+class ConnectionCounter:
+    """Requests one provider client sent and the connections it opened"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def add(self, requests=0, connections=0):
+        with self._lock:
+            self.requests += requests
+            self.connections += connections
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections,
+                # Above 1 when requests reuse pooled connections
+                "requests_per_connection": (
+                    round(self.requests / self.connections, 2)
+                    if self.connections
+                    else None
+                ),
+            }
+
+
+class CountingTransport(httpx.BaseTransport):
+    """httpx transport that counts requests and new connections.
+
+    New connections are seen through httpcore's "trace" request extension.
+    """
+
+    def __init__(self, transport, counter):
+        self.transport = transport
+        self.counter = counter
+
+    def _trace(self, name, info):
+        if name == "connection.connect_tcp.complete":
+            self.counter.add(connections=1)
+
+    def handle_request(self, request):
+        self.counter.add(requests=1)
+        request.extensions["trace"] = self._trace
+        return self.transport.handle_request(request)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncCountingTransport(httpx.AsyncBaseTransport):
+    """CountingTransport for httpx.AsyncClient"""
+
+    def __init__(self, transport, counter):
+        self.transport = transport
+        self.counter = counter
+
+    async def _trace(self, name, info):
+        if name == "connection.connect_tcp.complete":
+            self.counter.add(connections=1)
+
+    async def handle_async_request(self, request):
+        self.counter.add(requests=1)
+        request.extensions["trace"] = self._trace
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class Urllib3ConnectionLog(logging.Filter):
+    """Counts the new connections urllib3 logs for botocore clients.
+
+    botocore has no connection events, but urllib3 logs "Starting new
+    HTTP(S) connection" at debug level from the thread sending the request.
+    Between a client's before-send and needs-retry events those records
+    are counted for that client. Records below the level that was in
+    effect before are dropped after counting, so logging output does not
+    change.
+    """
+
+    def __init__(self, logger):
+        super().__init__()
+        self.level = logger.getEffectiveLevel()
+        self.sending = threading.local()
+
+    def filter(self, record):
+        counter = getattr(self.sending, "counter", None)
+        if counter is not None and str(record.msg).startswith("Starting new HTTP"):
+            counter.add(connections=1)
+        return record.levelno >= self.level
+
+    def watch(self, client, counter):
+        def before_send(**kwargs):
+            counter.add(requests=1)
+            self.sending.counter = counter
+
+        def after_send(**kwargs):
+            self.sending.counter = None
+
+        client.meta.events.register("before-send", before_send)
+        client.meta.events.register("needs-retry", after_send)
+
+
+_urllib3_connection_log = None
+_urllib3_connection_log_lock = threading.Lock()
+
+
+def urllib3_connection_log():
+    global _urllib3_connection_log
+    with _urllib3_connection_log_lock:
+        if _urllib3_connection_log is None:
+            logger = logging.getLogger("urllib3.connectionpool")
+            _urllib3_connection_log = Urllib3ConnectionLog(logger)
+            logger.addFilter(_urllib3_connection_log)
+            logger.setLevel(logging.DEBUG)
+        return _urllib3_connection_log
+
+
+class ProviderClients:
+    """Process-wide registry of provider SDK clients.
+
+    Each client is created lazily on first use and then shared by every
+    request and worker thread in the process, so credential resolution,
+    endpoint loading and TLS handshakes happen once instead of per image.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._aws_session = None
+        self._textract = None
+        self._s3 = None
+        self._mistral = None
+        self._mistral_http = None
+        # Event loop -> Mistral client; an entry goes with its loop
+        self._mistral_async = weakref.WeakKeyDictionary()
+        self.uses = {"textract": 0, "mistral": 0}
+        # Provider -> requests sent and connections opened by its clients
+        self.counters = {
+            "textract": ConnectionCounter(),
+            "mistral": ConnectionCounter(),
+        }
+
+    def _aws_client(self, service, endpoint_url=None, counter=None):
+        # A dedicated session: the default boto3 session is not thread-safe
+        if self._aws_session is None:
+            self._aws_session = boto3.session.Session(
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                region_name=settings.AWS_REGION,
+            )
+        client = self._aws_session.client(
+            service,
+            endpoint_url=endpoint_url,
+            config=Config(
+                max_pool_connections=settings.PROVIDER_MAX_POOL_CONNECTIONS,
+                tcp_keepalive=True,
+                connect_timeout=settings.PROVIDER_CONNECT_TIMEOUT,
+                read_timeout=settings.PROVIDER_READ_TIMEOUT,
+                # Retries happen in throttling.call_with_backoff only; two
+                # layers would multiply attempts and add up their delays
+                retries={"mode": "standard", "total_max_attempts": 1},
+            ),
+        )
+        if counter is not None:
+            urllib3_connection_log().watch(client, counter)
+        return client
+
+    def textract(self):
+        with self._lock:
+            if self._textract is None:
+                self._textract = self._aws_client(
+                    "textract",
+                    settings.TEXTRACT_ENDPOINT_URL or None,
+                    self.counters["textract"],
+                )
+            self.uses["textract"] += 1
+            return self._textract
+
+    def s3(self):
+        """S3 client used to stage documents for asynchronous Textract jobs"""
+        with self._lock:
+            if self._s3 is None:
+                self._s3 = self._aws_client("s3")
+            return self._s3
+
+    def _http_limits(self, max_connections):
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=settings.PROVIDER_KEEPALIVE_EXPIRY,
+        )
+
+    def _mistral_timeout(self):
+        return httpx.Timeout(
+            settings.PROVIDER_READ_TIMEOUT, connect=settings.PROVIDER_CONNECT_TIMEOUT
+        )
+
+    def _mistral_client(self, async_client=None):
+        # Called with the lock held
+        if self._mistral_http is None:
+            self._mistral_http = httpx.Client(
+                # A custom transport ignores the client's limits
+                transport=CountingTransport(
+                    httpx.HTTPTransport(
+                        limits=self._http_limits(
+                            settings.PROVIDER_MAX_POOL_CONNECTIONS
+                        )
+                    ),
+                    self.counters["mistral"],
+                ),
+                timeout=self._mistral_timeout(),
+            )
+        return Mistral(
+            api_key=settings.MISTRAL_API_KEY,
+            server_url=settings.MISTRAL_SERVER_URL or None,
+            client=self._mistral_http,
+            async_client=async_client,
+            # No SDK retries either, see _aws_client()
+            retry_config=RetryConfig("none", None, False),
+        )
+
+    def mistral(self):
+        with self._lock:
+            if self._mistral is None:
+                self._mistral = self._mistral_client()
+            self.uses["mistral"] += 1
+            return self._mistral
+
+    def amistral(self):
+        """mistral() for coroutines, with an async client for the running loop.
+
+        httpx.AsyncClient connections belong to the event loop that opened
+        them, so each loop (the async job runner's, an ASGI server's, a
+        test's asyncio.run()) gets its own client. The synchronous client
+        is shared.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._mistral_async.get(loop)
+            if client is None:
+                # It may keep every call the provider limits allow in flight
+                limits = self._http_limits(
+                    max(
+                        settings.PROVIDER_MAX_POOL_CONNECTIONS,
+                        settings.EXTRACTION_PROVIDER_LIMITS.get("mistral", {}).get(
+                            "concurrency", 0
+                        ),
+                    )
+                )
+                async_http = httpx.AsyncClient(
+                    transport=AsyncCountingTransport(
+                        httpx.AsyncHTTPTransport(limits=limits),
+                        self.counters["mistral"],
+                    ),
+                    timeout=self._mistral_timeout(),
+                )
+                client = self._mistral_async[loop] = self._mistral_client(async_http)
+            self.uses["mistral"] += 1
+            return client
+
+    def stats(self):
+        """What the registry tracks of each provider client.
+
+        Requests sent and connections opened are counted through public
+        hooks (transport wrappers, SDK events, the urllib3 log), not pool
+        internals, which are private and change between releases.
+        """
+        with self._lock:
+            created = {
+                "textract": self._textract is not None,
+                "mistral": self._mistral is not None or bool(self._mistral_async),
+            }
+            return {
+                provider: {
+                    "created": created[provider],
+                    "uses": uses,
+                    **self.counters[provider].stats(),
+                    "max_pool_connections": settings.PROVIDER_MAX_POOL_CONNECTIONS,
+                }
+                for provider, uses in self.uses.items()
+            }
+
+    def reset(self):
+        """Drop the cached clients, e.g. after credentials change"""
+        with self._lock:
+            if self._mistral_http is not None:
+                self._mistral_http.close()
+            self._aws_session = None
+            self._textract = None
+            self._s3 = None
+            self._mistral = None
+            self._mistral_http = None
+            # Closing them needs their event loops; idle connections close
+            # on garbage collection
+            self._mistral_async = weakref.WeakKeyDictionary()
+            self.uses = {"textract": 0, "mistral": 0}
+            self.counters = {
+                "textract": ConnectionCounter(),
+                "mistral": ConnectionCounter(),
+            }
+
+
+provider_clients = ProviderClients()
@@ -0,0 +1,168 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from . import storage, telemetry
+from .models import WaybillImage
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "image/jpeg"
+# Originals Pillow can render; PDFs get no derivatives
+SOURCE_EXTENSIONS = {
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".tif",
+    ".tiff",
+    ".bmp",
+    ".gif",
+    ".webp",
+}
+# Errors of an original that cannot be decoded
+RENDER_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+
+def storage_name(content_hash, kind):
+    """Where a derivative is stored; the name changes with its size"""
+    long_edge = settings.IMAGE_DERIVATIVES[kind]
+    return f"derivatives/{content_hash[:2]}/{content_hash}/{kind}-{long_edge}.jpg"
+
+
+def has_derivatives(waybill_image):
+    extension = os.path.splitext(waybill_image.image.name)[1].lower()
+    return bool(waybill_image.content_hash) and extension in SOURCE_EXTENSIONS
+
+
+def url(waybill_image, kind, request=None):
+    """The URL of a derivative, or None if the image has none (yet).
+
+    URLs are built from the content hash of the original and the size, so a
+    URL always names the same bytes and may be cached for good. Direct
+    uploads have no hash until their job took it.
+    """
+    if not has_derivatives(waybill_image):
+        return None
+    path = reverse(
+        "image-derivative",
+        args=[waybill_image.content_hash, kind, settings.IMAGE_DERIVATIVES[kind]],
+    )
+    return request.build_absolute_uri(path) if request is not None else path
+
+
+def encode(image, long_edge):
+    """JPEG bytes of an image scaled to fit long_edge; never enlarged"""
+    image = image.copy()
+    # reducing_gap shrinks by whole factors first, which is much faster
+    image.thumbnail((long_edge, long_edge), Image.LANCZOS, reducing_gap=3.0)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(
+        output,
+        "JPEG",
+        quality=settings.DERIVATIVE_JPEG_QUALITY,
+        optimize=True,
+        progressive=True,
+    )
+    return image, output.getvalue()
+
+
+def generate(waybill_image):
+    """Render and store every derivative of a waybill image.
+
+    The original is decoded once, from the largest derivative down, each
+    rendered from the one before. JPEG originals are decoded straight at
+    the smallest scale (1/2 to 1/8) that still covers the largest size.
+    Returns the bytes by kind.
+    """
+    sizes = sorted(settings.IMAGE_DERIVATIVES.items(), key=lambda item: -item[1])
+    original = waybill_image.image
+    rendered = {}
+    with telemetry.span("derivative"), original.storage.open(
+        original.name, "rb"
+    ) as source, Image.open(source) as image:
+        largest = sizes[0][1]
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        for kind, long_edge in sizes:
+            image, data = encode(image, long_edge)
+            storage.save_bytes(data, storage_name(waybill_image.content_hash, kind))
+            rendered[kind] = data
+    return rendered
+
+
+def get(content_hash, kind):
+    """The bytes of a derivative, rendered now if they are not stored yet.
+
+    None when no image has that content or it cannot be decoded.
+    """
+    try:
+        with default_storage.open(storage_name(content_hash, kind), "rb") as stored:
+            return stored.read()
+    except FileNotFoundError:
+        pass
+
+    # Duplicate uploads share their derivatives; any copy will do
+    for waybill_image in WaybillImage.objects.filter(
+        content_hash=content_hash
+    ).order_by("id")[:1]:
+        if not has_derivatives(waybill_image):
+            return None
+        try:
+            return generate(waybill_image)[kind]
+        except RENDER_ERRORS as e:
+            logger.info("No derivatives for waybill %s: %s", waybill_image.id, e)
+    return None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _generate_in_background(waybill_ids):
+    try:
+        waybill_images = WaybillImage.objects.filter(id__in=waybill_ids).order_by("id")
+        done = set()
+        for waybill_image in waybill_images:
+            content_hash = waybill_image.content_hash
+            if content_hash in done or not has_derivatives(waybill_image):
+                continue
+            done.add(content_hash)
+            # Re-uploads were rendered before
+            if all(
+                default_storage.exists(storage_name(content_hash, kind))
+                for kind in settings.IMAGE_DERIVATIVES
+            ):
+                continue
+            try:
+                generate(waybill_image)
+            except RENDER_ERRORS as e:
+                logger.info("No derivatives for waybill %s: %s", waybill_image.id, e)
+    except Exception:
+        logger.exception("Derivative generation failed")
+    finally:
+        connection.close()
+
+
+def schedule(waybill_ids):
+    """Render the derivatives of new waybill images on a background thread"""
+    global _executor
+    if settings.DERIVATIVE_WORKERS <= 0:
+        return
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DERIVATIVE_WORKERS,
+                thread_name_prefix="derivatives",
+            )
+    _executor.submit(_generate_in_background, list(waybill_ids))
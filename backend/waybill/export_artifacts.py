@@ -0,0 +1,267 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import storage, telemetry
+from .exports import write_workbook
+from .models import ExportJob, ProcessingStatus, WaybillImage
+
+logger = logging.getLogger(__name__)
+
+# Largest id list a job's waybills are selected with in one IN clause
+IN_LIST_LIMIT = 900
+
+
+def artifact_name(key):
+    """Storage name of the artifact for an export key"""
+    return f"exports/{key}.xlsx"
+
+
+def open_artifact(job):
+    return default_storage.open(job.file, "rb")
+
+
+def export_key(waybills):
+    """Hash of the sorted waybill ids plus their latest extraction time.
+
+    Returns the key and the ids it covers. Re-extracting any waybill bumps
+    extracted_at, so a changed waybill set or newer data gives a new key.
+    """
+    rows = waybills.order_by("id").values_list("id", "extracteddata__extracted_at")
+    ids = []
+    latest = None
+    for waybill_id, extracted_at in rows:
+        ids.append(waybill_id)
+        if extracted_at and (latest is None or extracted_at > latest):
+            latest = extracted_at
+
+    fingerprint = f"{','.join(map(str, ids))}|{latest.isoformat() if latest else ''}"
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest(), ids
+
+
+def get_or_create_job(waybills):
+    """The export job for a waybill queryset, created if it does not exist"""
+    key, ids = export_key(waybills)
+    job = ExportJob.objects.filter(key=key).first()
+    if job is not None:
+        # An artifact whose file went missing is rebuilt from scratch
+        if job.status != ProcessingStatus.DONE or default_storage.exists(job.file):
+            return job
+        job.delete()
+
+    try:
+        with transaction.atomic():
+            job = ExportJob.objects.create(
+                key=key,
+                waybill_ids=ids,
+                first_waybill_id=ids[0] if ids else None,
+                last_waybill_id=ids[-1] if ids else None,
+            )
+    except IntegrityError:
+        # Another request created the same export in the meantime
+        job = ExportJob.objects.get(key=key)
+    return job
+
+
+def job_waybills(job):
+    """The waybills of a job, in id order, with what the export reads"""
+    ids = job.waybill_ids
+    waybills = WaybillImage.objects.select_related(
+        "extraction_model", "extracteddata"
+    ).order_by("id")
+    if len(ids) <= IN_LIST_LIMIT:
+        return waybills.filter(id__in=ids).iterator(
+            chunk_size=settings.EXPORT_CHUNK_SIZE
+        )
+
+    # Too many for one IN list: read the id range, skipping ids not exported
+    wanted = set(ids)
+    return (
+        waybill
+        for waybill in waybills.filter(id__range=(ids[0], ids[-1])).iterator(
+            chunk_size=settings.EXPORT_CHUNK_SIZE
+        )
+        if waybill.id in wanted
+    )
+
+
+def build(job):
+    """Generate the artifact for a queued job; no-op if someone else claimed it"""
+    if job.status == ProcessingStatus.FAILED:
+        job.move_to(ProcessingStatus.QUEUED, error="")
+    if not job.move_to(ProcessingStatus.RUNNING, started_at=timezone.now()):
+        return job
+
+    # Written to a scratch file first, so readers never see a partial file
+    name = artifact_name(job.key)
+    temp_path = storage.scratch_path(name)
+
+    try:
+        with telemetry.span("export"), open(temp_path, "wb") as output:
+            write_workbook(job_waybills(job), output)
+        size = os.path.getsize(temp_path)
+        name = storage.save_file(temp_path, name)
+    except Exception as e:
+        logger.exception("Export %s failed", job.key[:12])
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        job.move_to(
+            ProcessingStatus.FAILED, error=str(e), finished_at=timezone.now()
+        )
+        return job
+
+    finished = job.move_to(
+        ProcessingStatus.DONE,
+        file=name,
+        size=size,
+        finished_at=timezone.now(),
+    )
+    if not finished:
+        # Invalidated or collected while building: no row will own the file
+        logger.info("Export %s was dropped while building", job.key[:12])
+        if not ExportJob.objects.filter(file=name).exists():
+            default_storage.delete(name)
+        return job
+    collect_garbage()
+    return job
+
+
+def build_cutoff():
+    """Running builds started before this died with their process"""
+    return timezone.now() - timedelta(seconds=settings.EXPORT_BUILD_TIMEOUT)
+
+
+def requeue_if_stale(job):
+    """Queue a job again whose build has run for longer than the timeout"""
+    if job.status != ProcessingStatus.RUNNING:
+        return job
+    if (job.started_at or job.created_at) < build_cutoff():
+        logger.warning("Export %s: build timed out, queueing it again", job.key[:12])
+        job.move_to(ProcessingStatus.QUEUED, started_at=None)
+    return job
+
+
+def get_artifact(waybills):
+    """The export job for the waybills, with its artifact built or on the way.
+
+    With EXPORT_WORKERS the build runs in the background and the job is
+    returned still queued or running, so no request waits for it. A failed
+    job is returned once and deleted, so the next download tries again.
+    """
+    job = requeue_if_stale(get_or_create_job(waybills))
+    if job.status == ProcessingStatus.QUEUED:
+        if settings.EXPORT_WORKERS > 0:
+            schedule_build(job)
+        else:
+            job = build(job)
+    if job.status == ProcessingStatus.FAILED:
+        ExportJob.objects.filter(pk=job.pk).delete()
+    return job
+
+
+def delete_files(names):
+    """Delete artifact files once the current transaction commits.
+
+    Their jobs are deleted in that transaction; a rollback brings the jobs
+    back, so their files must still be there.
+    """
+    names = [name for name in names if name]
+
+    def delete():
+        for name in names:
+            default_storage.delete(name)
+
+    if names:
+        transaction.on_commit(delete)
+
+
+def invalidate(waybill_ids):
+    """Delete every export artifact that includes any of the given waybills"""
+    waybill_ids = set(waybill_ids)
+    if not waybill_ids:
+        return 0
+    candidates = ExportJob.objects.filter(
+        first_waybill_id__lte=max(waybill_ids),
+        last_waybill_id__gte=min(waybill_ids),
+    ).only("file", "waybill_ids")
+    stale = [job for job in candidates if waybill_ids.intersection(job.waybill_ids)]
+    if not stale:
+        return 0
+
+    ExportJob.objects.filter(pk__in=[job.pk for job in stale]).delete()
+    delete_files(job.file for job in stale)
+    return len(stale)
+
+
+def collect_garbage():
+    """Delete artifacts older than EXPORT_ARTIFACT_TTL.
+
+    Every upload or re-extraction gives exports a new key, so old artifacts
+    are mostly unreachable. One that is still wanted gets rebuilt.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.EXPORT_ARTIFACT_TTL)
+    # Builds still within their timeout are left alone
+    expired = list(
+        ExportJob.objects.filter(created_at__lt=cutoff)
+        .exclude(Q(status=ProcessingStatus.RUNNING, started_at__gte=build_cutoff()))
+        .values_list("pk", "file")
+    )
+    if not expired:
+        return 0
+
+    ExportJob.objects.filter(pk__in=[pk for pk, _ in expired]).delete()
+    delete_files(name for _, name in expired)
+    logger.info("Deleted %s expired export artifacts", len(expired))
+    return len(expired)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _build_in_background(get_job, request_id):
+    try:
+        with telemetry.request_id_context(request_id):
+            build(get_job())
+    except Exception:
+        logger.exception("Background export failed")
+    finally:
+        connection.close()
+
+
+def _submit(get_job):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.EXPORT_WORKERS, thread_name_prefix="export"
+            )
+    # Log records of the build keep the id of the request that led to it
+    _executor.submit(_build_in_background, get_job, telemetry.get_request_id())
+
+
+def schedule(waybill_ids):
+    """Pre-generate the export for a set of waybills on a background thread"""
+    if settings.EXPORT_WORKERS <= 0:
+        return
+    waybill_ids = list(waybill_ids)
+    _submit(
+        lambda: get_or_create_job(WaybillImage.objects.filter(id__in=waybill_ids))
+    )
+
+
+def schedule_build(job):
+    """Build a queued job on a background thread once it is committed.
+
+    Repeat calls for the same job are harmless: only one build claims it.
+    """
+    transaction.on_commit(lambda: _submit(lambda: ExportJob.objects.get(pk=job.pk)))
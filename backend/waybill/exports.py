@@ -0,0 +1,374 @@
+import csv
+import io
+import json
+import tempfile
+from datetime import datetime
+
+from openpyxl import Workbook
+
+from .models import ExtractedData
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Stable column layout shared by the CSV, NDJSON and Parquet exports. Every
+# extracted value becomes one row; columns that do not apply are left empty.
+EXPORT_COLUMNS = [
+    "waybill_id",
+    "uploaded_at",
+    "extraction_model",
+    "status",
+    "source",
+    "page_index",
+    "table_index",
+    "row",
+    "column",
+    "key",
+    "value",
+    "confidence",
+]
+
+# Rows written per chunk (CSV/NDJSON) or per row group (Parquet)
+ROWS_PER_CHUNK = 1000
+
+
+class StreamingWorkbook(Workbook):
+    """Write-only workbook that keeps sheet titles unique in constant time.
+
+    openpyxl compares every new title with all existing sheet names, which
+    makes exports with thousands of per-waybill sheets quadratic. Titles are
+    de-duplicated here instead, using the same numeric suffixes as openpyxl.
+    """
+
+    def __init__(self):
+        super().__init__(write_only=True)
+        self._used_titles = set()
+        self._title_suffixes = {}
+        self._creating_sheet = False
+
+    @property
+    def sheetnames(self):
+        # The title passed to a new sheet is already unique; hide the
+        # existing names so openpyxl skips its own linear duplicate check
+        if self._creating_sheet:
+            return []
+        return super().sheetnames
+
+    def _unique_title(self, title):
+        candidate = title
+        while candidate.lower() in self._used_titles:
+            suffix = self._title_suffixes.get(title, 0) + 1
+            self._title_suffixes[title] = suffix
+            candidate = f"{title}{suffix}"
+        self._used_titles.add(candidate.lower())
+        return candidate
+
+    def create_sheet(self, title=None, index=None):
+        self._creating_sheet = True
+        try:
+            return super().create_sheet(self._unique_title(title), index)
+        finally:
+            self._creating_sheet = False
+
+
+def export_filename(extension="xlsx"):
+    return f"waybills_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def get_extracted_data(waybill):
+    """The extracted data of a waybill, or None when it has not been extracted"""
+    try:
+        return waybill.extracteddata.extracted_data
+    except ExtractedData.DoesNotExist:
+        return None
+
+
+def _strip_quote_prefix(value):
+    # Remove single quote prefix if present
+    if isinstance(value, str) and value.startswith("'"):
+        return value[1:]
+    return value
+
+
+def write_textract_sheets(wb, extracted_data):
+    """Write one sheet per Textract table plus a forms and raw text sheet"""
+    # Create sheets for each table
+    for table_idx, table in enumerate(extracted_data["tables"], 1):
+        table_sheet = wb.create_sheet(title=f"Table_{table_idx}")
+
+        # Write table data
+        for row_data in table["rows"]:
+            table_sheet.append([_strip_quote_prefix(value) for value in row_data])
+
+        # Add empty row and confidence scores header
+        table_sheet.append([])
+        table_sheet.append(["Confidence Scores % (Table Cell)"])
+
+        # Write confidence scores
+        for confidence_row_data in table["confidence_scores"]:
+            table_sheet.append(
+                [f"{confidence:.8f}" for confidence in confidence_row_data]
+            )
+
+        # Write-only sheets hold an open temp file until they are closed
+        table_sheet.close()
+
+    # Create info sheet for forms and raw text
+    info_sheet = wb.create_sheet(title="Forms_and_Text")
+
+    # Add form fields
+    info_sheet.append(["Form Fields"])
+    info_sheet.append(["Field", "Value", "Confidence"])
+    for key, data in extracted_data.get("forms", {}).items():
+        info_sheet.append([key, data["value"], f"{data['confidence']:.8f}"])
+
+    # Add raw text
+    info_sheet.append([])
+    info_sheet.append([])
+    info_sheet.append(["Raw Text"])
+    info_sheet.append([extracted_data.get("raw_text", "")])
+    info_sheet.close()
+
+
+def write_other_sheet(wb, waybill, extracted_data):
+    """Write a field/value sheet for non-Textract data"""
+    other_sheet = wb.create_sheet(title=f"Waybill_{waybill.id}")
+    other_sheet.append(["Field", "Value"])
+
+    if isinstance(extracted_data, dict):
+        for key, value in extracted_data.items():
+            other_sheet.append([key, str(value)])
+    else:
+        other_sheet.append(["Raw Data", str(extracted_data)])
+    other_sheet.close()
+
+
+def write_workbook(waybills, output):
+    """Stream the Excel export for the given waybills into a file object.
+
+    Uses an openpyxl write-only workbook: every sheet is written row by row
+    to its own temporary file and the waybills are iterated once, so memory
+    use does not grow with the number of waybills exported.
+    """
+    wb = StreamingWorkbook()
+    summary_sheet = wb.create_sheet(title="Summary")
+
+    # Add a header to the summary sheet
+    summary_sheet.append(["Waybill Extraction Summary"])
+    summary_sheet.append(
+        ["Generated on", datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
+    )
+    summary_sheet.append([])
+
+    exported = 0
+    for waybill in waybills:
+        if exported == 0:
+            # Add summary headers
+            summary_sheet.append(["Waybills"])
+            summary_sheet.append(
+                ["ID", "Upload Date", "Extraction Model", "Processed"]
+            )
+
+        # Add summary data
+        summary_sheet.append(
+            [
+                waybill.id,
+                waybill.uploaded_at.strftime("%Y-%m-%d %H:%M:%S"),
+                waybill.extraction_model.name if waybill.extraction_model else "N/A",
+                "Yes" if waybill.processed else "No",
+            ]
+        )
+
+        extracted_data = get_extracted_data(waybill)
+        if extracted_data is None:
+            error_sheet = wb.create_sheet(title=f"Waybill_{waybill.id}")
+            error_sheet.append(["No extracted data available"])
+            error_sheet.close()
+        elif isinstance(extracted_data, dict) and "tables" in extracted_data:
+            # Handle AWS Textract data
+            write_textract_sheets(wb, extracted_data)
+        else:
+            # Handle non-Textract data
+            write_other_sheet(wb, waybill, extracted_data)
+
+        exported += 1
+
+    if exported == 0:
+        summary_sheet.append(["No waybills found"])
+
+    wb.save(output)
+    return exported
+
+
+def spool_workbook(waybills):
+    """Write the export to an anonymous temporary file, rewound for reading"""
+    spool = tempfile.TemporaryFile(suffix=".xlsx")
+    write_workbook(waybills, spool)
+    spool.seek(0)
+    return spool
+
+
+def _flatten_dict(data, prefix=""):
+    """Dotted key/value pairs for a nested dict"""
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            yield from _flatten_dict(value, f"{path}.")
+        else:
+            yield path, value if isinstance(value, str) else json.dumps(value)
+
+
+def flatten_extracted_data(extracted_data):
+    """Source, position, key, value and confidence of every extracted value.
+
+    page_index is 1-based for every provider, like the pages of the field
+    index; Mistral numbers its pages from 0.
+    """
+    if not isinstance(extracted_data, dict):
+        yield {"source": "raw_data", "value": str(extracted_data)}
+        return
+
+    if "tables" in extracted_data:
+        # AWS Textract
+        for table_idx, table in enumerate(extracted_data["tables"], 1):
+            confidence_scores = table.get("confidence_scores", [])
+            for row_idx, row_data in enumerate(table["rows"], 1):
+                for col_idx, value in enumerate(row_data, 1):
+                    try:
+                        confidence = confidence_scores[row_idx - 1][col_idx - 1]
+                    except IndexError:
+                        confidence = None
+                    yield {
+                        "source": "table",
+                        "page_index": table.get("page", 1),
+                        "table_index": table_idx,
+                        "row": row_idx,
+                        "column": col_idx,
+                        "value": _strip_quote_prefix(value),
+                        "confidence": confidence,
+                    }
+        for key, data in extracted_data.get("forms", {}).items():
+            yield {
+                "source": "form",
+                "page_index": data.get("page", 1),
+                "key": key,
+                "value": data["value"],
+                "confidence": data["confidence"],
+            }
+        if extracted_data.get("raw_text"):
+            yield {"source": "raw_text", "value": extracted_data["raw_text"]}
+
+    elif "pages" in extracted_data:
+        # Mistral OCR
+        for page in extracted_data["pages"]:
+            yield {
+                "source": "page",
+                "page_index": page.get("index", 0) + 1,
+                "value": page.get("markdown", ""),
+            }
+        analysis = extracted_data.get("extracted_text", {}).get("analysis", {})
+        for key, value in _flatten_dict(analysis):
+            yield {"source": "analysis", "key": key, "value": value}
+
+    else:
+        for key, value in _flatten_dict(extracted_data):
+            yield {"source": "field", "key": key, "value": value}
+
+
+def flatten_waybill(waybill):
+    """Rows of the stable export schema for one waybill"""
+    extracted_data = get_extracted_data(waybill)
+    if extracted_data is None:
+        return
+
+    base = {column: None for column in EXPORT_COLUMNS}
+    base.update(
+        waybill_id=waybill.id,
+        uploaded_at=waybill.uploaded_at.isoformat(),
+        extraction_model=(
+            waybill.extraction_model.name if waybill.extraction_model else None
+        ),
+        status=waybill.status,
+    )
+    for values in flatten_extracted_data(extracted_data):
+        yield {**base, **values}
+
+
+def iter_export_rows(waybills):
+    for waybill in waybills:
+        yield from flatten_waybill(waybill)
+
+
+def stream_csv(waybills):
+    """CSV text in chunks of ROWS_PER_CHUNK rows, header first"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+
+    for count, row in enumerate(iter_export_rows(waybills), 1):
+        writer.writerow(row)
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(waybills):
+    """One JSON object per line, in chunks of ROWS_PER_CHUNK rows"""
+    lines = []
+    for row in iter_export_rows(waybills):
+        lines.append(json.dumps(row))
+        if len(lines) == ROWS_PER_CHUNK:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def parquet_schema():
+    return pyarrow.schema(
+        [
+            ("waybill_id", pyarrow.int64()),
+            ("uploaded_at", pyarrow.string()),
+            ("extraction_model", pyarrow.string()),
+            ("status", pyarrow.string()),
+            ("source", pyarrow.string()),
+            ("page_index", pyarrow.int32()),
+            ("table_index", pyarrow.int32()),
+            ("row", pyarrow.int32()),
+            ("column", pyarrow.int32()),
+            ("key", pyarrow.string()),
+            ("value", pyarrow.string()),
+            ("confidence", pyarrow.float64()),
+        ]
+    )
+
+
+def write_parquet(waybills, output):
+    """Write the export as Parquet, one row group per ROWS_PER_CHUNK rows"""
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires pyarrow to be installed")
+
+    schema = parquet_schema()
+    with pyarrow.parquet.ParquetWriter(output, schema) as writer:
+        rows = []
+        for row in iter_export_rows(waybills):
+            rows.append(row)
+            if len(rows) == ROWS_PER_CHUNK:
+                writer.write_table(pyarrow.Table.from_pylist(rows, schema=schema))
+                rows = []
+        if rows:
+            writer.write_table(pyarrow.Table.from_pylist(rows, schema=schema))
+
+
+def spool_parquet(waybills):
+    spool = tempfile.TemporaryFile(suffix=".parquet")
+    write_parquet(waybills, spool)
+    spool.seek(0)
+    return spool
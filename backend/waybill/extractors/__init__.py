@@ -0,0 +1,29 @@
+"""Extraction engines and the registry that maps ExtractionModel.engine to them"""
+
+from .base import BaseExtractor, Document, ExtractionResult, PayloadTooLarge
+from .cascade import CascadeExtractor
+from .registry import UnknownEngine, engines, for_model, for_slug, get, register
+
+# Importing the engines registers them
+from .fake import FakeExtractor
+from .mistral import MistralExtractor
+from .tesseract import TesseractExtractor
+from .textract import TextractExtractor
+
+__all__ = [
+    "BaseExtractor",
+    "CascadeExtractor",
+    "Document",
+    "ExtractionResult",
+    "FakeExtractor",
+    "MistralExtractor",
+    "PayloadTooLarge",
+    "TesseractExtractor",
+    "TextractExtractor",
+    "UnknownEngine",
+    "engines",
+    "for_model",
+    "for_slug",
+    "get",
+    "register",
+]
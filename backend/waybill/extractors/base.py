@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.files.storage import default_storage
+
+from .. import storage as storage_utils
+from .. import telemetry
+from ..throttling import acall_provider, call_provider
+
+logger = logging.getLogger(__name__)
+
+
+class Document:
+    """Input for an extractor: a stored file or bytes that were never stored.
+
+    Stored uploads are passed by path so engines that preprocess on the
+    process pool or upload to S3 never need the whole file in memory.
+    Files in remote storage are passed by name and only downloaded when an
+    engine needs their bytes.
+    """
+
+    def __init__(
+        self,
+        data=None,
+        path=None,
+        name=None,
+        content_type=None,
+        storage=None,
+        storage_name=None,
+    ):
+        if data is None and path is None and storage_name is None:
+            raise ValueError("A document needs data, a path or a stored file")
+        self._data = data
+        self.path = path
+        self.storage = storage
+        self.storage_name = storage_name
+        self.name = name or os.path.basename(path or storage_name or "document")
+        self.content_type = (
+            content_type
+            or mimetypes.guess_type(self.name)[0]
+            or "application/octet-stream"
+        )
+
+    @classmethod
+    def from_path(cls, path):
+        return cls(path=path)
+
+    @classmethod
+    def from_storage(cls, name, storage=default_storage):
+        """A document for a stored file, by path when the storage is local"""
+        if storage_utils.is_local(storage):
+            return cls(path=storage.path(name))
+        return cls(storage=storage, storage_name=name)
+
+    @property
+    def extension(self):
+        return os.path.splitext(self.name)[1].lower()
+
+    @property
+    def size(self):
+        if self._data is not None:
+            return len(self._data)
+        if self.path is None:
+            return self.storage.size(self.storage_name)
+        return os.path.getsize(self.path)
+
+    @property
+    def s3_object(self):
+        """Where AWS services can read the document in place, if anywhere"""
+        if self.storage_name is None:
+            return None
+        return storage_utils.s3_object(self.storage_name, self.storage)
+
+    def read(self):
+        if self._data is not None:
+            return self._data
+        if self.path is None:
+            with self.storage.open(self.storage_name, "rb") as source:
+                return source.read()
+        with open(self.path, "rb") as source:
+            return source.read()
+
+    @contextmanager
+    def local_path(self):
+        """A filesystem path for the document, spilling it to a temp file"""
+        if self.path is not None:
+            yield self.path
+            return
+
+        with tempfile.NamedTemporaryFile(suffix=self.extension) as spill:
+            if self._data is not None:
+                spill.write(self._data)
+                spill.flush()
+            else:
+                storage_utils.download(self.storage_name, spill, self.storage)
+            yield spill.name
+
+
+class ExtractionResult:
+    """Output of one extraction, in the shape stored on ExtractedData.
+
+    Engines record the pages they processed and the provider calls they
+    made while running, so cost can be tracked per extraction.
+    """
+
+    def __init__(self, engine, data=None, demo=False):
+        self.engine = engine
+        self.data = data
+        self.demo = demo
+        # Provider output before parsing, archived so data can be rebuilt
+        self.raw = None
+        self.pages = 1
+        self.calls = 0
+        self.seconds = 0.0
+        # List price of the pages processed, in USD
+        self.cost = 0.0
+        # Per-stage metrics; one entry unless a cascade escalated pages
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def add_call(self):
+        # Pages may be fanned out over several threads
+        with self._lock:
+            self.calls += 1
+
+    def stage_metrics(self, stage=1, escalated_pages=0):
+        return {
+            "stage": stage,
+            "engine": self.engine,
+            "pages": self.pages,
+            "escalated_pages": escalated_pages,
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "cost": self.cost,
+        }
+
+    def __repr__(self):
+        return f"<ExtractionResult {self.engine} pages={self.pages} calls={self.calls}>"
+
+
+class PayloadTooLarge(ValueError):
+    """A page is still over the engine's payload limit after preprocessing"""
+
+
+class BaseExtractor:
+    """Provider interface: subclasses implement fetch() and parse() and
+    declare their limits.
+
+    The class attributes describe what schedulers may plan around: how many
+    calls may be in flight and how fast they may start (the defaults for
+    EXTRACTION_PROVIDER_LIMITS), the largest payload one call accepts and
+    how many pages a single call can cover.
+    """
+
+    slug = ""
+    label = ""
+    # Max in-flight calls and calls started per second (None: unlimited)
+    concurrency = 1
+    rate = None
+    # Largest request body a single call accepts, in bytes (None: no limit)
+    max_payload_bytes = None
+    # Pages one call can process; 1 means multi-page input is fanned out
+    max_pages_per_call = 1
+    # Whether the engine calls a paid remote API, and its list price per page
+    remote = True
+    cost_per_page = 0.0
+    # "tables" for Textract-shaped output (tables/forms with confidences and
+    # page numbers), which a cascade can inspect and merge page by page
+    output_shape = "tables"
+    # Options that change the output, folded into the OCR cache key
+    options = {}
+
+    def is_configured(self):
+        """Whether credentials and dependencies for the engine are present"""
+        return True
+
+    def configuration_error(self):
+        """Message shown when an upload targets an unconfigured engine"""
+        return f"{self.label} is not configured"
+
+    def demo_data(self):
+        """Placeholder output returned when the engine is not configured"""
+        return None
+
+    def fetch(self, document, options, result):
+        """Call the provider and return its raw, JSON-serializable output.
+
+        Provider calls go through self.call(result, func); result.pages
+        should be set when the document has more than one page.
+        """
+        raise NotImplementedError
+
+    # Engines with a native async client override this with a coroutine
+    # function of the same signature; aextract() runs the others on a thread
+    afetch = None
+
+    def parse(self, raw):
+        """Turn fetch() output into the data to store; local work only.
+
+        Archived raw output is parsed again by `manage.py reprocess`, so
+        this must not call the provider or depend on the document.
+        """
+        raise NotImplementedError
+
+    def run(self, document, options, result):
+        """Extract the document and return the data to store"""
+        result.raw = self.fetch(document, options, result)
+        with telemetry.span("parse", self.slug):
+            return self.parse(result.raw)
+
+    async def arun(self, document, options, result):
+        result.raw = await self.afetch(document, options, result)
+        with telemetry.span("parse", self.slug):
+            # Parsing is CPU work; keep it off the event loop
+            return await asyncio.to_thread(self.parse, result.raw)
+
+    def extract(self, document, options=None):
+        """Extract a Document, or raw bytes, into an ExtractionResult"""
+        if not isinstance(document, Document):
+            document = Document(data=document)
+
+        if not self.is_configured():
+            return self.demo_result()
+
+        result = ExtractionResult(self.slug)
+        start = time.perf_counter()
+        result.data = self.run(document, options or {}, result)
+        return self.finish(result, start)
+
+    async def aextract(self, document, options=None):
+        """extract() for the event loop.
+
+        Engines without afetch() (and engines overriding extract(), such as
+        the cascade) run extract() on a thread instead.
+        """
+        if self.afetch is None or type(self).extract is not BaseExtractor.extract:
+            return await asyncio.to_thread(self.extract, document, options)
+
+        if not isinstance(document, Document):
+            document = Document(data=document)
+
+        if not self.is_configured():
+            return self.demo_result()
+
+        result = ExtractionResult(self.slug)
+        start = time.perf_counter()
+        result.data = await self.arun(document, options or {}, result)
+        return self.finish(result, start)
+
+    def demo_result(self):
+        logger.warning("%s is not configured, returning demo data", self.label)
+        result = ExtractionResult(self.slug, self.demo_data(), demo=True)
+        result.stages = [result.stage_metrics()]
+        return result
+
+    def finish(self, result, start):
+        result.seconds = time.perf_counter() - start
+        result.cost = result.pages * self.cost_per_page
+        result.stages = [result.stage_metrics()]
+        return result
+
+    def call(self, result, func):
+        """Make one provider call inside the engine's limits, with backoff"""
+        result.add_call()
+        return call_provider(self.slug, func, self.concurrency, self.rate)
+
+    async def acall(self, result, func):
+        """call() for a coroutine function"""
+        result.add_call()
+        return await acall_provider(self.slug, func, self.concurrency, self.rate)
+
+    def check_payload(self, data):
+        if self.max_payload_bytes and len(data) > self.max_payload_bytes:
+            raise PayloadTooLarge(
+                f"{len(data)} byte page exceeds the {self.label} limit of "
+                f"{self.max_payload_bytes} bytes"
+            )
+
+    def capabilities(self):
+        return {
+            "engine": self.slug,
+            "label": self.label,
+            "configured": self.is_configured(),
+            "remote": self.remote,
+            "cost_per_page": self.cost_per_page,
+            "output_shape": self.output_shape,
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "max_payload_bytes": self.max_payload_bytes,
+            "max_pages_per_call": self.max_pages_per_call,
+        }
@@ -0,0 +1,257 @@
+import io
+import logging
+import os
+import time
+
+from django.conf import settings
+from PIL import Image
+
+from ..throttling import is_throttling_error, map_ordered
+from .base import BaseExtractor, Document, ExtractionResult
+
+logger = logging.getLogger(__name__)
+
+
+def page_scores(data):
+    """Lowest confidence of any non-empty table cell or form value, per page"""
+    scores = {}
+    if not isinstance(data, dict):
+        return scores
+
+    for table in data.get("tables", []):
+        page = table.get("page", 1)
+        for texts, confidences in zip(table["rows"], table["confidence_scores"]):
+            for text, confidence in zip(texts, confidences):
+                if text:
+                    scores[page] = min(scores.get(page, confidence), confidence)
+    for field in data.get("forms", {}).values():
+        page = field.get("page", 1)
+        confidence = field["confidence"]
+        scores[page] = min(scores.get(page, confidence), confidence)
+    return scores
+
+
+def low_confidence_pages(data, pages, threshold):
+    """Pages with any value below the threshold, or with nothing extracted"""
+    scores = page_scores(data)
+    return [page for page in range(1, pages + 1) if scores.get(page, -1) < threshold]
+
+
+def page_document(document, page):
+    """One page of a multi-frame image as its own single-page Document.
+
+    Returns None when the document cannot be split, e.g. a PDF.
+    """
+    try:
+        with document.local_path() as path, Image.open(path) as image:
+            image.seek(page - 1)
+            frame = image if image.mode in ("1", "L", "RGB") else image.convert("RGB")
+            output = io.BytesIO()
+            frame.save(output, "PNG")
+    except (OSError, EOFError, Image.DecompressionBombError):
+        return None
+
+    stem = os.path.splitext(document.name)[0]
+    return Document(
+        data=output.getvalue(),
+        name=f"{stem}_page{page}.png",
+        content_type="image/png",
+    )
+
+
+def merge_pages(first, escalated):
+    """First-stage data with escalated pages replaced by the second stage's"""
+    merged = {
+        **first,
+        "tables": [
+            table
+            for table in first.get("tables", [])
+            if table.get("page", 1) not in escalated
+        ],
+        "forms": {
+            key: field
+            for key, field in first.get("forms", {}).items()
+            if field.get("page", 1) not in escalated
+        },
+    }
+    raw_text = [first.get("raw_text", "")]
+    for page, data in sorted(escalated.items()):
+        # Each escalated page was extracted on its own as page 1
+        for table in data.get("tables", []):
+            merged["tables"].append({**table, "page": page})
+        for key, field in data.get("forms", {}).items():
+            if key in merged["forms"]:
+                key = f"{key} (page {page})"
+            merged["forms"][key] = {**field, "page": page}
+        raw_text.append(data.get("raw_text", ""))
+
+    merged["tables"].sort(key=lambda table: table.get("page", 1))
+    merged["raw_text"] = "\n".join(text for text in raw_text if text)
+    return merged
+
+
+class CascadeExtractor(BaseExtractor):
+    """Cheap engine first; pages it is unsure about go to a second engine.
+
+    A page is escalated when any table cell or form value on it has a
+    confidence below the threshold, or when the first engine found nothing
+    on it. Multi-page images are split so only escalated pages are sent to
+    the second engine; documents that cannot be split (PDFs) are sent
+    whole. Not registered: ExtractionModel.escalation_engine selects it.
+    """
+
+    def __init__(self, first, second, threshold):
+        self.first = first
+        self.second = second
+        self.threshold = threshold
+        self.slug = f"{first.slug}+{second.slug}"
+        self.label = f"{first.label} then {second.label}"
+        self.remote = first.remote or second.remote
+        self.output_shape = second.output_shape
+        self.max_payload_bytes = second.max_payload_bytes
+
+    @property
+    def options(self):
+        return {
+            "cascade": [
+                {"engine": engine.slug, **engine.options}
+                for engine in (self.first, self.second)
+            ],
+            "threshold": self.threshold,
+        }
+
+    def is_configured(self):
+        return self.first.is_configured() and self.second.is_configured()
+
+    def configuration_error(self):
+        for engine in (self.first, self.second):
+            if not engine.is_configured():
+                return engine.configuration_error()
+        return ""
+
+    def extract(self, document, options=None):
+        if not isinstance(document, Document):
+            document = Document(data=document)
+        start = time.perf_counter()
+
+        try:
+            first = self.first.extract(document, options)
+            escalate = low_confidence_pages(first.data, first.pages, self.threshold)
+        except Exception as e:
+            if is_throttling_error(e):
+                raise
+            # e.g. a PDF for a local image-only engine: the second engine
+            # gets the whole document
+            logger.warning(
+                "%s failed, escalating the document: %s", self.first.label, e
+            )
+            first = ExtractionResult(self.first.slug)
+            first.seconds = time.perf_counter() - start
+            escalate = [1]
+
+        second = ExtractionResult(self.second.slug)
+        second.pages = 0
+        second_start = time.perf_counter()
+        raw = {
+            "engines": [self.first.slug, self.second.slug],
+            "threshold": self.threshold,
+            "pages": first.pages,
+            "escalated_pages": escalate,
+            "first": first.raw,
+            "second": None,
+        }
+        if not escalate:
+            data = first.data
+        else:
+            data, results, raw["second"] = self.escalate(
+                document, first, escalate, options
+            )
+            for result in results:
+                second.pages += result.pages
+                second.calls += result.calls
+                second.cost += result.cost
+                second.demo = second.demo or result.demo
+        second.seconds = time.perf_counter() - second_start
+
+        logger.info(
+            "Cascade %s: %d of %d page(s) escalated (threshold %s)",
+            self.slug,
+            len(escalate),
+            first.pages,
+            self.threshold,
+        )
+
+        result = ExtractionResult(
+            self.slug, self.annotate(data, raw), demo=first.demo or second.demo
+        )
+        result.raw = raw if self.can_parse(raw) else None
+        result.pages = first.pages
+        result.calls = first.calls + second.calls
+        result.cost = first.cost + second.cost
+        result.seconds = time.perf_counter() - start
+        result.stages = [first.stage_metrics(1, len(escalate))]
+        if escalate:
+            result.stages.append(second.stage_metrics(2))
+        return result
+
+    def escalate(self, document, first, pages, options=None):
+        """Second-stage data, results and raw output for the escalated pages"""
+        can_merge = (
+            first.data is not None
+            and not first.demo
+            and first.pages > 1
+            and self.first.output_shape == "tables"
+            and self.second.output_shape == "tables"
+        )
+        documents = {}
+        if can_merge:
+            documents = {page: page_document(document, page) for page in pages}
+        if not documents or None in documents.values():
+            result = self.second.extract(document, options)
+            return result.data, [result], {"whole": result.raw}
+
+        results = map_ordered(
+            lambda page: self.second.extract(documents[page], options),
+            pages,
+            settings.EXTRACTION_PAGE_CONCURRENCY,
+        )
+        escalated = {page: result.data for page, result in zip(pages, results)}
+        # JSON object keys are strings
+        raw = {"pages": {str(page): result.raw for page, result in zip(pages, results)}}
+        return merge_pages(first.data, escalated), results, raw
+
+    def annotate(self, data, raw):
+        if not isinstance(data, dict):
+            return data
+        return {
+            **data,
+            "cascade": {
+                "engines": raw["engines"],
+                "threshold": raw["threshold"],
+                "pages": raw["pages"],
+                "escalated_pages": raw["escalated_pages"],
+            },
+        }
+
+    def can_parse(self, raw):
+        """Whether every stage left raw output that parse() can rebuild from"""
+        second = raw["second"] or {}
+        if "whole" in second:
+            return second["whole"] is not None
+        page_raws = second.get("pages", {}).values()
+        return raw["first"] is not None and None not in page_raws
+
+    def parse(self, raw):
+        """Rebuild cascade data, keeping the pages escalated at extraction"""
+        second = raw["second"] or {}
+        if "whole" in second:
+            data = self.second.parse(second["whole"])
+        else:
+            data = self.first.parse(raw["first"])
+            if second.get("pages"):
+                escalated = {
+                    int(page): self.second.parse(page_raw)
+                    for page, page_raw in second["pages"].items()
+                }
+                data = merge_pages(data, escalated)
+        return self.annotate(data, raw)
@@ -0,0 +1,187 @@
+import asyncio
+import base64
+import json
+import logging
+
+from django.conf import settings
+
+from .. import preprocessing, telemetry
+from ..clients import provider_clients
+from ..throttling import map_ordered
+from . import rules
+from .base import BaseExtractor
+from .registry import register
+
+OCR_MODEL = "mistral-ocr-latest"
+
+logger = logging.getLogger(__name__)
+
+
+@register
+class MistralExtractor(BaseExtractor):
+    slug = "mistral"
+    label = "Mistral"
+    concurrency = 4
+    rate = 5
+    max_payload_bytes = 50 * 1024 * 1024
+    # A PDF is read in one call; image pages are sent one per call
+    max_pages_per_call = 1000
+    cost_per_page = 0.001
+    # Markdown per page, without confidence scores
+    output_shape = "pages"
+    options = {"model": OCR_MODEL}
+
+    def is_configured(self):
+        return bool(settings.MISTRAL_API_KEY)
+
+    def configuration_error(self):
+        return (
+            "Mistral API key is not configured. Please set MISTRAL_API_KEY "
+            "environment variable."
+        )
+
+    def demo_data(self):
+        return {
+            "sender": {
+                "name": "Mistral Demo Sender",
+                "address": "123 Mistral Street, Mistral City, 12345",
+                "phone": "123-456-7890",
+            },
+            "recipient": {
+                "name": "Mistral Demo Recipient",
+                "address": "456 Mistral Avenue, Mistral City, 67890",
+                "phone": "987-654-3210",
+            },
+            "shipment": {
+                "tracking_number": "MISTRAL123456789",
+                "date": "2025-03-17",
+                "weight": "2.5 kg",
+                "service_type": "Express",
+            },
+            "note": "This is demo data since Mistral API key is not configured.",
+        }
+
+    def documents(self, document, result):
+        """Mistral OCR document payloads for a stored file"""
+        if document.extension == ".pdf":
+            # Mistral OCR reads every page of a PDF in one call
+            data = document.read()
+            self.check_payload(data)
+            document_data = base64.b64encode(data).decode("utf-8")
+            return [
+                {
+                    "type": "document_url",
+                    "document_url": f"data:application/pdf;base64,{document_data}",
+                }
+            ]
+
+        # Preprocess each page and encode it to base64
+        payloads = []
+        with document.local_path() as path:
+            with telemetry.span("preprocess", self.slug):
+                pages = preprocessing.prepare_pages(path)
+        result.pages = len(pages)
+        for page in pages:
+            self.check_payload(page["data"])
+            image_data = base64.b64encode(page["data"]).decode("utf-8")
+            payloads.append(
+                {
+                    "type": "image_url",
+                    "image_url": f"data:{page['content_type']};base64,{image_data}",
+                }
+            )
+        return payloads
+
+    def fetch(self, document, options, result):
+        # Shared client: reuses pooled connections across images and requests
+        client = provider_clients.mistral()
+        documents = self.documents(document, result)
+
+        # Process the pages using Mistral OCR, concurrently for multi-page files
+        def process_document(payload):
+            ocr_response = self.call(
+                result,
+                lambda: client.ocr.process(model=OCR_MODEL, document=payload),
+            )
+            # Convert the OCR response to a dictionary
+            return json.loads(ocr_response.model_dump_json())
+
+        responses = map_ordered(
+            process_document, documents, settings.EXTRACTION_PAGE_CONCURRENCY
+        )
+        return self.raw_output(responses, options, result)
+
+    async def afetch(self, document, options, result):
+        client = provider_clients.amistral()
+        # Preprocessing waits on the process pool; wait for it on a thread
+        documents = await asyncio.to_thread(self.documents, document, result)
+
+        async def process_document(payload):
+            ocr_response = await self.acall(
+                result,
+                lambda: client.ocr.process_async(model=OCR_MODEL, document=payload),
+            )
+            return json.loads(ocr_response.model_dump_json())
+
+        # The provider limiter bounds how many pages are in flight
+        responses = await asyncio.gather(*map(process_document, documents))
+        return self.raw_output(responses, options, result)
+
+    def raw_output(self, responses, options, result):
+        result.pages = max(
+            result.pages, sum(len(response.get("pages", [])) for response in responses)
+        )
+        raw = {"responses": responses}
+        if options.get("field_rules"):
+            # Kept with the response so reprocessing applies the same rules
+            raw["field_rules"] = options["field_rules"]
+        return raw
+
+    def parse(self, raw):
+        responses = raw["responses"]
+        response_dict = responses[0]
+
+        # Structure the data to include all OCR information
+        structured_data = {
+            "ocr_info": {
+                "model": response_dict.get("model", ""),
+                "usage_info": response_dict.get("usage_info", {}),
+            },
+            "pages": [],
+        }
+
+        # Process each page; split pages are numbered in upload order
+        split_pages = len(responses) > 1
+        response_pages = []
+        for response in responses:
+            response_pages.extend(response.get("pages", []))
+        for page_number, page in enumerate(response_pages):
+            page_data = {
+                "index": page_number if split_pages else page.get("index", 0),
+                "dimensions": page.get("dimensions", {}),
+                "images": page.get("images", []),
+                "markdown": page.get("markdown", ""),
+            }
+            structured_data["pages"].append(page_data)
+
+        # Add extracted text analysis: typed fields with their offsets in
+        # the text, and the first value of each field
+        page_starts = []
+        offset = 0
+        for page in structured_data["pages"]:
+            page_starts.append(offset)
+            offset += len(page["markdown"]) + 1
+        extracted_text = "".join(
+            page["markdown"] + "\n" for page in structured_data["pages"]
+        )
+        fields = rules.compile_rules(raw.get("field_rules")).extract(
+            extracted_text, page_starts
+        )
+
+        structured_data["extracted_text"] = {
+            "raw_text": extracted_text,
+            "analysis": rules.analysis(fields),
+            "fields": fields,
+        }
+
+        return structured_data
@@ -0,0 +1,52 @@
+_engines = {}
+
+
+class UnknownEngine(ValueError):
+    pass
+
+
+def register(extractor_class):
+    """Class decorator adding an extractor to the registry under its slug"""
+    _engines[extractor_class.slug] = extractor_class()
+    return extractor_class
+
+
+def get(slug):
+    try:
+        return _engines[slug]
+    except KeyError:
+        raise UnknownEngine(f"Unsupported extraction engine: {slug or '(none)'}")
+
+
+def for_model(extraction_model):
+    """The engine an ExtractionModel is configured with, or its cascade"""
+    engine = get(extraction_model.engine)
+    if not extraction_model.escalation_engine:
+        return engine
+
+    from .cascade import CascadeExtractor
+
+    return CascadeExtractor(
+        engine,
+        get(extraction_model.escalation_engine),
+        extraction_model.escalation_threshold,
+    )
+
+
+def engines():
+    return dict(_engines)
+
+
+def for_slug(slug):
+    """The engine behind a result's engine slug, e.g. of an archived response.
+
+    Cascade results are named "first+second"; the rebuilt cascade can parse
+    but has no threshold, since the escalated pages are in the response.
+    """
+    if "+" not in slug:
+        return get(slug)
+
+    from .cascade import CascadeExtractor
+
+    first, second = slug.split("+", 1)
+    return CascadeExtractor(get(first), get(second), None)
@@ -0,0 +1,489 @@
+"""Rule-based extraction of typed waybill fields from OCR markdown.
+
+A rule names a field, the labels that introduce it and the type of its
+value, e.g. {"field": "shipment.weight", "type": "weight", "labels":
+["gross weight", "weight"]}. All labels of a rule set are compiled into
+one regex that is run once over the whole text. A label counts only at
+the start of a line or a table cell and when followed by a separator
+(":" or the end of the cell or line), so "to" does not match "Toronto".
+
+The value is the rest of the line or cell, the next cell of a key/value
+table row, the same column of the rows under a table header, or the next
+line after a label on its own. The first value of a field that parses as
+its type wins.
+"""
+
+import bisect
+import functools
+import json
+import re
+from datetime import date
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+DEFAULT_RULES = [
+    {
+        "field": "shipment.tracking_number",
+        "type": "tracking_number",
+        "labels": [
+            "tracking number",
+            "tracking no",
+            "tracking",
+            "waybill number",
+            "waybill no",
+            "waybill",
+            "awb number",
+            "awb no",
+            "awb",
+            "consignment number",
+            "consignment no",
+        ],
+    },
+    {
+        "field": "shipment.date",
+        "type": "date",
+        "labels": [
+            "shipment date",
+            "ship date",
+            "shipping date",
+            "pickup date",
+            "date",
+        ],
+    },
+    {
+        "field": "shipment.weight",
+        "type": "weight",
+        "labels": ["gross weight", "total weight", "chargeable weight", "weight"],
+    },
+    {
+        "field": "shipment.service_type",
+        "type": "text",
+        "labels": ["service type", "service"],
+    },
+    {
+        "field": "sender.name",
+        "type": "party",
+        "labels": ["sender", "shipper", "consignor", "from"],
+    },
+    {
+        "field": "recipient.name",
+        "type": "party",
+        "labels": ["recipient", "receiver", "consignee", "ship to", "deliver to", "to"],
+    },
+]
+
+# Markdown emphasis, headings, quotes and list bullets before a label
+LABEL_PREFIX = r"(?:^|(?<=\|))[ \t]*(?:[#>*_\-]+[ \t]*)*"
+# "Tracking No.:", "**Weight**:", "| Date |" or a label alone on its line
+LABEL_END = r"(?!\w)[ \t*_.#]*(?::|(?=\||$))"
+
+TABLE_SEPARATOR = re.compile(r"[ \t]*\|?[ \t]*:?-{3,}")
+LINE_BREAK = re.compile(r"<br\s*/?>", re.IGNORECASE)
+# Markup and separators around a value
+VALUE_STRIP = " \t*_:#|-"
+
+TRACKING_NUMBER = re.compile(r"\b(?=[A-Z0-9-]*\d)[A-Z0-9][A-Z0-9-]{5,}\b", re.I)
+WEIGHT = re.compile(
+    r"(\d+(?:[.,]\d+)?)\s*(kgs?|kilograms?|lbs?|pounds?|oz|ounces?|g|grams?|t)?\b",
+    re.I,
+)
+WEIGHT_UNITS = {
+    "kg": ("kg", 1.0),
+    "kgs": ("kg", 1.0),
+    "kilogram": ("kg", 1.0),
+    "kilograms": ("kg", 1.0),
+    "g": ("g", 0.001),
+    "gram": ("g", 0.001),
+    "grams": ("g", 0.001),
+    "lb": ("lb", 0.45359237),
+    "lbs": ("lb", 0.45359237),
+    "pound": ("lb", 0.45359237),
+    "pounds": ("lb", 0.45359237),
+    "oz": ("oz", 0.028349523125),
+    "ounce": ("oz", 0.028349523125),
+    "ounces": ("oz", 0.028349523125),
+    "t": ("t", 1000.0),
+}
+MONTHS = {
+    name: number
+    for number, names in enumerate(
+        [
+            ("jan", "january"),
+            ("feb", "february"),
+            ("mar", "march"),
+            ("apr", "april"),
+            ("may",),
+            ("jun", "june"),
+            ("jul", "july"),
+            ("aug", "august"),
+            ("sep", "sept", "september"),
+            ("oct", "october"),
+            ("nov", "november"),
+            ("dec", "december"),
+        ],
+        start=1,
+    )
+    for name in names
+}
+MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+ISO_DATE = re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+NUMERIC_DATE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}|\d{2})\b")
+DAY_MONTH_DATE = re.compile(
+    rf"\b(\d{{1,2}})(?:st|nd|rd|th)?[ \t.-]+({MONTH_NAMES})\.?,?[ \t.-]+(\d{{4}})\b",
+    re.I,
+)
+MONTH_DAY_DATE = re.compile(
+    rf"\b({MONTH_NAMES})\.?[ \t]+(\d{{1,2}})(?:st|nd|rd|th)?,?[ \t]+(\d{{4}})\b", re.I
+)
+
+TYPES = {"text", "party", "tracking_number", "date", "weight"}
+
+# Rule patterns are user input run on every document; the stdlib re has no
+# timeout, so their size and the text they search are bounded instead
+MAX_PATTERN_LENGTH = 200
+MAX_PATTERN_TEXT = 1000
+REPEAT_OPS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT}
+if hasattr(sre_parse, "POSSESSIVE_REPEAT"):
+    REPEAT_OPS.add(sre_parse.POSSESSIVE_REPEAT)
+
+
+def _date(year, month, day):
+    year = int(year)
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, int(month), int(day)).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_date(text, day_first=True):
+    """ISO date of the first date in the text, or None"""
+    match = ISO_DATE.search(text)
+    if match:
+        return _date(*match.groups())
+    match = DAY_MONTH_DATE.search(text)
+    if match:
+        day, month, year = match.groups()
+        return _date(year, MONTHS[month.lower()], day)
+    match = MONTH_DAY_DATE.search(text)
+    if match:
+        month, day, year = match.groups()
+        return _date(year, MONTHS[month.lower()], day)
+    match = NUMERIC_DATE.search(text)
+    if match:
+        first, second, year = match.groups()
+        # A part over 12 can only be the day
+        if int(first) > 12:
+            day_first = True
+        elif int(second) > 12:
+            day_first = False
+        day, month = (first, second) if day_first else (second, first)
+        return _date(year, month, day)
+    return None
+
+
+def parse_weight(text):
+    """{"value", "unit", "kg"} of the first number in the text, or None"""
+    match = WEIGHT.search(text)
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", "."))
+    unit, to_kg = WEIGHT_UNITS.get((match.group(2) or "").lower(), (None, None))
+    return {
+        "value": value,
+        "unit": unit,
+        "kg": round(value * to_kg, 6) if to_kg is not None else None,
+    }
+
+
+def convert(text, rule):
+    """(typed value, display text) of a rule's value, or None if it has none"""
+    kind = rule["type"]
+    if kind == "tracking_number":
+        match = TRACKING_NUMBER.search(text)
+        if not match:
+            return None
+        value = match.group(0).upper()
+        return value, value
+    if kind == "date":
+        value = parse_date(text, rule.get("day_first", True))
+        return (value, value) if value else None
+    if kind == "weight":
+        value = parse_weight(text)
+        if value is None:
+            return None
+        number = f"{value['value']:g}"
+        return value, f"{number} {value['unit']}" if value["unit"] else number
+    return (text, text) if text else None
+
+
+def validate(rules):
+    """Raise ValueError unless rules is a list of well-formed rules"""
+    if not isinstance(rules, list):
+        raise ValueError("Field rules must be a list")
+    for rule in rules:
+        if not isinstance(rule, dict):
+            raise ValueError("Each field rule must be an object")
+        if not isinstance(rule.get("field"), str) or not rule["field"]:
+            raise ValueError("Each field rule needs a field name")
+        if rule.get("type", "text") not in TYPES:
+            raise ValueError(
+                f"Unknown type for {rule['field']}: {rule.get('type')} "
+                f"(expected one of {', '.join(sorted(TYPES))})"
+            )
+        labels = rule.get("labels")
+        if (
+            not isinstance(labels, list)
+            or not labels
+            or not all(isinstance(label, str) and label.strip() for label in labels)
+        ):
+            raise ValueError(f"Rule {rule['field']} needs a list of labels")
+        if "pattern" in rule:
+            _validate_pattern(rule["field"], rule["pattern"])
+
+
+def _validate_pattern(field, pattern):
+    """Reject patterns that do not compile or may backtrack without bound"""
+    if isinstance(pattern, str) and len(pattern) > MAX_PATTERN_LENGTH:
+        raise ValueError(
+            f"Pattern for {field} is longer than {MAX_PATTERN_LENGTH} characters"
+        )
+    try:
+        re.compile(pattern)
+    except (re.error, TypeError) as e:
+        raise ValueError(f"Invalid pattern for {field}: {e}")
+    # e.g. (a+)+ or (\w*\s?)*, which take exponential time on a near match
+    if _nested_repeat(sre_parse.parse(pattern)):
+        raise ValueError(f"Pattern for {field} nests quantifiers, e.g. (a+)+")
+
+
+def _nested_repeat(pattern, repeated=False):
+    """Whether a parsed pattern has a repeating quantifier inside another"""
+    for op, argument in pattern:
+        if op in REPEAT_OPS:
+            _, high, item = argument
+            # "?" matches at most once, so it cannot multiply the paths
+            repeats = high != 1
+            if repeats and repeated:
+                return True
+            if _nested_repeat(item, repeated or repeats):
+                return True
+        elif any(_nested_repeat(item, repeated) for item in _subpatterns(argument)):
+            return True
+    return False
+
+
+def _subpatterns(argument):
+    if isinstance(argument, sre_parse.SubPattern):
+        yield argument
+    elif isinstance(argument, (list, tuple)):
+        for item in argument:
+            yield from _subpatterns(item)
+
+
+def _normalize_label(label):
+    return " ".join(label.lower().split())
+
+
+def _trie_pattern(node):
+    """Regex for the labels in a character trie, with shared prefixes factored.
+
+    A plain alternation of many labels is tried label by label at every
+    line and cell start; the factored form rejects a position after its
+    first character or two.
+    """
+    branches = []
+    for key in sorted(key for key in node if key):
+        # Words may be separated by any whitespace, including a line break
+        piece = r"\s+" if key == " " else re.escape(key)
+        branches.append(piece + _trie_pattern(node[key]))
+    if not branches:
+        return ""
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")" + ("?" if "" in node else "")
+
+
+class RuleSet:
+    """Rules compiled into a single label regex; build with compile_rules()"""
+
+    def __init__(self, rules):
+        validate(rules)
+        self.rules = [{"type": "text", **rule} for rule in rules]
+        self.patterns = [
+            re.compile(rule["pattern"], re.I) if rule.get("pattern") else None
+            for rule in self.rules
+        ]
+
+        # Normalized label -> rule; a label listed by two rules belongs to
+        # the first
+        self.label_rules = {}
+        trie = {}
+        for index, rule in enumerate(self.rules):
+            for label in rule["labels"]:
+                label = _normalize_label(label)
+                self.label_rules.setdefault(label, index)
+                node = trie
+                for character in label:
+                    node = node.setdefault(character, {})
+                node[""] = {}
+        self.regex = re.compile(
+            LABEL_PREFIX + f"(?P<label>{_trie_pattern(trie)})" + LABEL_END,
+            re.IGNORECASE | re.MULTILINE,
+        )
+
+    def extract(self, text, page_starts=None):
+        """Typed fields found in the text, in order of appearance.
+
+        page_starts are the offsets where each page's text begins, to number
+        the page of every field; spans are offsets into the text.
+        """
+        fields = []
+        for match in self.regex.finditer(text):
+            index = self.label_rules[_normalize_label(match.group("label"))]
+            rule = self.rules[index]
+            for start, end in self.value_spans(text, match):
+                value_text = LINE_BREAK.sub(", ", text[start:end]).strip(VALUE_STRIP)
+                if self.patterns[index] is not None:
+                    found = self.patterns[index].search(
+                        value_text, 0, MAX_PATTERN_TEXT
+                    )
+                    if not found:
+                        continue
+                    value_text = (
+                        found.group("value")
+                        if "value" in found.re.groupindex
+                        else found.group(0)
+                    )
+                converted = convert(value_text, rule)
+                if converted is None:
+                    continue
+                value, display = converted
+                fields.append(
+                    {
+                        "field": rule["field"],
+                        "type": rule["type"],
+                        "value": value,
+                        "text": display,
+                        "label": match.group("label"),
+                        "span": [start, end],
+                        "page": (
+                            bisect.bisect_right(page_starts, start)
+                            if page_starts
+                            else 1
+                        ),
+                    }
+                )
+        return fields
+
+    def value_spans(self, text, match):
+        """(start, end) offsets of the values introduced by a label match"""
+        line_start = text.rfind("\n", 0, match.start()) + 1
+        line_end = _line_end(text, match.end())
+        in_table = text[line_start:line_end].lstrip().startswith("|")
+
+        if not in_table:
+            span = _trimmed(text, match.end(), line_end)
+            if span:
+                return [span]
+            # A label alone on its line, e.g. a "## Sender" heading, takes
+            # the next non-blank line unless that starts another label
+            position = line_end
+            while position < len(text):
+                next_end = _line_end(text, position + 1)
+                span = _trimmed(text, position + 1, next_end)
+                if span:
+                    if self.regex.match(text, position + 1):
+                        return []
+                    return [span]
+                position = next_end
+            return []
+
+        cell_end = text.find("|", match.end(), line_end)
+        cell_end = line_end if cell_end == -1 else cell_end
+        span = _trimmed(text, match.end(), cell_end)
+        if span:
+            return [span]
+
+        next_line_end = _line_end(text, line_end + 1)
+        if not TABLE_SEPARATOR.match(text, line_end + 1, next_line_end):
+            # Key/value row: the value is the next cell
+            value_end = text.find("|", cell_end + 1, line_end)
+            span = _trimmed(
+                text, cell_end + 1, line_end if value_end == -1 else value_end
+            )
+            return [span] if span else []
+
+        # Header cell: the values are the same column of the rows below
+        column = text.count("|", line_start, match.start())
+        spans = []
+        position = next_line_end
+        while position < len(text):
+            row_end = _line_end(text, position + 1)
+            row = text[position + 1 : row_end]
+            if not row.lstrip().startswith("|"):
+                break
+            span = _cell(text, position + 1, row_end, column)
+            if span:
+                spans.append(span)
+            position = row_end
+        return spans
+
+
+def _line_end(text, position):
+    end = text.find("\n", position)
+    return len(text) if end == -1 else end
+
+
+def _trimmed(text, start, end):
+    """(start, end) of text[start:end] without markup, or None if empty"""
+    while start < end and text[start] in VALUE_STRIP:
+        start += 1
+    while end > start and text[end - 1] in VALUE_STRIP:
+        end -= 1
+    return (start, end) if start < end else None
+
+
+def _cell(text, start, end, column):
+    """Trimmed span of the column-th cell of a table row"""
+    position = start
+    for _ in range(column):
+        position = text.find("|", position, end)
+        if position == -1:
+            return None
+        position += 1
+    cell_end = text.find("|", position, end)
+    return _trimmed(text, position, end if cell_end == -1 else cell_end)
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(rules_json):
+    return RuleSet(json.loads(rules_json))
+
+
+def compile_rules(rules=None):
+    """The compiled RuleSet for rules (DEFAULT_RULES when empty), cached"""
+    return _compile(json.dumps(rules or DEFAULT_RULES, sort_keys=True))
+
+
+def analysis(fields):
+    """Nested {"sender": {"name": ...}, ...} of the first value of each field"""
+    nested = {"sender": {}, "recipient": {}, "shipment": {}}
+    seen = set()
+    for field in fields:
+        if field["field"] in seen:
+            continue
+        seen.add(field["field"])
+        *groups, name = field["field"].split(".")
+        target = nested
+        for group in groups:
+            target = target.setdefault(group, {})
+            if not isinstance(target, dict):
+                break
+        else:
+            target[name] = field["text"]
+    return nested
@@ -0,0 +1,279 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .. import telemetry
+from .base import BaseExtractor
+from .registry import register
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# Tesseract's TSV level for single words
+WORD_LEVEL = 5
+
+# Words further apart than this many word heights start a new table cell
+CELL_GAP_FACTOR = 2.0
+
+# Longest text before a colon that is still read as a form label
+MAX_LABEL_LENGTH = 40
+
+logger = logging.getLogger(__name__)
+
+
+def tsv_words(data):
+    """Recognized words of an image_to_data() dict, in reading order"""
+    words = []
+    for i, text in enumerate(data["text"]):
+        text = (text or "").strip()
+        if int(data["level"][i]) != WORD_LEVEL or not text:
+            continue
+        words.append(
+            {
+                "text": text,
+                "line": (
+                    data["block_num"][i],
+                    data["par_num"][i],
+                    data["line_num"][i],
+                ),
+                "left": int(data["left"][i]),
+                "width": int(data["width"][i]),
+                "height": int(data["height"][i]),
+                # Tesseract reports -1 for words it did not score
+                "confidence": max(float(data["conf"][i]), 0.0),
+            }
+        )
+    return words
+
+
+def group_lines(words):
+    """Words grouped by the block, paragraph and line Tesseract put them in"""
+    lines = {}
+    for word in words:
+        lines.setdefault(word["line"], []).append(word)
+    return [sorted(line, key=lambda word: word["left"]) for line in lines.values()]
+
+
+def _mean_confidence(words):
+    return round(statistics.fmean(word["confidence"] for word in words), 2)
+
+
+def split_cells(line):
+    """Split a line into cells at horizontal gaps wider than CELL_GAP_FACTOR"""
+    gap = CELL_GAP_FACTOR * statistics.median(word["height"] for word in line)
+    cells = [[line[0]]]
+    for previous, word in zip(line, line[1:]):
+        if word["left"] - (previous["left"] + previous["width"]) > gap:
+            cells.append([])
+        cells[-1].append(word)
+    return cells
+
+
+def _cell_text(words):
+    # Same quoting as Textract table cells
+    text = " ".join(word["text"] for word in words).replace('"', '""')
+    return f"'{text}"
+
+
+def _table(rows):
+    width = max(len(cells) for cells in rows)
+    return {
+        "rows": [
+            [_cell_text(cell) for cell in cells] + [""] * (width - len(cells))
+            for cells in rows
+        ],
+        "confidence_scores": [
+            [_mean_confidence(cell) for cell in cells] + [0] * (width - len(cells))
+            for cells in rows
+        ],
+    }
+
+
+def structure_page(data):
+    """Tables, forms and raw text of one page of Tesseract TSV output.
+
+    Tesseract has no table or form model, so both are inferred from the
+    layout: consecutive lines that split into two or more cells form a
+    table, and a "Label: value" line is a form field.
+    """
+    page = {"tables": [], "forms": {}, "lines": [], "confidence": None, "words": 0}
+    words = tsv_words(data)
+    if not words:
+        return page
+    page["words"] = len(words)
+    page["confidence"] = _mean_confidence(words)
+
+    table_rows = []
+    for line in group_lines(words):
+        page["lines"].append(" ".join(word["text"] for word in line))
+
+        cells = split_cells(line)
+        if len(cells) > 1:
+            table_rows.append(cells)
+        else:
+            if len(table_rows) > 1:
+                page["tables"].append(_table(table_rows))
+            table_rows = []
+
+        for index, word in enumerate(line[:-1]):
+            if not word["text"].endswith(":"):
+                continue
+            label = " ".join(w["text"] for w in line[: index + 1])[:-1].strip()
+            value_words = line[index + 1 :]
+            if label and len(label) <= MAX_LABEL_LENGTH:
+                page["forms"][label] = {
+                    "value": " ".join(w["text"] for w in value_words),
+                    "confidence": _mean_confidence(value_words),
+                }
+            break
+
+    if len(table_rows) > 1:
+        page["tables"].append(_table(table_rows))
+    return page
+
+
+def ocr_page(path, frame, lang, config, tesseract_cmd):
+    """OCR one page of an image file into Tesseract's TSV columns.
+
+    Runs in a worker process, so it takes plain arguments instead of
+    reading Django settings.
+    """
+    start = time.perf_counter()
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    with Image.open(path) as image:
+        image.seek(frame)
+        page_image = ImageOps.exif_transpose(image).convert("L")
+    data = pytesseract.image_to_data(
+        page_image, lang=lang, config=config, output_type=pytesseract.Output.DICT
+    )
+    return {"tsv": data, "seconds": time.perf_counter() - start}
+
+
+def merge_pages(pages):
+    """Combine per-page results into the Textract output shape"""
+    structured_data = {
+        "tables": [],
+        "forms": {},
+        "raw_text": "",
+        "confidence_scores": {},
+        "page_confidence": [],
+    }
+    raw_text_lines = []
+    for page_number, page in enumerate(pages, 1):
+        for table in page["tables"]:
+            structured_data["tables"].append({**table, "page": page_number})
+        for key, field in page["forms"].items():
+            # The same label on a later page must not overwrite the first
+            if key in structured_data["forms"]:
+                key = f"{key} (page {page_number})"
+            structured_data["forms"][key] = {**field, "page": page_number}
+        raw_text_lines.extend(page["lines"])
+        # Mean word confidence per page, for deciding which pages need a
+        # paid provider
+        structured_data["page_confidence"].append(
+            {
+                "page": page_number,
+                "confidence": page["confidence"],
+                "words": page["words"],
+            }
+        )
+
+    structured_data["raw_text"] = "\n".join(raw_text_lines)
+    return structured_data
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned rather than forked: the parent runs worker threads
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.TESSERACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def frame_count(path):
+    try:
+        with Image.open(path) as image:
+            return getattr(image, "n_frames", 1)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Tesseract engine cannot read {path}: {e}")
+
+
+@register
+class TesseractExtractor(BaseExtractor):
+    """Local OCR with Tesseract: no per-call cost and no network round-trip.
+
+    Pages are OCR'd on a process pool of TESSERACT_WORKERS processes (the
+    CPU count by default) shared by every extraction in the process.
+    """
+
+    slug = "tesseract"
+    label = "Tesseract (local)"
+    concurrency = os.cpu_count() or 1
+    rate = None
+    max_pages_per_call = 1
+    remote = False
+
+    @property
+    def options(self):
+        return {"lang": settings.TESSERACT_LANG, "config": settings.TESSERACT_CONFIG}
+
+    def is_configured(self):
+        return pytesseract is not None and bool(shutil.which(settings.TESSERACT_CMD))
+
+    def configuration_error(self):
+        return (
+            "Tesseract is not available. Install the tesseract binary and "
+            "`pip install pytesseract`, or set TESSERACT_CMD."
+        )
+
+    def fetch(self, document, options, result):
+        with document.local_path() as path:
+            pages = frame_count(path)
+            result.pages = pages
+            args = (
+                settings.TESSERACT_LANG,
+                settings.TESSERACT_CONFIG,
+                settings.TESSERACT_CMD,
+            )
+            if settings.TESSERACT_WORKERS <= 0:
+                page_results = [ocr_page(path, frame, *args) for frame in range(pages)]
+            else:
+                executor = _get_executor()
+                futures = [
+                    executor.submit(ocr_page, path, frame, *args)
+                    for frame in range(pages)
+                ]
+                page_results = [future.result() for future in futures]
+
+        for page in page_results:
+            result.add_call()
+            # Timed on the OCR worker; local OCR stands in for the provider
+            telemetry.observe("provider_call", page["seconds"], self.slug)
+        logger.info(
+            "Tesseract OCR of %s: %d page(s) in %.0f ms CPU",
+            document.name,
+            pages,
+            sum(page["seconds"] for page in page_results) * 1000,
+        )
+        return {"pages": [page["tsv"] for page in page_results]}
+
+    def parse(self, raw):
+        return merge_pages([structure_page(tsv) for tsv in raw["pages"]])
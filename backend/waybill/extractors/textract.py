@@ -0,0 +1,408 @@
+import logging
+import re
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+from .. import preprocessing, telemetry
+from ..clients import provider_clients
+from ..textract_index import BlockIndex
+from ..throttling import map_ordered
+from .base import BaseExtractor
+from .registry import register
+
+FEATURE_TYPES = ["TABLES", "FORMS"]
+# Images synchronous AnalyzeDocument reads from S3 as they are; TIFFs may
+# have several pages, which it rejects, so those are split locally
+S3_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+# Indirect objects of an uncompressed PDF, and the parts of the page tree root
+PDF_OBJECT_PATTERN = re.compile(rb"(\d+)\s+\d+\s+obj\b(.*?)\bendobj", re.DOTALL)
+PDF_PAGES_PATTERN = re.compile(rb"/Type\s*/Pages(?![A-Za-z])")
+PDF_PARENT_PATTERN = re.compile(rb"/Parent\s")
+PDF_COUNT_PATTERN = re.compile(rb"/Count\s+(\d+)")
+
+logger = logging.getLogger(__name__)
+
+
+class MultiPagePdf(ValueError):
+    """A PDF the synchronous API rejects and no bucket is set to stage"""
+
+    def __init__(self, pages=None):
+        counted = f"{pages} page " if pages else "Multi-page "
+        super().__init__(
+            f"{counted}PDF needs TEXTRACT_S3_BUCKET: synchronous Textract "
+            "only reads single-page documents"
+        )
+
+
+def pdf_page_count(data):
+    """Pages of a PDF as its page tree counts them, or None if unknown.
+
+    The /Count of the root /Pages node is what readers show, unlike the
+    number of /Page objects, which includes unused ones and the versions
+    an incremental update replaced. Later definitions of an object replace
+    earlier ones. Page trees inside compressed object streams are not seen.
+    """
+    objects = {}
+    for match in PDF_OBJECT_PATTERN.finditer(data):
+        objects[match.group(1)] = match.group(2)
+    roots = [
+        body
+        for body in objects.values()
+        if PDF_PAGES_PATTERN.search(body) and not PDF_PARENT_PATTERN.search(body)
+    ]
+    if len(roots) != 1:
+        return None
+    count = PDF_COUNT_PATTERN.search(roots[0])
+    return int(count.group(1)) if count else None
+
+
+def get_table_cells(table_block, index):
+    """Get all cells belonging to a specific table"""
+    cells = []
+    for block in index.related(table_block, "CHILD", block_type="CELL"):
+        # Resolve the text for this cell through the block index; a copy
+        # keeps the archived response as Textract returned it
+        cells.append({**block, "Text": index.text_for(block)})
+
+    return cells
+
+
+def extract_table_data(table_block, index):
+    """Extract table data and confidence scores from Textract blocks for a specific table"""
+    cells = {}
+    confidence_scores = {}
+
+    # Get cells for this specific table
+    table_cells = get_table_cells(table_block, index)
+
+    # Process cells
+    for cell in table_cells:
+        row_idx = cell["RowIndex"]
+        col_idx = cell["ColumnIndex"]
+
+        # Store cell text with single quote prefix for non-empty text
+        text = cell.get("Text", "").strip()
+        if text:
+            # Handle special characters and formatting
+            text = text.replace('"', '""')  # Escape double quotes
+            text = f"'{text}"
+
+        # Store cell data
+        cells[(row_idx, col_idx)] = text
+
+        # Store confidence score
+        confidence_scores[(row_idx, col_idx)] = cell.get("Confidence", 0)
+
+    if not cells:
+        return None
+
+    # Find dimensions of the table
+    max_row = max(pos[0] for pos in cells.keys())
+    max_col = max(pos[1] for pos in cells.keys())
+
+    # Create table data structure
+    table_data = {
+        "rows": [["" for _ in range(max_col)] for _ in range(max_row)],
+        "confidence_scores": [[0 for _ in range(max_col)] for _ in range(max_row)],
+    }
+
+    # Fill in the data
+    for (row_idx, col_idx), text in cells.items():
+        table_data["rows"][row_idx - 1][col_idx - 1] = text
+        table_data["confidence_scores"][row_idx - 1][col_idx - 1] = (
+            confidence_scores.get((row_idx, col_idx), 0)
+        )
+
+    return table_data
+
+
+def structure_blocks(blocks):
+    """Tables, forms and raw text of a Textract response, across all pages"""
+    # Initialize the structured response
+    structured_data = {
+        "tables": [],
+        "forms": {},
+        "raw_text": "",
+        "confidence_scores": {},
+    }
+
+    # Index the blocks once so every lookup below avoids a full scan
+    index = BlockIndex(blocks)
+
+    # Process tables
+    table_blocks = index.of_type("TABLE")
+    for i, table_block in enumerate(table_blocks, 1):
+        table_data = extract_table_data(table_block, index)
+        if table_data:
+            table_data["page"] = table_block.get("Page", 1)
+            logger.debug(
+                "Table %d: %d rows, %d columns",
+                i,
+                len(table_data["rows"]),
+                len(table_data["rows"][0]) if table_data["rows"] else 0,
+            )
+            structured_data["tables"].append(table_data)
+        else:
+            logger.debug("No data found in table %d", i)
+
+    # Process form fields (key-value pairs)
+    form_fields = 0
+    for block in index.of_type("KEY_VALUE_SET"):
+        if "KEY" in block["EntityTypes"]:
+            key = index.text_for(block)
+            value = ""
+            confidence = block.get("Confidence", 0)
+
+            # Find the corresponding value
+            for value_block in index.related(block, "VALUE"):
+                value = index.text_for(value_block)
+                confidence = value_block.get("Confidence", confidence)
+
+            if key and value:
+                form_fields += 1
+                page = block.get("Page", 1)
+                # The same label on a later page must not overwrite the first
+                if key in structured_data["forms"]:
+                    key = f"{key} (page {page})"
+                structured_data["forms"][key] = {
+                    "value": value,
+                    "confidence": confidence,
+                    "page": page,
+                }
+
+    # Collect raw text
+    raw_text_lines = []
+    for block in index.of_type("LINE"):
+        raw_text_lines.append(index.text_for(block))
+
+    structured_data["raw_text"] = "\n".join(raw_text_lines)
+    logger.debug(
+        "Structured %d blocks: %d tables, %d form fields, %d lines",
+        len(blocks),
+        len(structured_data["tables"]),
+        form_fields,
+        len(raw_text_lines),
+    )
+
+    return structured_data
+
+
+@register
+class TextractExtractor(BaseExtractor):
+    slug = "textract"
+    label = "AWS Textract"
+    concurrency = 4
+    rate = 5
+    # Synchronous AnalyzeDocument accepts one page of up to 10 MB
+    max_payload_bytes = 10 * 1024 * 1024
+    max_pages_per_call = 1
+    # AnalyzeDocument list price with TABLES and FORMS
+    cost_per_page = 0.065
+    options = {"feature_types": FEATURE_TYPES}
+
+    def is_configured(self):
+        return bool(settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY)
+
+    def configuration_error(self):
+        return (
+            "AWS credentials are not configured. Please set AWS_ACCESS_KEY_ID "
+            "and AWS_SECRET_ACCESS_KEY environment variables."
+        )
+
+    def demo_data(self):
+        return {
+            "sender": {
+                "name": "AWS Textract Demo Sender",
+                "address": "123 AWS Street, AWS City, 12345",
+                "phone": "123-456-7890",
+            },
+            "recipient": {
+                "name": "AWS Textract Demo Recipient",
+                "address": "456 AWS Avenue, AWS City, 67890",
+                "phone": "987-654-3210",
+            },
+            "shipment": {
+                "tracking_number": "AWS123456789",
+                "date": "2025-03-17",
+                "weight": "2.5 kg",
+                "service_type": "Express",
+            },
+            "note": "This is demo data since AWS API keys are not configured.",
+        }
+
+    def fetch(self, document, options, result):
+        logger.info("Processing %s with AWS Textract", document.name)
+
+        # Shared client: reuses pooled connections across images and requests
+        textract = provider_clients.textract()
+
+        # Documents in the S3 media bucket are read by Textract in place
+        s3_object = document.s3_object if settings.TEXTRACT_READ_FROM_STORAGE else None
+        if s3_object is not None:
+            if document.extension == ".pdf":
+                blocks = self.analyze_s3_document(textract, s3_object, result)
+                return {"blocks": blocks}
+            if (
+                document.extension in S3_IMAGE_EXTENSIONS
+                and document.size <= self.max_payload_bytes
+            ):
+                blocks = self.analyze_s3_image(textract, s3_object, result)
+                return {"blocks": blocks}
+
+        with document.local_path() as path:
+            if document.extension == ".pdf" and settings.TEXTRACT_S3_BUCKET:
+                # Multi-page PDFs go through the asynchronous API via S3
+                blocks = self.analyze_document_async(textract, path, result)
+            elif document.extension == ".pdf":
+                blocks = self.analyze_pdf(textract, path, result)
+            else:
+                # Images and TIFF pages are analyzed one page per call
+                blocks = self.analyze_pages(textract, path, result)
+        return {"blocks": blocks}
+
+    def parse(self, raw):
+        return structure_blocks(raw["blocks"])
+
+    def analyze_pages(self, textract, path, result):
+        """Blocks of every page, from concurrent synchronous Textract calls"""
+        with telemetry.span("preprocess", self.slug):
+            pages = preprocessing.prepare_pages(path)
+        for page in pages:
+            self.check_payload(page["data"])
+        result.pages = len(pages)
+        logger.debug("Calling Textract for %d page(s)", len(pages))
+
+        def analyze_page(page_number):
+            page = pages[page_number - 1]
+            response = self.call(
+                result,
+                lambda: textract.analyze_document(
+                    Document={"Bytes": page["data"]}, FeatureTypes=FEATURE_TYPES
+                ),
+            )
+            # Each call sees a single page; label its blocks with the real one
+            for block in response["Blocks"]:
+                block["Page"] = page_number
+            return response["Blocks"]
+
+        page_blocks = map_ordered(
+            analyze_page,
+            range(1, len(pages) + 1),
+            settings.EXTRACTION_PAGE_CONCURRENCY,
+        )
+        return [block for blocks in page_blocks for block in blocks]
+
+    def analyze_pdf(self, textract, path, result):
+        """Blocks of a single-page PDF from synchronous AnalyzeDocument.
+
+        Pillow cannot split PDFs, so one with several pages is rejected
+        before any call; where the pages cannot be counted, Textract's
+        rejection of the document is reported the same way.
+        """
+        with open(path, "rb") as source:
+            data = source.read()
+        pages = pdf_page_count(data)
+        if pages and pages > 1:
+            raise MultiPagePdf(pages)
+
+        self.check_payload(data)
+        result.pages = 1
+        try:
+            response = self.call(
+                result,
+                lambda: textract.analyze_document(
+                    Document={"Bytes": data}, FeatureTypes=FEATURE_TYPES
+                ),
+            )
+        except ClientError as e:
+            # A PDF counted as one page is rejected for another reason
+            unsupported = e.response["Error"]["Code"] == "UnsupportedDocumentException"
+            if pages is None and unsupported:
+                raise MultiPagePdf() from e
+            raise
+        for block in response["Blocks"]:
+            block["Page"] = 1
+        return response["Blocks"]
+
+    def analyze_s3_image(self, textract, s3_object, result):
+        """Blocks of a single-page image Textract reads from S3.
+
+        The image is sent as stored: it never passes through this process,
+        so it is not preprocessed either.
+        """
+        response = self.call(
+            result,
+            lambda: textract.analyze_document(
+                Document={"S3Object": s3_object}, FeatureTypes=FEATURE_TYPES
+            ),
+        )
+        for block in response["Blocks"]:
+            block["Page"] = 1
+        return response["Blocks"]
+
+    def analyze_document_async(self, textract, path, result):
+        """Blocks of a local multi-page document, staged in TEXTRACT_S3_BUCKET"""
+        s3 = provider_clients.s3()
+        bucket = settings.TEXTRACT_S3_BUCKET
+        key = f"{settings.TEXTRACT_S3_PREFIX}{uuid.uuid4()}.pdf"
+        s3.upload_file(path, bucket, key)
+        try:
+            return self.analyze_s3_document(
+                textract, {"Bucket": bucket, "Name": key}, result
+            )
+        finally:
+            s3.delete_object(Bucket=bucket, Key=key)
+
+    def analyze_s3_document(self, textract, s3_object, result):
+        """Blocks of a multi-page document in S3 from StartDocumentAnalysis"""
+        job_id = self.call(
+            result,
+            lambda: textract.start_document_analysis(
+                DocumentLocation={"S3Object": s3_object},
+                FeatureTypes=FEATURE_TYPES,
+            ),
+        )["JobId"]
+        logger.info("Started Textract document analysis job %s", job_id)
+        return self.collect_document_analysis(textract, job_id, result)
+
+    def collect_document_analysis(self, textract, job_id, result):
+        """Wait for an asynchronous Textract job and gather all result pages"""
+        deadline = time.monotonic() + settings.TEXTRACT_ASYNC_TIMEOUT
+        while True:
+            response = self.call(
+                result, lambda: textract.get_document_analysis(JobId=job_id)
+            )
+            if response["JobStatus"] != "IN_PROGRESS":
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Textract job {job_id} did not finish in time")
+            time.sleep(settings.TEXTRACT_ASYNC_POLL_INTERVAL)
+
+        if response["JobStatus"] == "FAILED":
+            raise RuntimeError(
+                response.get("StatusMessage", f"Textract job {job_id} failed")
+            )
+
+        # Results are paginated; follow NextToken until every block is read
+        blocks = list(response["Blocks"])
+        while response.get("NextToken"):
+            next_token = response["NextToken"]
+            response = self.call(
+                result,
+                lambda: textract.get_document_analysis(
+                    JobId=job_id, NextToken=next_token
+                ),
+            )
+            blocks.extend(response["Blocks"])
+
+        result.pages = response.get("DocumentMetadata", {}).get("Pages") or 1
+        logger.info(
+            "Textract job %s: %d blocks from %d pages",
+            job_id,
+            len(blocks),
+            result.pages,
+        )
+        return blocks
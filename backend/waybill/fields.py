@@ -0,0 +1,108 @@
+import re
+
+from django.db import transaction
+
+from .exports import flatten_extracted_data
+from .models import ExtractedField
+
+# Free-text sources are kept in ExtractedData only; they are not fields
+UNINDEXED_SOURCES = {"raw_text", "page", "raw_data"}
+
+# Field names that hold a waybill's tracking number across providers
+TRACKING_NUMBER_NAMES = {
+    "tracking",
+    "tracking_no",
+    "tracking_number",
+    "awb",
+    "awb_no",
+    "awb_number",
+    "waybill_no",
+    "waybill_number",
+}
+
+BULK_BATCH_SIZE = 500
+
+
+def field_name(key):
+    """Lowercase slug of the last segment of a (dotted) key"""
+    last = str(key).rsplit(".", 1)[-1]
+    return re.sub(r"[^a-z0-9]+", "_", last.lower()).strip("_")[:100]
+
+
+def normalize_value(value, name=""):
+    """Case- and whitespace-insensitive form of a value for exact lookups"""
+    value = " ".join(str(value).split()).lower()
+    if name in TRACKING_NUMBER_NAMES:
+        # Mistral analysis used to keep the whole line, e.g. "Tracking No: ABC123"
+        value = value.rsplit(":", 1)[-1].strip()
+    return value[:255]
+
+
+def build_fields(extracted_data):
+    """Unsaved ExtractedField rows for an ExtractedData instance"""
+    waybill_image = extracted_data.waybill_image
+    extraction_model = waybill_image.extraction_model
+    provider = extraction_model.name if extraction_model else ""
+
+    headers = {}
+    fields = []
+    for values in flatten_extracted_data(extracted_data.extracted_data):
+        if values["source"] in UNINDEXED_SOURCES:
+            continue
+
+        key = values.get("key") or ""
+        if values["source"] == "table":
+            # Table cells are keyed by the header cell of their column
+            column = (values["table_index"], values["column"])
+            if values["row"] == 1:
+                headers[column] = values["value"]
+            else:
+                key = headers.get(column, "")
+
+        value = "" if values["value"] is None else str(values["value"])
+        name = field_name(key)
+        fields.append(
+            ExtractedField(
+                waybill_image=waybill_image,
+                provider=provider,
+                source=values["source"],
+                key=str(key)[:255],
+                name=name,
+                value=value,
+                lookup_value=normalize_value(value, name),
+                confidence=values.get("confidence"),
+                table_index=values.get("table_index"),
+                row=values.get("row"),
+                column=values.get("column"),
+            )
+        )
+    return fields
+
+
+def index_new_extracted_data(extracted_data_list):
+    """Store the fields of newly created extracted data.
+
+    For rows saved with bulk_create, which sends no post_save signal; the
+    waybills must not have fields yet.
+    """
+    fields = ExtractedField.objects.bulk_create(
+        (
+            field
+            for extracted_data in extracted_data_list
+            for field in build_fields(extracted_data)
+        ),
+        batch_size=BULK_BATCH_SIZE,
+    )
+    return len(fields)
+
+
+def index_extracted_data(extracted_data):
+    """Replace the stored fields of a waybill with those of its extracted data"""
+    with transaction.atomic():
+        ExtractedField.objects.filter(
+            waybill_image_id=extracted_data.waybill_image_id
+        ).delete()
+        fields = ExtractedField.objects.bulk_create(
+            build_fields(extracted_data), batch_size=BULK_BATCH_SIZE
+        )
+    return len(fields)
@@ -0,0 +1,708 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Avg, Count, F, Max, Sum
+from django.utils import timezone
+
+from . import (
+    derivatives,
+    export_artifacts,
+    extractors,
+    fields,
+    ocr_cache,
+    response_archive,
+    telemetry,
+)
+from .models import (
+    ExtractedData,
+    ExtractionJob,
+    ExtractionStage,
+    ProcessingStatus,
+    UploadBatch,
+    WaybillImage,
+)
+from .throttling import map_ordered
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_batch(extraction_model, images):
+    """Persist the uploaded images and queue one extraction job per image.
+
+    Images whose content was already extracted with the same model are
+    completed straight from the OCR cache and never reach a worker. The rows
+    of a batch are written with one bulk insert per table, in a single
+    transaction.
+    """
+    content_hashes = []
+    for image in images:
+        # Streamed uploads were hashed and stored while they arrived; direct
+        # uploads are hashed by their job
+        content_hash = getattr(image, "content_hash", None)
+        if content_hash is None:
+            content_hash = ocr_cache.hash_file(image)
+        content_hashes.append(content_hash)
+
+    with transaction.atomic():
+        cached = ocr_cache.lookup_many(content_hashes, extraction_model)
+        batch = UploadBatch.objects.create(
+            extraction_model=extraction_model, request_id=telemetry.get_request_id()
+        )
+        waybill_images = WaybillImage.objects.bulk_create(
+            [
+                WaybillImage(
+                    image=getattr(image, "stored_name", image),
+                    extraction_model=extraction_model,
+                    content_hash=content_hash,
+                    status=(
+                        ProcessingStatus.DONE
+                        if content_hash in cached
+                        else ProcessingStatus.QUEUED
+                    ),
+                )
+                for image, content_hash in zip(images, content_hashes)
+            ]
+        )
+
+        cache_hits = [
+            waybill_image
+            for waybill_image in waybill_images
+            if waybill_image.content_hash in cached
+        ]
+        extracted_data = ExtractedData.objects.bulk_create(
+            [
+                ExtractedData(
+                    waybill_image=waybill_image,
+                    extracted_data=cached[waybill_image.content_hash],
+                )
+                for waybill_image in cache_hits
+            ]
+        )
+        # bulk_create sends no post_save, which indexes the fields otherwise
+        fields.index_new_extracted_data(extracted_data)
+
+        finished_at = timezone.now()
+        ExtractionJob.objects.bulk_create(
+            [
+                (
+                    ExtractionJob(
+                        batch=batch,
+                        waybill_image=waybill_image,
+                        status=ProcessingStatus.DONE,
+                        worker="cache",
+                        finished_at=finished_at,
+                    )
+                    if waybill_image.content_hash in cached
+                    else ExtractionJob(batch=batch, waybill_image=waybill_image)
+                )
+                for waybill_image in waybill_images
+            ]
+        )
+
+    for waybill_image in cache_hits:
+        logger.info("Waybill %s served from the OCR cache", waybill_image.id)
+    # Let idle in-process workers pick the new jobs up straight away
+    transaction.on_commit(wake_workers)
+    # Thumbnails are rendered eagerly, so the first list view does not wait
+    waybill_ids = [waybill_image.id for waybill_image in waybill_images]
+    transaction.on_commit(lambda: derivatives.schedule(waybill_ids))
+    return batch
+
+
+def claim_next_job(worker_name):
+    """Claim the oldest queued job, skipping rows other workers have locked"""
+    with transaction.atomic():
+        job = (
+            ExtractionJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ProcessingStatus.QUEUED)
+            .order_by("id")
+            .first()
+        )
+        if job is None:
+            return None
+
+        claimed = job.move_to(
+            ProcessingStatus.RUNNING,
+            worker=worker_name,
+            started_at=timezone.now(),
+            attempts=F("attempts") + 1,
+        )
+
+    return job if claimed else None
+
+
+def extraction_options(extraction_model):
+    options = {}
+    if extraction_model.field_rules:
+        options["field_rules"] = extraction_model.field_rules
+    return options
+
+
+def log_extraction(extractor, result):
+    logger.info(
+        "%s extraction completed: %d page(s), %d call(s) in %.2fs",
+        extractor.label,
+        result.pages,
+        result.calls,
+        result.seconds,
+        extra={
+            "engine": result.engine,
+            "pages": result.pages,
+            "calls": result.calls,
+            "seconds": result.seconds,
+        },
+    )
+
+
+def extract_waybill(waybill_image):
+    """Run the configured extraction engine over a stored waybill image.
+
+    Returns the ExtractionResult; its data is what gets stored.
+    """
+    extraction_model = waybill_image.extraction_model
+    logger.info("Starting extraction with %s", extraction_model.name)
+    extractor = extractors.for_model(extraction_model)
+    result = extractor.extract(
+        extractors.Document.from_storage(
+            waybill_image.image.name, waybill_image.image.storage
+        ),
+        extraction_options(extraction_model),
+    )
+    log_extraction(extractor, result)
+    return result
+
+
+async def aextract_waybill(waybill_image):
+    """extract_waybill() on the event loop; extraction_model must be loaded"""
+    extraction_model = waybill_image.extraction_model
+    logger.info("Starting extraction with %s", extraction_model.name)
+    extractor = extractors.for_model(extraction_model)
+    result = await extractor.aextract(
+        extractors.Document.from_storage(
+            waybill_image.image.name, waybill_image.image.storage
+        ),
+        extraction_options(extraction_model),
+    )
+    log_extraction(extractor, result)
+    return result
+
+
+def record_stages(waybill_image, result):
+    """Store the per-stage metrics of an extraction"""
+    ExtractionStage.objects.bulk_create(
+        ExtractionStage(
+            waybill_image=waybill_image,
+            extraction_model=waybill_image.extraction_model,
+            **stage,
+        )
+        for stage in result.stages
+    )
+
+
+def ensure_content_hash(waybill_image):
+    """Hash an image that was uploaded straight to storage.
+
+    The app never saw the bytes of direct uploads, so their hash, which the
+    OCR cache is keyed by, is only taken here, off the request path.
+    """
+    if waybill_image.content_hash:
+        return
+    with waybill_image.image.storage.open(waybill_image.image.name, "rb") as image:
+        waybill_image.content_hash = ocr_cache.hash_file(image)
+    WaybillImage.objects.filter(pk=waybill_image.pk).update(
+        content_hash=waybill_image.content_hash
+    )
+    # Their derivatives could not be scheduled at upload time either
+    transaction.on_commit(lambda: derivatives.schedule([waybill_image.id]))
+
+
+def run_job(job):
+    """Process a claimed job and record the outcome"""
+    # Log records of the job carry the request id of its upload
+    with telemetry.request_id_context(job.batch.request_id):
+        return _run_job(job)
+
+
+def _run_job(job):
+    waybill_image = job.waybill_image
+    logger.info("Job %s: extracting waybill %s", job.id, waybill_image.id)
+
+    # Images hashed at upload were looked up by enqueue_batch already
+    looked_up = bool(waybill_image.content_hash)
+    ensure_content_hash(waybill_image)
+    # A duplicate may have been extracted since this job was queued
+    extracted_data = ocr_cache.lookup(
+        waybill_image.content_hash,
+        waybill_image.extraction_model,
+        count_miss=not looked_up,
+    )
+    result = None
+    if extracted_data is None:
+        try:
+            result = extract_waybill(waybill_image)
+        except Exception as e:
+            logger.warning("Job %s: extraction failed: %s", job.id, e)
+            fail_job(job, str(e))
+            return job
+
+        extracted_data = result.data
+        ocr_cache.store(
+            waybill_image.content_hash, waybill_image.extraction_model, result
+        )
+
+    save_result(job, extracted_data, result)
+    return job
+
+
+async def arun_job(job):
+    """run_job() on the event loop; only the provider calls stay on it.
+
+    Database work goes through sync_to_async, which runs it on one shared
+    thread, so the loop never blocks on a query.
+    """
+    with telemetry.request_id_context(job.batch.request_id):
+        return await _arun_job(job)
+
+
+async def _arun_job(job):
+    waybill_image = job.waybill_image
+    logger.info("Job %s: extracting waybill %s", job.id, waybill_image.id)
+
+    looked_up = bool(waybill_image.content_hash)
+    await sync_to_async(ensure_content_hash)(waybill_image)
+    extracted_data = await sync_to_async(ocr_cache.lookup)(
+        waybill_image.content_hash,
+        waybill_image.extraction_model,
+        count_miss=not looked_up,
+    )
+    result = None
+    if extracted_data is None:
+        try:
+            result = await aextract_waybill(waybill_image)
+        except Exception as e:
+            logger.warning("Job %s: extraction failed: %s", job.id, e)
+            await sync_to_async(fail_job)(job, str(e))
+            return job
+
+        extracted_data = result.data
+        await sync_to_async(ocr_cache.store)(
+            waybill_image.content_hash, waybill_image.extraction_model, result
+        )
+
+    await sync_to_async(save_result)(job, extracted_data, result)
+    return job
+
+
+def save_result(job, extracted_data, result=None):
+    """Store a job's extracted data (and the result behind it) and finish it"""
+    waybill_image = job.waybill_image
+    engine = result.engine if result is not None else ""
+    # Written outside the transaction, and removed again if it rolls back
+    archived = None
+    if result is not None:
+        archived = response_archive.write(waybill_image, result.engine, result.raw)
+    try:
+        with telemetry.span("db_write", engine), transaction.atomic():
+            ExtractedData.objects.update_or_create(
+                waybill_image=waybill_image,
+                defaults={
+                    "extracted_data": extracted_data,
+                    "extracted_at": timezone.now(),
+                },
+            )
+            if result is not None:
+                record_stages(waybill_image, result)
+            response_archive.store(archived)
+            job.move_to(ProcessingStatus.DONE, error="", finished_at=timezone.now())
+    except Exception:
+        response_archive.discard(archived)
+        raise
+
+    logger.info("Job %s: waybill %s processed", job.id, waybill_image.id)
+    schedule_export_if_finished(job)
+
+
+def fail_job(job, error):
+    """Mark a job failed, or put it back in the queue if it has attempts left"""
+    job.move_to(ProcessingStatus.FAILED, error=error, finished_at=timezone.now())
+    if job.attempts < settings.EXTRACTION_JOB_MAX_ATTEMPTS:
+        job.move_to(ProcessingStatus.QUEUED, worker="", started_at=None)
+    else:
+        schedule_export_if_finished(job)
+
+
+def schedule_export_if_finished(job):
+    """Pre-generate the batch export once its last job has finished"""
+    pending = job.batch.jobs.filter(
+        status__in=[ProcessingStatus.QUEUED, ProcessingStatus.RUNNING]
+    )
+    if not pending.exists():
+        export_artifacts.schedule(
+            job.batch.jobs.values_list("waybill_image_id", flat=True)
+        )
+
+
+def requeue_stale_jobs(timeout=None):
+    """Return jobs stuck in running (e.g. after a worker crash) to the queue"""
+    timeout = timeout or settings.EXTRACTION_JOB_TIMEOUT
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale_jobs = ExtractionJob.objects.filter(
+        status=ProcessingStatus.RUNNING, started_at__lt=cutoff
+    )
+
+    requeued = 0
+    for job in stale_jobs:
+        if job.attempts < settings.EXTRACTION_JOB_MAX_ATTEMPTS:
+            requeued += job.move_to(ProcessingStatus.QUEUED, worker="", started_at=None)
+        else:
+            job.move_to(
+                ProcessingStatus.FAILED,
+                error="Job timed out",
+                finished_at=timezone.now(),
+            )
+    return requeued
+
+
+def _drain_loop(worker_name):
+    processed = 0
+    while True:
+        job = claim_next_job(worker_name)
+        if job is None:
+            return processed
+        run_job(job)
+        processed += 1
+
+
+def drain(worker_name="drain", concurrency=1):
+    """Process queued jobs until the queue is empty.
+
+    With concurrency above 1 that many threads drain the queue side by side;
+    provider calls stay within the per-provider limits either way.
+    """
+    if concurrency <= 1:
+        return _drain_loop(worker_name)
+
+    def drain_thread(idx):
+        try:
+            return _drain_loop(f"{worker_name}:{idx}")
+        finally:
+            connection.close()
+
+    return sum(map_ordered(drain_thread, range(concurrency), concurrency))
+
+
+def batch_status(batch):
+    """Per-image progress for an upload batch"""
+    return summarize_batch(batch, batch.jobs.order_by("id"))
+
+
+async def abatch_status(batch):
+    return summarize_batch(batch, [job async for job in batch.jobs.order_by("id")])
+
+
+def summarize_batch(batch, jobs):
+    counts = {status: 0 for status in ProcessingStatus.values}
+    images = []
+    for job in jobs:
+        counts[job.status] += 1
+        images.append(
+            {
+                "id": job.waybill_image_id,
+                "status": job.status,
+                "attempts": job.attempts,
+                "error": job.error,
+            }
+        )
+
+    return {
+        "batch_id": str(batch.id),
+        "total": len(images),
+        "counts": counts,
+        "finished": counts[ProcessingStatus.QUEUED] == 0
+        and counts[ProcessingStatus.RUNNING] == 0,
+        "images": images,
+    }
+
+
+def stage_stats():
+    """Pages, escalation rate, latency and cost per extraction model and stage.
+
+    The escalation rate of a cascade's first stage is the share of its pages
+    sent on to the escalation engine, the figure to watch when tuning
+    escalation_threshold.
+    """
+    rows = (
+        ExtractionStage.objects.values("extraction_model__name", "stage", "engine")
+        .annotate(
+            extractions=Count("id"),
+            pages=Sum("pages"),
+            escalated_pages=Sum("escalated_pages"),
+            calls=Sum("calls"),
+            cost=Sum("cost"),
+            avg_seconds=Avg("seconds"),
+            max_seconds=Max("seconds"),
+        )
+        .order_by("extraction_model__name", "stage", "engine")
+    )
+
+    stats = []
+    for row in rows:
+        pages = row["pages"] or 0
+        stats.append(
+            {
+                "extraction_model": row["extraction_model__name"],
+                "stage": row["stage"],
+                "engine": row["engine"],
+                "extractions": row["extractions"],
+                "pages": pages,
+                "escalated_pages": row["escalated_pages"],
+                "escalation_rate": row["escalated_pages"] / pages if pages else 0.0,
+                "calls": row["calls"],
+                "cost": round(row["cost"], 4),
+                "cost_per_page": round(row["cost"] / pages, 5) if pages else 0.0,
+                "avg_seconds": round(row["avg_seconds"], 3),
+                "max_seconds": round(row["max_seconds"], 3),
+            }
+        )
+    return stats
+
+
+class StaleJobSweep:
+    """Calls requeue_stale_jobs() at most once per EXTRACTION_JOB_TIMEOUT.
+
+    Every worker pool sweeps, so jobs left running by a process that was
+    restarted or killed go back to the queue without a separate command.
+    """
+
+    def __init__(self):
+        self._due_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_due(self):
+        return time.monotonic() >= self._due_at
+
+    def __call__(self, worker_name):
+        with self._lock:
+            if not self.is_due():
+                return 0
+            self._due_at = time.monotonic() + settings.EXTRACTION_JOB_TIMEOUT
+        try:
+            requeued = requeue_stale_jobs()
+        except Exception as e:
+            logger.warning(
+                "Worker %s: could not requeue stale jobs: %s", worker_name, e
+            )
+            return 0
+        if requeued:
+            logger.info("Worker %s: requeued %d stale jobs", worker_name, requeued)
+        return requeued
+
+
+class WorkerPool:
+    """Threads that drain the job queue inside the current process"""
+
+    def __init__(self, size, poll_interval):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.threads = []
+        self._sweep = StaleJobSweep()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def start(self):
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for idx in range(self.size):
+            thread = threading.Thread(
+                target=self._loop,
+                args=(f"{prefix}:{idx}",),
+                name=f"extraction-worker-{idx}",
+                daemon=True,
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _loop(self, worker_name):
+        while not self._stopping.is_set():
+            close_old_connections()
+            self._sweep(worker_name)
+            try:
+                job = claim_next_job(worker_name)
+            except Exception as e:
+                logger.warning("Worker %s: could not claim a job: %s", worker_name, e)
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                run_job(job)
+            except Exception as e:
+                # e.g. "database is locked" while storing the result; keep the
+                # thread alive and give the job back to the queue
+                logger.exception("Worker %s: job %s crashed", worker_name, job.id)
+                try:
+                    fail_job(job, str(e))
+                except Exception:
+                    # The stale job sweep requeues it after the job timeout
+                    pass
+
+        connection.close()
+
+
+def claim_job_for_loop(worker_name):
+    """claim_next_job() with the relations arun_job() reads already loaded"""
+    job = claim_next_job(worker_name)
+    if job is not None:
+        # Lazy loads would be queries on the event loop, which Django forbids
+        job.batch
+        job.waybill_image.extraction_model
+    return job
+
+
+class AsyncWorkerPool:
+    """Runs up to `size` jobs at once as tasks on one event loop thread.
+
+    Jobs of engines with async clients wait on their provider calls without
+    holding a thread, so one process can keep hundreds of calls in flight.
+    Same interface as WorkerPool.
+    """
+
+    def __init__(self, size, poll_interval):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.threads = []
+        self._loop = None
+        self._wakeup = None
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+        self._sweep = StaleJobSweep()
+
+    def start(self):
+        thread = threading.Thread(
+            target=asyncio.run,
+            args=(self._main(),),
+            name="extraction-loop",
+            daemon=True,
+        )
+        thread.start()
+        self.threads.append(thread)
+        self._ready.wait()
+
+    def wake(self):
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # The loop has already finished
+            pass
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.wake()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._ready.set()
+
+        worker_name = f"{socket.gethostname()}:{os.getpid()}:async"
+        slots = asyncio.Semaphore(self.size)
+        tasks = set()
+        while not self._stopping.is_set():
+            await slots.acquire()
+            await sync_to_async(close_old_connections)()
+            if self._sweep.is_due():
+                await sync_to_async(self._sweep)(worker_name)
+            try:
+                job = await sync_to_async(claim_job_for_loop)(worker_name)
+            except Exception as e:
+                logger.warning("Worker %s: could not claim a job: %s", worker_name, e)
+                job = None
+
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            task = asyncio.create_task(self._run(job, worker_name, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # Finish the jobs in flight before the loop closes
+        if tasks:
+            await asyncio.gather(*tasks)
+        await sync_to_async(connection.close)()
+
+    async def _run(self, job, worker_name, slots):
+        try:
+            await arun_job(job)
+        except Exception as e:
+            logger.exception("Worker %s: job %s crashed", worker_name, job.id)
+            try:
+                await sync_to_async(fail_job)(job, str(e))
+            except Exception:
+                # The stale job sweep requeues it after the job timeout
+                pass
+        finally:
+            slots.release()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def ensure_workers():
+    """Start the in-process worker pool once per process if it is enabled.
+
+    Called when the web application loads and again on uploads. A pool
+    inherited through fork (e.g. gunicorn --preload) has no threads, so a
+    forked process starts its own.
+    """
+    global _pool, _pool_pid
+    if settings.EXTRACTION_WORKERS <= 0:
+        return None
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool_pid = os.getpid()
+            if settings.EXTRACTION_ASYNC_CONCURRENCY > 0:
+                _pool = AsyncWorkerPool(
+                    settings.EXTRACTION_ASYNC_CONCURRENCY,
+                    settings.EXTRACTION_POLL_INTERVAL,
+                )
+            else:
+                _pool = WorkerPool(
+                    settings.EXTRACTION_WORKERS, settings.EXTRACTION_POLL_INTERVAL
+                )
+            _pool.start()
+    return _pool
+
+
+def wake_workers():
+    if _pool is not None:
+        _pool.wake()
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from waybill.fields import BULK_BATCH_SIZE, build_fields
+from waybill.models import ExtractedData, ExtractedField
+
+
+class Command(BaseCommand):
+    help = "Populate ExtractedField rows from existing ExtractedData in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="ExtractedData rows indexed per transaction",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Re-index waybills that already have fields",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        queryset = ExtractedData.objects.select_related(
+            "waybill_image__extraction_model"
+        ).order_by("pk")
+        if not options["rebuild"]:
+            queryset = queryset.exclude(
+                Exists(
+                    ExtractedField.objects.filter(
+                        waybill_image_id=OuterRef("waybill_image_id")
+                    )
+                )
+            )
+
+        last_pk = 0
+        indexed = 0
+        created = 0
+        while True:
+            # Keyset pagination keeps every batch query cheap
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                ExtractedField.objects.filter(
+                    waybill_image_id__in=[data.waybill_image_id for data in batch]
+                ).delete()
+                rows = [field for data in batch for field in build_fields(data)]
+                ExtractedField.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+
+            last_pk = batch[-1].pk
+            indexed += len(batch)
+            created += len(rows)
+            self.stdout.write(f"Indexed {indexed} waybills ({created} fields)")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Backfilled {created} fields for {indexed} waybills")
+        )
@@ -1,49 +1,66 @@
 from django.core.management.base import BaseCommand
 from waybill.models import ExtractionModel
 
+# name, engine, description
+EXTRACTION_MODELS = [
+    (
+        "Mistral",
+        "mistral",
+        "Extract data from waybills using Mistral AI's vision capabilities",
+    ),
+    ("AWS Textract", "textract", "Extract data from waybills using AWS Textract"),
+    (
+        "Tesseract",
+        "tesseract",
+        "Extract data from waybills locally with Tesseract OCR; no provider calls",
+    ),
+]
+
+FAKE_MODEL = (
+    "Fake",
+    "fake",
+    "Deterministic local engine for load testing; no provider calls",
+)
+
 
 class Command(BaseCommand):
     help = "Creates initial extraction models"
 
-    def handle(self, *args, **kwargs):
-        # Create Mistral model
-        mistral_model, created = ExtractionModel.objects.get_or_create(
-            name="Mistral",
-            defaults={
-                "description": "Extract data from waybills using Mistral AI's vision capabilities",
-                "is_active": True,
-            },
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fake",
+            action="store_true",
+            help="Also create the load-testing model backed by the fake engine",
         )
 
-        if created:
-            self.stdout.write(
-                self.style.SUCCESS(f"Created Mistral extraction model: {mistral_model}")
-            )
-        else:
-            self.stdout.write(
-                self.style.WARNING(
-                    f"Mistral extraction model already exists: {mistral_model}"
-                )
-            )
+    def handle(self, *args, **kwargs):
+        extraction_models = list(EXTRACTION_MODELS)
+        if kwargs["fake"]:
+            extraction_models.append(FAKE_MODEL)
 
-        # Create AWS Textract model
-        textract_model, created = ExtractionModel.objects.get_or_create(
-            name="AWS Textract",
-            defaults={
-                "description": "Extract data from waybills using AWS Textract",
-                "is_active": True,
-            },
-        )
+        for name, engine, description in extraction_models:
+            extraction_model, created = ExtractionModel.objects.get_or_create(
+                name=name,
+                defaults={
+                    "engine": engine,
+                    "description": description,
+                    "is_active": True,
+                },
+            )
 
-        if created:
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f"Created AWS Textract extraction model: {textract_model}"
+            if created:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Created {name} extraction model: {extraction_model}"
+                    )
                 )
-            )
-        else:
+                continue
+
+            if not extraction_model.engine:
+                extraction_model.engine = engine
+                extraction_model.save(update_fields=["engine"])
             self.stdout.write(
                 self.style.WARNING(
-                    f"AWS Textract extraction model already exists: {textract_model}"
+                    f"{name} extraction model already exists: {extraction_model}"
                 )
             )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from waybill import ocr_cache
+from waybill.models import ExtractionModel
+
+
+class Command(BaseCommand):
+    help = "Delete cached OCR results so the next upload calls the provider again"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hash", help="Only entries for this image SHA-256")
+        parser.add_argument("--model", type=int, help="Only entries for this model id")
+        parser.add_argument(
+            "--expired", action="store_true", help="Only entries older than the TTL"
+        )
+        parser.add_argument(
+            "--all", action="store_true", help="Delete every cached result"
+        )
+
+    def handle(self, *args, **options):
+        if not (options["hash"] or options["model"] or options["expired"]):
+            if not options["all"]:
+                raise CommandError("Pass --hash, --model, --expired or --all")
+
+        extraction_model = None
+        if options["model"]:
+            try:
+                extraction_model = ExtractionModel.objects.get(id=options["model"])
+            except ExtractionModel.DoesNotExist:
+                raise CommandError(f"Extraction model {options['model']} not found")
+
+        deleted = ocr_cache.invalidate(
+            content_hash=options["hash"],
+            extraction_model=extraction_model,
+            expired_only=options["expired"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} cached results"))
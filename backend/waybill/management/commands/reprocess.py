@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from waybill import ocr_cache, response_archive
+from waybill.models import ExtractedData, ProviderResponse
+
+
+def run_now(func, *args):
+    """A finished Future for func(*args), for parsing without workers"""
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild ExtractedData from archived provider responses, re-running "
+        "only the local parsing"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--engine", help="Only responses parsed by this engine")
+        parser.add_argument(
+            "--model", type=int, help="Only waybills of this extraction model id"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Responses parsed and saved per batch",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Parsing processes (0 parses in this process)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report how many waybills would change without saving",
+        )
+
+    def handle(self, *args, **options):
+        queryset = ProviderResponse.objects.select_related(
+            "waybill_image__extraction_model"
+        ).order_by("pk")
+        if options["engine"]:
+            queryset = queryset.filter(engine=options["engine"])
+        if options["model"]:
+            queryset = queryset.filter(
+                waybill_image__extraction_model_id=options["model"]
+            )
+
+        executor = None
+        if options["workers"] > 0:
+            # Spawned workers set Django up themselves to import the engines
+            executor = ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+
+        totals = {"parsed": 0, "changed": 0, "failed": 0}
+        last_pk = 0
+        try:
+            while True:
+                # Keyset pagination keeps every batch query cheap
+                batch = list(queryset.filter(pk__gt=last_pk)[: options["batch_size"]])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                self.reprocess_batch(batch, executor, options["dry_run"], totals)
+                self.stdout.write(
+                    f"Parsed {totals['parsed']} responses: {totals['changed']} "
+                    f"changed, {totals['failed']} failed"
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        verb = "would change" if options["dry_run"] else "updated"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reprocessed {totals['parsed']} responses; {totals['changed']} "
+                f"waybills {verb}, {totals['failed']} failed"
+            )
+        )
+
+    def reprocess_batch(self, batch, executor, dry_run, totals):
+        submit = executor.submit if executor is not None else run_now
+        futures = {}
+        for response in batch:
+            try:
+                data = response_archive.read(response)
+            except OSError as e:
+                self.stderr.write(f"Waybill {response.waybill_image_id}: {e}")
+                totals["failed"] += 1
+                continue
+            futures[response] = submit(response_archive.reparse, response.codec, data)
+
+        parsed = {}
+        for response, future in futures.items():
+            try:
+                parsed[response] = future.result()
+            except Exception as e:
+                self.stderr.write(f"Waybill {response.waybill_image_id}: {e}")
+                totals["failed"] += 1
+        totals["parsed"] += len(parsed)
+
+        stored = {
+            data.waybill_image_id: data
+            for data in ExtractedData.objects.filter(
+                waybill_image_id__in=[response.waybill_image_id for response in parsed]
+            )
+        }
+        changed = [
+            (response, extracted_data)
+            for response, extracted_data in parsed.items()
+            if response.waybill_image_id not in stored
+            or stored[response.waybill_image_id].extracted_data != extracted_data
+        ]
+        totals["changed"] += len(changed)
+        if dry_run:
+            return
+
+        with transaction.atomic():
+            for response, extracted_data in changed:
+                waybill_image = response.waybill_image
+                # Saving re-indexes the fields and drops stale export artifacts;
+                # the new time gives exports of the waybill a new ETag
+                ExtractedData.objects.update_or_create(
+                    waybill_image=waybill_image,
+                    defaults={
+                        "extracted_data": extracted_data,
+                        "extracted_at": timezone.now(),
+                    },
+                )
+                ocr_cache.refresh(
+                    waybill_image.content_hash,
+                    waybill_image.extraction_model,
+                    extracted_data,
+                )
@@ -0,0 +1,66 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from waybill import jobs
+
+
+class Command(BaseCommand):
+    help = "Run extraction workers that drain the queued waybill jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=max(settings.EXTRACTION_WORKERS, 1),
+            help="Number of worker threads",
+        )
+        parser.add_argument(
+            "--async-concurrency",
+            type=int,
+            default=settings.EXTRACTION_ASYNC_CONCURRENCY,
+            help="Run this many jobs at once on an event loop instead of threads",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.EXTRACTION_POLL_INTERVAL,
+            help="Seconds an idle worker waits before checking the queue again",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Process the jobs currently queued and exit",
+        )
+
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale jobs"))
+
+        if options["burst"]:
+            processed = jobs.drain(concurrency=options["workers"])
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs"))
+            return
+
+        if options["async_concurrency"] > 0:
+            pool = jobs.AsyncWorkerPool(
+                options["async_concurrency"], options["poll_interval"]
+            )
+            started = f"Started an extraction loop for {pool.size} concurrent jobs"
+        else:
+            pool = jobs.WorkerPool(options["workers"], options["poll_interval"])
+            started = f"Started {pool.size} extraction workers"
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(started))
+
+        # Finish the jobs in flight before exiting on Ctrl+C / SIGTERM
+        signal.signal(signal.SIGTERM, lambda *args: pool.stop())
+        try:
+            for thread in pool.threads:
+                while thread.is_alive():
+                    thread.join(1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers...")
+            pool.stop()
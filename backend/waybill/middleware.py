@@ -0,0 +1,81 @@
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import telemetry
+
+# Incoming ids are echoed into logs and headers, so only accept plain tokens
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    """Tags each request with an id, from X-Request-ID or a new one.
+
+    The id is bound for log records emitted while the request is handled
+    and returned in the X-Request-ID response header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI, stay async so async views run on the event loop
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request_id = self.request_id(request)
+        with telemetry.request_id_context(request_id):
+            response = self.get_response(request)
+        response["X-Request-ID"] = request_id
+        return response
+
+    async def __acall__(self, request):
+        request_id = self.request_id(request)
+        with telemetry.request_id_context(request_id):
+            response = await self.get_response(request)
+        response["X-Request-ID"] = request_id
+        return response
+
+    def request_id(self, request):
+        request_id = request.headers.get("X-Request-ID", "")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = telemetry.new_request_id()
+        request.request_id = request_id
+        return request_id
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise that does not force the middleware chain into a thread.
+
+    WhiteNoiseMiddleware is sync-only, so under ASGI Django would run every
+    request below it, async views included, through a thread. Only static
+    files need the thread here.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
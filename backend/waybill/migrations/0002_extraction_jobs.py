@@ -0,0 +1,70 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:33
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+def processed_to_status(apps, schema_editor):
+    WaybillImage = apps.get_model('waybill', 'WaybillImage')
+    WaybillImage.objects.filter(processed=True).update(status='done')
+    # Unprocessed rows were left behind by failed synchronous uploads
+    WaybillImage.objects.filter(processed=False).update(status='failed')
+
+
+def status_to_processed(apps, schema_editor):
+    WaybillImage = apps.get_model('waybill', 'WaybillImage')
+    WaybillImage.objects.filter(status='done').update(processed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waybill', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='waybillimage',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10),
+        ),
+        migrations.RunPython(processed_to_status, status_to_processed),
+        migrations.RemoveField(
+            model_name='waybillimage',
+            name='processed',
+        ),
+        migrations.CreateModel(
+            name='UploadBatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('extraction_model', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='waybill.extractionmodel')),
+            ],
+            options={
+                'verbose_name': 'Upload Batch',
+                'verbose_name_plural': 'Upload Batches',
+            },
+        ),
+        migrations.CreateModel(
+            name='ExtractionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('waybill_image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='waybill.waybillimage')),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='waybill.uploadbatch')),
+            ],
+            options={
+                'verbose_name': 'Extraction Job',
+                'verbose_name_plural': 'Extraction Jobs',
+                'indexes': [models.Index(fields=['status', 'id'], name='waybill_ext_status_88f448_idx')],
+            },
+        ),
+    ]
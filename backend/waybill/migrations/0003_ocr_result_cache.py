@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waybill', '0002_extraction_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='waybillimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='CachedExtraction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64, unique=True)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('extracted_data', models.JSONField()),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('extraction_model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='waybill.extractionmodel')),
+            ],
+            options={
+                'verbose_name': 'Cached Extraction',
+                'verbose_name_plural': 'Cached Extractions',
+            },
+        ),
+    ]
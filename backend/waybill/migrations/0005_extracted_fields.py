@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waybill', '0004_export_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedField',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(blank=True, max_length=100)),
+                ('source', models.CharField(max_length=20)),
+                ('key', models.CharField(blank=True, max_length=255)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('value', models.TextField(blank=True)),
+                ('lookup_value', models.CharField(blank=True, max_length=255)),
+                ('confidence', models.FloatField(blank=True, null=True)),
+                ('table_index', models.PositiveIntegerField(blank=True, null=True)),
+                ('row', models.PositiveIntegerField(blank=True, null=True)),
+                ('column', models.PositiveIntegerField(blank=True, null=True)),
+                ('waybill_image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fields', to='waybill.waybillimage')),
+            ],
+            options={
+                'verbose_name': 'Extracted Field',
+                'verbose_name_plural': 'Extracted Fields',
+                'indexes': [models.Index(fields=['name', 'lookup_value'], name='waybill_ext_name_13d2cd_idx'), models.Index(fields=['lookup_value'], name='waybill_ext_lookup__89f1c8_idx'), models.Index(fields=['waybill_image', 'confidence'], name='waybill_ext_waybill_3b368a_idx')],
+            },
+        ),
+    ]
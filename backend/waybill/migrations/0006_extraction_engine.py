@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:17
+
+from django.db import migrations, models
+
+# Engines for the models created before the engine field existed
+ENGINES_BY_NAME = {
+    'aws textract': 'textract',
+    'mistral': 'mistral',
+}
+
+
+def set_engines(apps, schema_editor):
+    ExtractionModel = apps.get_model('waybill', 'ExtractionModel')
+    for extraction_model in ExtractionModel.objects.all():
+        engine = ENGINES_BY_NAME.get(extraction_model.name.lower())
+        if engine:
+            extraction_model.engine = engine
+            extraction_model.save(update_fields=['engine'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waybill', '0005_extracted_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionmodel',
+            name='engine',
+            field=models.SlugField(blank=True),
+        ),
+        migrations.RunPython(set_engines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waybill', '0006_extraction_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionmodel',
+            name='escalation_engine',
+            field=models.SlugField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='extractionmodel',
+            name='escalation_threshold',
+            field=models.FloatField(default=80.0),
+        ),
+        migrations.CreateModel(
+            name='ExtractionStage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.PositiveSmallIntegerField(default=1)),
+                ('engine', models.SlugField()),
+                ('pages', models.PositiveIntegerField(default=0)),
+                ('escalated_pages', models.PositiveIntegerField(default=0)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('seconds', models.FloatField(default=0)),
+                ('cost', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('extraction_model', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='waybill.extractionmodel')),
+                ('waybill_image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stages', to='waybill.waybillimage')),
+            ],
+            options={
+                'verbose_name': 'Extraction Stage',
+                'verbose_name_plural': 'Extraction Stages',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waybill', '0007_extraction_cascade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderResponse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('engine', models.CharField(db_index=True, max_length=101)),
+                ('codec', models.CharField(max_length=10)),
+                ('file', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('raw_size', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('waybill_image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='provider_response', to='waybill.waybillimage')),
+            ],
+            options={
+                'verbose_name': 'Provider Response',
+                'verbose_name_plural': 'Provider Responses',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waybill', '0008_provider_responses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionmodel',
+            name='field_rules',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
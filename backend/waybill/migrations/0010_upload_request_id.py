@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waybill', '0009_extraction_field_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadbatch',
+            name='request_id',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:10
+
+from django.db import migrations, models
+
+
+def copy_waybill_ids(apps, schema_editor):
+    ExportJob = apps.get_model("waybill", "ExportJob")
+    for job in ExportJob.objects.all():
+        ids = sorted(job.waybills.values_list("id", flat=True))
+        job.waybill_ids = ids
+        job.first_waybill_id = ids[0] if ids else None
+        job.last_waybill_id = ids[-1] if ids else None
+        job.save(update_fields=["waybill_ids", "first_waybill_id", "last_waybill_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waybill', '0010_upload_request_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='waybill_ids',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='first_waybill_id',
+            field=models.BigIntegerField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='last_waybill_id',
+            field=models.BigIntegerField(db_index=True, null=True),
+        ),
+        migrations.RunPython(copy_waybill_ids, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='exportjob',
+            name='waybills',
+        ),
+    ]
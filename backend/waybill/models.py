@@ -1,9 +1,36 @@
+import uuid
+
 from django.db import models
 from django.utils import timezone
 
 
+class ProcessingStatus(models.TextChoices):
+    QUEUED = "queued", "Queued"
+    RUNNING = "running", "Running"
+    DONE = "done", "Done"
+    FAILED = "failed", "Failed"
+
+
+# States a job or image may move to, mapped to the states it may come from
+STATUS_TRANSITIONS = {
+    ProcessingStatus.QUEUED: {ProcessingStatus.RUNNING, ProcessingStatus.FAILED},
+    ProcessingStatus.RUNNING: {ProcessingStatus.QUEUED},
+    ProcessingStatus.DONE: {ProcessingStatus.RUNNING},
+    ProcessingStatus.FAILED: {ProcessingStatus.RUNNING},
+}
+
+
 class ExtractionModel(models.Model):
     name = models.CharField(max_length=100)
+    # Slug of the engine in waybill.extractors that runs this model
+    engine = models.SlugField(max_length=50, blank=True)
+    # Cascade mode: pages where `engine` returned a value below the
+    # threshold (0-100) are extracted again with escalation_engine
+    escalation_engine = models.SlugField(max_length=50, blank=True)
+    escalation_threshold = models.FloatField(default=80.0)
+    # Rules that pick typed fields out of text output (Mistral markdown);
+    # empty uses DEFAULT_RULES in waybill.extractors.rules
+    field_rules = models.JSONField(default=list, blank=True)
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
 
@@ -18,10 +45,16 @@ class ExtractionModel(models.Model):
 class WaybillImage(models.Model):
     image = models.ImageField(upload_to="waybills/")
     uploaded_at = models.DateTimeField(default=timezone.now)
-    processed = models.BooleanField(default=False)
+    status = models.CharField(
+        max_length=10,
+        choices=ProcessingStatus.choices,
+        default=ProcessingStatus.QUEUED,
+        db_index=True,
+    )
     extraction_model = models.ForeignKey(
         ExtractionModel, on_delete=models.SET_NULL, null=True
     )
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
 
     class Meta:
         verbose_name = "Waybill Image"
@@ -30,6 +63,10 @@ class WaybillImage(models.Model):
     def __str__(self):
         return f"Waybill {self.id} - {self.uploaded_at}"
 
+    @property
+    def processed(self):
+        return self.status == ProcessingStatus.DONE
+
 
 class ExtractedData(models.Model):
     waybill_image = models.OneToOneField(WaybillImage, on_delete=models.CASCADE)
@@ -42,3 +79,209 @@ class ExtractedData(models.Model):
 
     def __str__(self):
         return f"Data for Waybill {self.waybill_image.id}"
+
+
+class ExtractedField(models.Model):
+    """One extracted value, denormalized from ExtractedData for indexed lookups"""
+
+    waybill_image = models.ForeignKey(
+        WaybillImage, on_delete=models.CASCADE, related_name="fields"
+    )
+    provider = models.CharField(max_length=100, blank=True)
+    source = models.CharField(max_length=20)
+    key = models.CharField(max_length=255, blank=True)
+    # Last segment of the key as a lowercase slug, e.g. "tracking_number"
+    name = models.CharField(max_length=100, blank=True)
+    value = models.TextField(blank=True)
+    # Normalized, truncated value used for exact-match lookups
+    lookup_value = models.CharField(max_length=255, blank=True)
+    confidence = models.FloatField(null=True, blank=True)
+    table_index = models.PositiveIntegerField(null=True, blank=True)
+    row = models.PositiveIntegerField(null=True, blank=True)
+    column = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Extracted Field"
+        verbose_name_plural = "Extracted Fields"
+        indexes = [
+            models.Index(fields=["name", "lookup_value"]),
+            models.Index(fields=["lookup_value"]),
+            models.Index(fields=["waybill_image", "confidence"]),
+        ]
+
+    def __str__(self):
+        return f"{self.key or self.source} = {self.value[:50]}"
+
+
+class ExtractionStage(models.Model):
+    """Pages, calls, latency and cost of one engine run for a waybill"""
+
+    waybill_image = models.ForeignKey(
+        WaybillImage, on_delete=models.CASCADE, related_name="stages"
+    )
+    extraction_model = models.ForeignKey(
+        ExtractionModel, on_delete=models.SET_NULL, null=True
+    )
+    # 1 for the first engine, 2 for the escalation engine of a cascade
+    stage = models.PositiveSmallIntegerField(default=1)
+    engine = models.SlugField(max_length=50)
+    pages = models.PositiveIntegerField(default=0)
+    # Pages this stage passed on to the next one
+    escalated_pages = models.PositiveIntegerField(default=0)
+    calls = models.PositiveIntegerField(default=0)
+    seconds = models.FloatField(default=0)
+    cost = models.FloatField(default=0)  # USD, at list price
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = "Extraction Stage"
+        verbose_name_plural = "Extraction Stages"
+
+    def __str__(self):
+        return f"Stage {self.stage} ({self.engine}) for Waybill {self.waybill_image_id}"
+
+
+class ProviderResponse(models.Model):
+    """Compressed raw provider output behind a waybill's ExtractedData"""
+
+    waybill_image = models.OneToOneField(
+        WaybillImage, on_delete=models.CASCADE, related_name="provider_response"
+    )
+    # Engine that parses the response; a cascade joins two slugs with "+"
+    engine = models.CharField(max_length=101, db_index=True)
+    codec = models.CharField(max_length=10)
+    file = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(default=0)
+    raw_size = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Provider Response"
+        verbose_name_plural = "Provider Responses"
+
+    def __str__(self):
+        return f"{self.engine} response for Waybill {self.waybill_image_id}"
+
+
+class UploadBatch(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    extraction_model = models.ForeignKey(
+        ExtractionModel, on_delete=models.SET_NULL, null=True
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    # X-Request-ID of the upload, carried into the logs of its jobs
+    request_id = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        verbose_name = "Upload Batch"
+        verbose_name_plural = "Upload Batches"
+
+    def __str__(self):
+        return f"Batch {self.id}"
+
+
+class StatusTransitionMixin:
+    """Conditional status updates for models with a ProcessingStatus field"""
+
+    def move_to(self, status, **fields):
+        """Atomically move the record to a new status.
+
+        The update only applies when the record is still in one of the states
+        the target may be reached from, so concurrent workers cannot both
+        claim or finish the same record. Returns True when the move happened.
+        """
+        moved = (
+            type(self)
+            .objects.filter(pk=self.pk, status__in=STATUS_TRANSITIONS[status])
+            .update(status=status, **fields)
+        )
+        if not moved:
+            return False
+
+        self.on_status_change(status)
+        self.refresh_from_db()
+        return True
+
+    def on_status_change(self, status):
+        pass
+
+
+class ExtractionJob(StatusTransitionMixin, models.Model):
+    batch = models.ForeignKey(
+        UploadBatch, on_delete=models.CASCADE, related_name="jobs"
+    )
+    waybill_image = models.OneToOneField(
+        WaybillImage, on_delete=models.CASCADE, related_name="job"
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=ProcessingStatus.choices,
+        default=ProcessingStatus.QUEUED,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Extraction Job"
+        verbose_name_plural = "Extraction Jobs"
+        indexes = [models.Index(fields=["status", "id"])]
+
+    def __str__(self):
+        return f"Job {self.id} for Waybill {self.waybill_image_id} ({self.status})"
+
+    def on_status_change(self, status):
+        WaybillImage.objects.filter(pk=self.waybill_image_id).update(status=status)
+
+
+class CachedExtraction(models.Model):
+    """Provider output stored by image content, reused for repeat uploads"""
+
+    cache_key = models.CharField(max_length=64, unique=True)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    extraction_model = models.ForeignKey(ExtractionModel, on_delete=models.CASCADE)
+    extracted_data = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Cached Extraction"
+        verbose_name_plural = "Cached Extractions"
+
+    def __str__(self):
+        return f"Cached {self.extraction_model_id} result for {self.content_hash[:12]}"
+
+
+class ExportJob(StatusTransitionMixin, models.Model):
+    """A pre-generated export artifact for a set of waybills"""
+
+    key = models.CharField(max_length=64, unique=True)
+    # The sorted ids of the exported waybills, in one row instead of one per
+    # waybill; the bounds let invalidation find candidate jobs by index
+    waybill_ids = models.JSONField(default=list)
+    first_waybill_id = models.BigIntegerField(null=True, db_index=True)
+    last_waybill_id = models.BigIntegerField(null=True, db_index=True)
+    status = models.CharField(
+        max_length=10,
+        choices=ProcessingStatus.choices,
+        default=ProcessingStatus.QUEUED,
+    )
+    file = models.CharField(max_length=255, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    # When the current build started; a build older than EXPORT_BUILD_TIMEOUT
+    # died with its process
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Export Job"
+        verbose_name_plural = "Export Jobs"
+
+    def __str__(self):
+        return f"Export {self.key[:12]} ({self.status})"
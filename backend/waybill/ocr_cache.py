@@ -0,0 +1,187 @@
+import hashlib
+import json
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import extractors, preprocessing
+from .models import CachedExtraction
+
+_counters = {"hits": 0, "misses": 0}
+_counters_lock = threading.Lock()
+
+
+def hash_file(file):
+    """SHA-256 of an uploaded or stored file, leaving it rewound"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    if hasattr(file, "chunks"):
+        chunks = file.chunks()
+    else:
+        chunks = iter(lambda: file.read(1024 * 1024), b"")
+    for chunk in chunks:
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(content_hash, extraction_model):
+    try:
+        engine_options = extractors.for_model(extraction_model).options
+    except extractors.UnknownEngine:
+        engine_options = {}
+    options = {
+        "engine": extraction_model.engine,
+        **engine_options,
+        "preprocess": preprocessing.options(),
+    }
+    if extraction_model.field_rules:
+        options["field_rules"] = extraction_model.field_rules
+    key = f"{content_hash}:{extraction_model.id}:{json.dumps(options, sort_keys=True)}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _count(counter):
+    with _counters_lock:
+        _counters[counter] += 1
+
+
+def lookup(content_hash, extraction_model, count_miss=True):
+    """Cached provider output for an image, or None on a miss.
+
+    Pass count_miss=False when re-checking an image whose miss was already
+    counted, e.g. by lookup_many() at enqueue time, so it counts only once.
+    """
+    if not settings.OCR_CACHE_ENABLED or not content_hash or not extraction_model:
+        return None
+
+    cutoff = timezone.now() - timedelta(seconds=settings.OCR_CACHE_TTL)
+    entry = CachedExtraction.objects.filter(
+        cache_key=cache_key(content_hash, extraction_model), created_at__gte=cutoff
+    ).first()
+    if entry is None:
+        if count_miss:
+            _count("misses")
+        return None
+
+    CachedExtraction.objects.filter(pk=entry.pk).update(
+        hits=F("hits") + 1, last_hit_at=timezone.now()
+    )
+    _count("hits")
+    return entry.extracted_data
+
+
+def lookup_many(content_hashes, extraction_model):
+    """lookup() for all images of a batch in two queries.
+
+    Returns the cached provider output by content hash for the hits.
+    """
+    if not settings.OCR_CACHE_ENABLED or not extraction_model:
+        return {}
+    content_hashes = [content_hash for content_hash in content_hashes if content_hash]
+    if not content_hashes:
+        return {}
+
+    keys = {
+        cache_key(content_hash, extraction_model): content_hash
+        for content_hash in set(content_hashes)
+    }
+    cutoff = timezone.now() - timedelta(seconds=settings.OCR_CACHE_TTL)
+    entries = {
+        keys[entry.cache_key]: entry
+        for entry in CachedExtraction.objects.filter(
+            cache_key__in=keys, created_at__gte=cutoff
+        ).only("cache_key", "extracted_data")
+    }
+
+    # Every image counts, like separate lookups would
+    hits = Counter(
+        content_hash for content_hash in content_hashes if content_hash in entries
+    )
+    for count in set(hits.values()):
+        CachedExtraction.objects.filter(
+            pk__in=[
+                entries[content_hash].pk
+                for content_hash, hashes in hits.items()
+                if hashes == count
+            ]
+        ).update(hits=F("hits") + count, last_hit_at=timezone.now())
+    with _counters_lock:
+        _counters["hits"] += hits.total()
+        _counters["misses"] += len(content_hashes) - hits.total()
+
+    return {
+        content_hash: entry.extracted_data for content_hash, entry in entries.items()
+    }
+
+
+def store(content_hash, extraction_model, result):
+    """Cache the data of an ExtractionResult; demo data is never cached"""
+    if not settings.OCR_CACHE_ENABLED or not content_hash or not extraction_model:
+        return
+    if result.demo:
+        return
+
+    CachedExtraction.objects.update_or_create(
+        cache_key=cache_key(content_hash, extraction_model),
+        defaults={
+            "content_hash": content_hash,
+            "extraction_model": extraction_model,
+            "extracted_data": result.data,
+            "created_at": timezone.now(),
+        },
+    )
+
+
+def refresh(content_hash, extraction_model, extracted_data):
+    """Replace the data of an existing entry, e.g. after reprocessing.
+
+    Unlike store() this keeps the entry's age, so the TTL is not extended.
+    Only entries store() made exist, so demo data never gets in this way.
+    """
+    if not content_hash or not extraction_model:
+        return 0
+    return CachedExtraction.objects.filter(
+        cache_key=cache_key(content_hash, extraction_model)
+    ).update(extracted_data=extracted_data)
+
+
+def invalidate(content_hash=None, extraction_model=None, expired_only=False):
+    """Delete cache entries matching the filters; returns how many went"""
+    entries = CachedExtraction.objects.all()
+    if content_hash:
+        entries = entries.filter(content_hash=content_hash)
+    if extraction_model:
+        entries = entries.filter(extraction_model=extraction_model)
+    if expired_only:
+        cutoff = timezone.now() - timedelta(seconds=settings.OCR_CACHE_TTL)
+        entries = entries.filter(created_at__lt=cutoff)
+    deleted, _ = entries.delete()
+    return deleted
+
+
+def stats():
+    """Hit/miss counters for this process plus totals stored in the cache"""
+    with _counters_lock:
+        counters = dict(_counters)
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        "enabled": settings.OCR_CACHE_ENABLED,
+        "ttl_seconds": settings.OCR_CACHE_TTL,
+        "process": {
+            **counters,
+            "hit_ratio": counters["hits"] / lookups if lookups else 0.0,
+        },
+        "entries": CachedExtraction.objects.count(),
+        "total_hits": CachedExtraction.objects.aggregate(total=Sum("hits"))["total"]
+        or 0,
+    }
+
+
+def reset_counters():
+    with _counters_lock:
+        _counters.update(hits=0, misses=0)
@@ -0,0 +1,298 @@
+import io
+import logging
+import mimetypes
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps, ImageSequence
+
+from . import telemetry
+
+# Formats Pillow writes for each re-encoded image
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+# Modes PNG stores as they are; split_pages() converts other frames to RGB
+PNG_MODES = {"1", "L", "LA", "I", "I;16", "P", "RGB", "RGBA"}
+
+logger = logging.getLogger(__name__)
+
+
+def options():
+    """Preprocessing settings that change what is sent to the provider"""
+    if not settings.PREPROCESS_ENABLED:
+        return {}
+    return {
+        "max_long_edge": settings.PREPROCESS_MAX_LONG_EDGE,
+        "max_dpi": settings.PREPROCESS_MAX_DPI,
+        "grayscale": settings.PREPROCESS_GRAYSCALE,
+        "jpeg_quality": settings.PREPROCESS_JPEG_QUALITY,
+    }
+
+
+def guess_content_type(path):
+    content_type, _ = mimetypes.guess_type(path)
+    return content_type or "application/octet-stream"
+
+
+def _target_scale(image, max_long_edge, max_dpi):
+    """Factor (at most 1) that brings the image within the DPI and size caps"""
+    scale = 1.0
+    dpi = image.info.get("dpi")
+    if max_dpi and dpi and dpi[0] and float(dpi[0]) > max_dpi:
+        scale = max_dpi / float(dpi[0])
+    long_edge = max(image.size) * scale
+    if max_long_edge and long_edge > max_long_edge:
+        scale *= max_long_edge / long_edge
+    return scale
+
+
+def _encode(image, source_format, max_long_edge, max_dpi, grayscale, jpeg_quality):
+    """Orient, downscale, grayscale and re-encode one image or frame.
+
+    Returns the encoded bytes, their format, the final size and whether the
+    pixels were rotated or resized.
+    """
+    rotated = image.getexif().get(0x0112, 1) != 1
+    image = ImageOps.exif_transpose(image)
+
+    scale = _target_scale(image, max_long_edge, max_dpi)
+    if scale < 1:
+        size = (
+            max(1, round(image.width * scale)),
+            max(1, round(image.height * scale)),
+        )
+        image = image.resize(size, Image.LANCZOS)
+
+    if grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    # Scans and screenshots compress better losslessly; photos as JPEG
+    output_format = "PNG" if source_format == "PNG" else "JPEG"
+    encoded = io.BytesIO()
+    if output_format == "PNG":
+        image.save(encoded, "PNG", optimize=True)
+    else:
+        image.save(
+            encoded,
+            "JPEG",
+            quality=jpeg_quality,
+            optimize=True,
+            progressive=True,
+        )
+    return encoded.getvalue(), output_format, image.size, rotated or scale < 1
+
+
+def process_file(path, max_long_edge, max_dpi, grayscale, jpeg_quality):
+    """Orient, downscale, grayscale and re-encode one image file.
+
+    Runs in a worker process, so it takes plain arguments instead of
+    reading Django settings. Pillow decodes straight from the stored file;
+    data is None when the original should be sent as is, i.e. the file is
+    not an image Pillow can read or re-encoding would not make it smaller.
+    """
+    start = time.perf_counter()
+    original_bytes = os.path.getsize(path)
+    result = {
+        "data": None,
+        "content_type": guess_content_type(path),
+        "original_bytes": original_bytes,
+        "changed": False,
+    }
+    try:
+        with Image.open(path) as image:
+            data, output_format, (width, height), transformed = _encode(
+                image, image.format, max_long_edge, max_dpi, grayscale, jpeg_quality
+            )
+    except (OSError, ValueError, Image.DecompressionBombError):
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    # A rotated or resized image must be sent even if it grew slightly
+    if len(data) < original_bytes or transformed:
+        result.update(
+            data=data,
+            content_type=CONTENT_TYPES[output_format],
+            width=width,
+            height=height,
+            changed=True,
+        )
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def process_pages(path, max_long_edge, max_dpi, grayscale, jpeg_quality):
+    """One process_file() style result per page of a multi-frame image.
+
+    Multi-page TIFFs are split into separately encoded pages, since the
+    providers only accept single images. Anything else is one page.
+    """
+    options = (max_long_edge, max_dpi, grayscale, jpeg_quality)
+    try:
+        with Image.open(path) as image:
+            if getattr(image, "n_frames", 1) <= 1:
+                return [process_file(path, *options)]
+
+            pages = []
+            original_bytes = os.path.getsize(path)
+            for frame in ImageSequence.Iterator(image):
+                start = time.perf_counter()
+                data, output_format, (width, height), _ = _encode(
+                    frame, image.format, *options
+                )
+                pages.append(
+                    {
+                        "data": data,
+                        "content_type": CONTENT_TYPES[output_format],
+                        # The original size is reported once, on the first page
+                        "original_bytes": original_bytes if not pages else 0,
+                        "width": width,
+                        "height": height,
+                        "changed": True,
+                        "seconds": time.perf_counter() - start,
+                    }
+                )
+            return pages
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return [process_file(path, *options)]
+
+
+def split_pages(path):
+    """Each frame of a multi-frame image as a lossless PNG, otherwise as is.
+
+    For PREPROCESS_ENABLED=False: the providers only accept single images,
+    so multi-page TIFFs are split, but no page is oriented, scaled or
+    converted to grayscale.
+    """
+    pages = []
+    original_bytes = os.path.getsize(path)
+    with Image.open(path) as image:
+        for frame in ImageSequence.Iterator(image):
+            start = time.perf_counter()
+            if frame.mode not in PNG_MODES:
+                frame = frame.convert("RGB")
+            encoded = io.BytesIO()
+            frame.save(encoded, "PNG")
+            pages.append(
+                {
+                    "data": encoded.getvalue(),
+                    "content_type": "image/png",
+                    "original_bytes": original_bytes if not pages else 0,
+                    "width": frame.width,
+                    "height": frame.height,
+                    "changed": False,
+                    "seconds": time.perf_counter() - start,
+                }
+            )
+    return pages
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned rather than forked: the parent runs worker threads
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PREPROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _with_original_data(image_path, result):
+    # The only full read of an unchanged file between upload and provider
+    with open(image_path, "rb") as source:
+        result["data"] = source.read()
+    result["original_bytes"] = len(result["data"])
+    return result
+
+
+def _call(func, *args):
+    if settings.PREPROCESS_WORKERS <= 0:
+        return func(*args)
+    return _get_executor().submit(func, *args).result()
+
+
+def _run(func, image_path):
+    return _call(
+        func,
+        image_path,
+        settings.PREPROCESS_MAX_LONG_EDGE,
+        settings.PREPROCESS_MAX_DPI,
+        settings.PREPROCESS_GRAYSCALE,
+        settings.PREPROCESS_JPEG_QUALITY,
+    )
+
+
+def _report(image_path, result, label=""):
+    # Served at /api/metrics/; the time is in the callers' preprocess spans
+    telemetry.count("preprocess_input_bytes", result["original_bytes"])
+    telemetry.count("preprocess_output_bytes", len(result["data"]))
+    logger.debug(
+        "Preprocessed %s%s: %d -> %d bytes in %.0f ms",
+        os.path.basename(image_path),
+        label,
+        result["original_bytes"],
+        len(result["data"]),
+        result["seconds"] * 1000,
+    )
+
+
+def _unprocessed(image_path):
+    return _with_original_data(
+        image_path,
+        {
+            "data": None,
+            "content_type": guess_content_type(image_path),
+            "changed": False,
+            "seconds": 0.0,
+        },
+    )
+
+
+def prepare_image(image_path):
+    """Bytes and MIME type to send to a provider for a stored image.
+
+    Image decoding and encoding run on a process pool (PREPROCESS_WORKERS)
+    so they do not hold the GIL of the web or worker process.
+    """
+    if not settings.PREPROCESS_ENABLED:
+        return _unprocessed(image_path)
+
+    result = _run(process_file, image_path)
+    if result["data"] is None:
+        result = _with_original_data(image_path, result)
+    _report(image_path, result)
+    return result
+
+
+def prepare_pages(image_path):
+    """prepare_image() for every page of a possibly multi-page image"""
+    if not settings.PREPROCESS_ENABLED:
+        # Multi-page files still have to be split for the providers
+        if not _is_multi_frame(image_path):
+            return [_unprocessed(image_path)]
+        pages = _call(split_pages, image_path)
+    else:
+        pages = _run(process_pages, image_path)
+    for number, page in enumerate(pages, 1):
+        if page["data"] is None:
+            pages[number - 1] = page = _with_original_data(image_path, page)
+        _report(image_path, page, f" page {number}" if len(pages) > 1 else "")
+    return pages
+
+
+def _is_multi_frame(image_path):
+    try:
+        with Image.open(image_path) as image:
+            return getattr(image, "n_frames", 1) > 1
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
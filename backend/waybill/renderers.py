@@ -0,0 +1,41 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+from .exports import XLSX_CONTENT_TYPE
+
+
+class FileExportRenderer(BaseRenderer):
+    """Makes a file format selectable through ?format= on export endpoints.
+
+    The view builds the file response itself, so only error payloads ever
+    reach render().
+    """
+
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode("utf-8")
+
+
+class XLSXRenderer(FileExportRenderer):
+    media_type = XLSX_CONTENT_TYPE
+    format = "xlsx"
+
+
+class CSVRenderer(FileExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NDJSONRenderer(FileExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class ParquetRenderer(FileExportRenderer):
+    media_type = "application/vnd.apache.parquet"
+    format = "parquet"
+
+
+EXPORT_RENDERERS = [XLSXRenderer, CSVRenderer, NDJSONRenderer, ParquetRenderer]
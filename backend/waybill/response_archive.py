@@ -0,0 +1,146 @@
+import gzip
+import json
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from . import extractors, storage
+from .models import ProviderResponse
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {"zstd": ".json.zst", "gzip": ".json.gz"}
+
+# Provider JSON is repetitive; these levels trade little speed for size
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+
+def default_codec():
+    """RESPONSE_ARCHIVE_CODEC, or gzip when zstandard is not installed"""
+    if settings.RESPONSE_ARCHIVE_CODEC == "zstd" and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def codec_for(path):
+    for codec, extension in EXTENSIONS.items():
+        if path.endswith(extension):
+            return codec
+    raise ValueError(f"Not an archived response: {path}")
+
+
+def encode(engine, raw, codec):
+    """Compressed JSON envelope naming the engine that parses the response.
+
+    Returns the compressed bytes and the uncompressed size.
+    """
+    envelope = {"engine": engine, "raw": raw}
+    payload = json.dumps(envelope, separators=(",", ":")).encode("utf-8")
+    if codec == "zstd":
+        data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload)
+    else:
+        data = gzip.compress(payload, compresslevel=GZIP_LEVEL)
+    return data, len(payload)
+
+
+def decode(data, codec):
+    """The engine slug and raw response of an archived envelope"""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Reading zstd archives requires zstandard")
+        payload = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        payload = gzip.decompress(data)
+    envelope = json.loads(payload)
+    return envelope["engine"], envelope["raw"]
+
+
+def write(waybill_image, engine, raw):
+    """Store the raw output of a waybill's extraction in the media storage.
+
+    Returns the unsaved ProviderResponse for store(), or None when nothing
+    is archived. Every write gets a new name, so a rolled back extraction
+    never overwrites the archive its saved row points to.
+    """
+    if not settings.RESPONSE_ARCHIVE_ENABLED or raw is None:
+        return None
+
+    codec = default_codec()
+    data, raw_size = encode(engine, raw, codec)
+    name = f"responses/{waybill_image.id}_{uuid.uuid4().hex[:12]}{EXTENSIONS[codec]}"
+    return ProviderResponse(
+        waybill_image=waybill_image,
+        engine=engine,
+        codec=codec,
+        file=storage.save_bytes(data, name),
+        size=len(data),
+        raw_size=raw_size,
+    )
+
+
+def store(response):
+    """Save a write() result, replacing the waybill's older archive.
+
+    The older file is deleted once the transaction commits.
+    """
+    if response is None:
+        return None
+
+    previous = ProviderResponse.objects.filter(
+        waybill_image=response.waybill_image
+    ).first()
+    if previous:
+        delete_file(previous)
+
+    response, _ = ProviderResponse.objects.update_or_create(
+        waybill_image=response.waybill_image,
+        defaults={
+            "engine": response.engine,
+            "codec": response.codec,
+            "file": response.file,
+            "size": response.size,
+            "raw_size": response.raw_size,
+            "created_at": timezone.now(),
+        },
+    )
+    return response
+
+
+def discard(response):
+    """Delete the file of a write() result whose transaction failed"""
+    if response is not None:
+        default_storage.delete(response.file)
+
+
+def read(response):
+    """Compressed bytes of an archived response"""
+    with default_storage.open(response.file, "rb") as source:
+        return source.read()
+
+
+def load(response):
+    """The engine slug and raw output of an archived response"""
+    return decode(read(response), response.codec)
+
+
+def delete_file(response):
+    """Delete an archived file once the current transaction commits"""
+    if response.file:
+        transaction.on_commit(lambda: default_storage.delete(response.file))
+
+
+def reparse(codec, data):
+    """Decode an archived response and run its engine's parsing again.
+
+    Runs in `manage.py reprocess` worker processes, so it takes the
+    compressed bytes rather than a model instance.
+    """
+    engine, raw = decode(data, codec)
+    return extractors.for_slug(engine).parse(raw)
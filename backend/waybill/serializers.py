@@ -1,17 +1,55 @@
 from rest_framework import serializers
+from . import derivatives
+from .extractors import rules
 from .models import ExtractionModel, WaybillImage, ExtractedData
 
 
 class ExtractionModelSerializer(serializers.ModelSerializer):
     class Meta:
         model = ExtractionModel
-        fields = ["id", "name", "description", "is_active"]
+        fields = [
+            "id",
+            "name",
+            "engine",
+            "escalation_engine",
+            "escalation_threshold",
+            "field_rules",
+            "description",
+            "is_active",
+        ]
+
+    def validate_field_rules(self, value):
+        try:
+            rules.validate(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return value
 
 
 class WaybillImageSerializer(serializers.ModelSerializer):
+    # Null for PDFs, and for direct uploads until their job hashed them
+    thumbnail_url = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
+
     class Meta:
         model = WaybillImage
-        fields = ["id", "image", "uploaded_at", "processed", "extraction_model"]
+        fields = [
+            "id",
+            "image",
+            "uploaded_at",
+            "status",
+            "processed",
+            "extraction_model",
+            "thumbnail_url",
+            "preview_url",
+        ]
+        read_only_fields = ["status"]
+
+    def get_thumbnail_url(self, obj):
+        return derivatives.url(obj, "thumbnail", self.context.get("request"))
+
+    def get_preview_url(self, obj):
+        return derivatives.url(obj, "preview", self.context.get("request"))
 
 
 class ExtractedDataSerializer(serializers.ModelSerializer):
@@ -0,0 +1,28 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import export_artifacts, fields, response_archive
+from .models import ExtractedData, ProviderResponse, WaybillImage
+
+
+@receiver(post_save, sender=ExtractedData)
+@receiver(post_delete, sender=ExtractedData)
+def invalidate_exports_for_extracted_data(sender, instance, **kwargs):
+    """Drop export artifacts built from data that just changed"""
+    export_artifacts.invalidate([instance.waybill_image_id])
+
+
+@receiver(post_save, sender=ExtractedData)
+def index_fields_for_extracted_data(sender, instance, **kwargs):
+    """Keep the normalized ExtractedField rows in step with the JSON blob"""
+    fields.index_extracted_data(instance)
+
+
+@receiver(pre_delete, sender=WaybillImage)
+def invalidate_exports_for_waybill(sender, instance, **kwargs):
+    export_artifacts.invalidate([instance.id])
+
+
+@receiver(post_delete, sender=ProviderResponse)
+def delete_archived_response(sender, instance, **kwargs):
+    response_archive.delete_file(instance)
@@ -0,0 +1,117 @@
+import os
+import posixpath
+import shutil
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+
+from .models import WaybillImage
+
+try:
+    from storages.backends.s3 import S3Storage
+except ImportError:
+    S3Storage = None
+
+# Chunk size when copying files between local disk and remote storage
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def is_local(storage=default_storage):
+    """Whether files in the storage are files on this server's disk"""
+    return isinstance(storage, FileSystemStorage)
+
+
+def is_s3(storage=default_storage):
+    return S3Storage is not None and isinstance(storage, S3Storage)
+
+
+def s3_key(name, storage=default_storage):
+    """Object key of a stored file, below the storage's location prefix"""
+    location = storage.location.strip("/")
+    return posixpath.join(location, name) if location else name
+
+
+def s3_object(name, storage=default_storage):
+    """The S3Object of a stored file as AWS APIs take it, or None off S3"""
+    if not is_s3(storage):
+        return None
+    return {"Bucket": storage.bucket_name, "Name": s3_key(name, storage)}
+
+
+def upload_name(file_name):
+    """A new storage name for an upload under WaybillImage.image.
+
+    A random suffix keeps names unique without asking the storage, which
+    costs a request per name on S3.
+    """
+    field = WaybillImage._meta.get_field("image")
+    root, extension = posixpath.splitext(field.generate_filename(None, file_name))
+    return f"{root}_{uuid.uuid4().hex[:12]}{extension}"
+
+
+def presigned_upload(name, content_type):
+    """URL and form fields for a client to POST one file straight to S3.
+
+    The form only accepts the declared content type and sizes up to
+    UPLOAD_MAX_FILE_SIZE, and expires after DIRECT_UPLOAD_EXPIRY seconds.
+    """
+    client = default_storage.connection.meta.client
+    return client.generate_presigned_post(
+        Bucket=default_storage.bucket_name,
+        Key=s3_key(name),
+        Fields={"Content-Type": content_type},
+        Conditions=[
+            {"Content-Type": content_type},
+            ["content-length-range", 1, settings.UPLOAD_MAX_FILE_SIZE],
+        ],
+        ExpiresIn=settings.DIRECT_UPLOAD_EXPIRY,
+    )
+
+
+def download(name, destination, storage=default_storage):
+    """Copy a stored file into an open local file"""
+    with storage.open(name, "rb") as source:
+        shutil.copyfileobj(source, destination, COPY_CHUNK_SIZE)
+    destination.flush()
+
+
+def scratch_path(name, storage=default_storage):
+    """Where to write a file that save_file() will then store under name.
+
+    Next to its final place on local storage, so saving is a rename and
+    readers never see a partial file; in the temp directory otherwise.
+    """
+    suffix = f".{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    if is_local(storage):
+        path = storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path + suffix
+    return os.path.join(tempfile.gettempdir(), os.path.basename(name) + suffix)
+
+
+def save_file(path, name, storage=default_storage):
+    """Store a finished scratch file under name, replacing what was there.
+
+    Returns the stored name; the scratch file is gone afterwards.
+    """
+    if is_local(storage):
+        os.replace(path, storage.path(name))
+        return name
+
+    try:
+        storage.delete(name)
+        with open(path, "rb") as source:
+            return storage.save(name, File(source))
+    finally:
+        os.remove(path)
+
+
+def save_bytes(data, name, storage=default_storage):
+    """save_file() for content already in memory"""
+    path = scratch_path(name, storage)
+    with open(path, "wb") as output:
+        output.write(data)
+    return save_file(path, name, storage)
@@ -0,0 +1,257 @@
+"""Timing spans, latency histograms and request-id-correlated logging.
+
+Spans time the stages of a waybill's life (upload save, preprocessing,
+provider call, parsing, DB write, export) into per-stage, per-provider
+histograms kept in this process and rendered in the Prometheus text
+format at /api/metrics/. With METRICS_ENABLED off, span() returns a
+shared no-op context manager and nothing is recorded.
+
+The request id of the current request (or of the upload a background job
+came from) is kept in a context variable and added to every log record.
+"""
+
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+
+# Upper bounds in seconds; provider calls and exports run up to minutes
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_request_id = contextvars.ContextVar("request_id", default="")
+_null_span = nullcontext()
+
+logger = logging.getLogger(__name__)
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def bind_request_id(request_id):
+    """Set the request id of the current context; returns a reset token"""
+    return _request_id.set(request_id or "")
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+@contextmanager
+def request_id_context(request_id):
+    token = bind_request_id(request_id)
+    try:
+        yield
+    finally:
+        reset_request_id(token)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram; thread-safe"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus the +Inf bucket, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, error=False):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+            if error:
+                self.errors += 1
+
+    def snapshot(self):
+        """(cumulative bucket counts, sum, count, errors)"""
+        with self._lock:
+            counts = list(self.counts)
+            total, count, errors = self.sum, self.count, self.errors
+        cumulative = []
+        running = 0
+        for value in counts:
+            running += value
+            cumulative.append(running)
+        return cumulative, total, count, errors
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+# Counters served next to the histograms, with their help text
+COUNTERS = {
+    "preprocess_input_bytes": "Bytes of images before preprocessing",
+    "preprocess_output_bytes": "Bytes of preprocessed images sent to providers",
+}
+_counters = {}
+
+
+def histogram(stage, provider=""):
+    key = (stage, provider or "")
+    found = _histograms.get(key)
+    if found is None:
+        with _histograms_lock:
+            found = _histograms.setdefault(key, Histogram())
+    return found
+
+
+def observe(stage, seconds, provider="", error=False):
+    """Record one timing, e.g. measured on a worker process"""
+    if settings.METRICS_ENABLED:
+        histogram(stage, provider).observe(seconds, error)
+
+
+def count(name, value=1, provider=""):
+    """Add to one of the COUNTERS"""
+    if not settings.METRICS_ENABLED:
+        return
+    key = (name, provider or "")
+    with _histograms_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextmanager
+def _span(stage, provider):
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        histogram(stage, provider).observe(seconds, error)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%s took %.3fs",
+                stage,
+                seconds,
+                extra={"stage": stage, "provider": provider, "seconds": seconds},
+            )
+
+
+def span(stage, provider=""):
+    """Context manager timing a block into the stage/provider histogram"""
+    if not settings.METRICS_ENABLED:
+        return _null_span
+    return _span(stage, provider or "")
+
+
+def _timed_iter(iterable, stage, provider):
+    with _span(stage, provider):
+        yield from iterable
+
+
+def timed_iter(iterable, stage, provider=""):
+    """Iterate with the whole iteration timed as one span.
+
+    For streamed responses the span includes the time the client takes to
+    read them.
+    """
+    if not settings.METRICS_ENABLED:
+        return iterable
+    return _timed_iter(iterable, stage, provider or "")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def render():
+    """All histograms and counters of this process in the Prometheus text format"""
+    with _histograms_lock:
+        items = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+
+    lines = [
+        "# HELP waybill_stage_duration_seconds Time spent per processing stage",
+        "# TYPE waybill_stage_duration_seconds histogram",
+    ]
+    errors = [
+        "# HELP waybill_stage_errors_total Stage spans that raised an exception",
+        "# TYPE waybill_stage_errors_total counter",
+    ]
+    for (stage, provider), found in items:
+        cumulative, total, count, error_count = found.snapshot()
+        labels = _labels(stage=stage, provider=provider)
+        for bound, value in zip(found.buckets, cumulative):
+            lines.append(
+                f'waybill_stage_duration_seconds_bucket{{{labels},le="{bound:g}"}} '
+                f"{value}"
+            )
+        lines.append(
+            f'waybill_stage_duration_seconds_bucket{{{labels},le="+Inf"}} '
+            f"{cumulative[-1]}"
+        )
+        lines.append(f"waybill_stage_duration_seconds_sum{{{labels}}} {total!r}")
+        lines.append(f"waybill_stage_duration_seconds_count{{{labels}}} {count}")
+        errors.append(f"waybill_stage_errors_total{{{labels}}} {error_count}")
+
+    totals = []
+    for name, help_text in COUNTERS.items():
+        values = [(key, value) for key, value in counters if key[0] == name]
+        if not values:
+            continue
+        totals.append(f"# HELP waybill_{name}_total {help_text}")
+        totals.append(f"# TYPE waybill_{name}_total counter")
+        for (_, provider), value in values:
+            totals.append(
+                f"waybill_{name}_total{{{_labels(provider=provider)}}} {value}"
+            )
+    return "\n".join(lines + errors + totals) + "\n"
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request id to every record as record.request_id"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+# Attributes every LogRecord has; anything else was passed in extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the fields passed in extra="""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
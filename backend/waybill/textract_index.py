@@ -0,0 +1,293 @@
+from collections import defaultdict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Small margin added around a cell to account for slight misalignments
+CELL_MARGIN = 0.005
+
+# Minimum share of a word's area that must fall inside a cell
+MIN_WORD_OVERLAP = 0.3
+
+# Number of grid buckets per axis used to index WORD geometry
+GRID_SIZE = 32
+
+# Block types whose text may have to be resolved from geometry
+GEOMETRY_BLOCK_TYPES = ("CELL", "KEY_VALUE_SET", "LINE")
+
+# Upper bound on boxes x words evaluated in one broadcast, which caps the
+# size of the temporary overlap matrices
+MAX_MATRIX_ELEMENTS = 1_000_000
+
+# Boxes compared with the words of their bounding band at once
+BAND_SIZE = 64
+
+
+def _has_children(block):
+    return any(
+        relationship["Type"] == "CHILD"
+        for relationship in block.get("Relationships", [])
+    )
+
+
+class BlockIndex:
+    """Lookup structure built once per Textract response.
+
+    Holds an id map, a per-type list and a spatial grid over WORD geometry so
+    cell, form and line text can be resolved without rescanning every block.
+    With NumPy, the WORD boxes of a page are turned into arrays once and all
+    blocks that need geometry on that page are matched in one broadcast.
+    """
+
+    def __init__(self, blocks, grid_size=GRID_SIZE, vectorized=None):
+        self.blocks = blocks
+        self.grid_size = grid_size
+        self.vectorized = numpy is not None if vectorized is None else vectorized
+        self.by_id = {}
+        self.by_type = defaultdict(list)
+        self.words = []
+        self.grid = defaultdict(list)
+        # Per page: word positions and their coordinate arrays
+        self._page_arrays = {}
+        # Block id -> WORD blocks matched by geometry, filled a page at a time
+        self._geometry_words = {}
+        self._matched_pages = set()
+
+        for block in blocks:
+            self.by_id[block["Id"]] = block
+            self.by_type[block["BlockType"]].append(block)
+
+            if block["BlockType"] == "WORD" and "Geometry" in block:
+                self._add_word(block)
+
+    def _bucket(self, value):
+        """Clamp a normalized coordinate to a grid bucket."""
+        bucket = int(value * self.grid_size)
+        return min(max(bucket, 0), self.grid_size - 1)
+
+    def _add_word(self, block):
+        box = block["Geometry"]["BoundingBox"]
+        left = box["Left"]
+        top = box["Top"]
+        right = left + box["Width"]
+        bottom = top + box["Height"]
+
+        # Words keep their position in the response so query results come
+        # back in reading order, same as a linear scan would return them
+        position = len(self.words)
+        self.words.append(
+            (left, top, right, bottom, box["Width"] * box["Height"], block)
+        )
+
+        page = block.get("Page", 1)
+        for gx in range(self._bucket(left), self._bucket(right) + 1):
+            for gy in range(self._bucket(top), self._bucket(bottom) + 1):
+                self.grid[(page, gx, gy)].append(position)
+
+    def get(self, block_id):
+        return self.by_id.get(block_id)
+
+    def of_type(self, block_type):
+        return self.by_type.get(block_type, [])
+
+    def related_ids(self, block, relationship_type):
+        """Ids referenced by a block through the given relationship type"""
+        ids = []
+        for relationship in block.get("Relationships", []):
+            if relationship["Type"] == relationship_type:
+                ids.extend(relationship["Ids"])
+        return ids
+
+    def related(self, block, relationship_type, block_type=None):
+        """Blocks referenced by a block through the given relationship type"""
+        related_blocks = []
+        for block_id in self.related_ids(block, relationship_type):
+            related_block = self.by_id.get(block_id)
+            if related_block is None:
+                continue
+            if block_type and related_block["BlockType"] != block_type:
+                continue
+            related_blocks.append(related_block)
+        return related_blocks
+
+    def candidate_words(self, left, top, right, bottom, page=1):
+        """Word entries whose grid buckets intersect the given box"""
+        positions = set()
+        for gx in range(self._bucket(left), self._bucket(right) + 1):
+            for gy in range(self._bucket(top), self._bucket(bottom) + 1):
+                positions.update(self.grid.get((page, gx, gy), ()))
+        return [self.words[position] for position in sorted(positions)]
+
+    def words_in_box(self, box, page=1):
+        """WORD blocks that significantly overlap a bounding box"""
+        # Calculate cell boundaries with a small margin
+        cell_left = box["Left"] - CELL_MARGIN
+        cell_right = box["Left"] + box["Width"] + CELL_MARGIN
+        cell_top = box["Top"] - CELL_MARGIN
+        cell_bottom = box["Top"] + box["Height"] + CELL_MARGIN
+
+        words = []
+        for word_left, word_top, word_right, word_bottom, word_area, block in (
+            self.candidate_words(cell_left, cell_top, cell_right, cell_bottom, page)
+        ):
+            # Check if word significantly overlaps with cell
+            horizontal_overlap = word_right > cell_left and word_left < cell_right
+            vertical_overlap = word_bottom > cell_top and word_top < cell_bottom
+
+            if horizontal_overlap and vertical_overlap:
+                # Calculate overlap percentage
+                overlap_width = min(word_right, cell_right) - max(word_left, cell_left)
+                overlap_height = min(word_bottom, cell_bottom) - max(
+                    word_top, cell_top
+                )
+                overlap_area = max(0, overlap_width) * max(0, overlap_height)
+
+                # If word overlaps significantly with the cell (>30% of word area)
+                if overlap_area > MIN_WORD_OVERLAP * word_area:
+                    words.append(block)
+
+        return words
+
+    def words_in_boxes(self, boxes, page=1):
+        """words_in_box() for many boxes at once, one list of words per box.
+
+        Boxes are compared with the words of the page as boxes x words
+        matrices, with the same margin, the same 30% rule and the same float
+        operations as words_in_box(), and words come back in reading order.
+        """
+        if not self.vectorized:
+            return [self.words_in_box(box, page) for box in boxes]
+
+        positions, (left, top, right, bottom, area) = self.page_arrays(page)
+        if not positions:
+            return [[] for _ in boxes]
+
+        box_values = numpy.array(
+            [[box["Left"], box["Top"], box["Width"], box["Height"]] for box in boxes],
+            dtype=float,
+        ).reshape(-1, 4)
+        # Same float operations as words_in_box(), so results match exactly
+        cell_lefts = box_values[:, 0] - CELL_MARGIN
+        cell_rights = box_values[:, 0] + box_values[:, 2] + CELL_MARGIN
+        cell_tops = box_values[:, 1] - CELL_MARGIN
+        cell_bottoms = box_values[:, 1] + box_values[:, 3] + CELL_MARGIN
+
+        # Boxes are taken top to bottom in bands, and each band is only
+        # compared with the words inside its bounding box
+        order = numpy.argsort(box_values[:, 1], kind="stable")
+        matches = [None] * len(box_values)
+        for start in range(0, len(order), BAND_SIZE):
+            band = order[start : start + BAND_SIZE]
+            candidates = numpy.flatnonzero(
+                (right > cell_lefts[band].min())
+                & (left < cell_rights[band].max())
+                & (bottom > cell_tops[band].min())
+                & (top < cell_bottoms[band].max())
+            )
+            if not len(candidates):
+                for index in band:
+                    matches[index] = []
+                continue
+
+            chunk_size = max(1, MAX_MATRIX_ELEMENTS // len(candidates))
+            for chunk_start in range(0, len(band), chunk_size):
+                chunk = band[chunk_start : chunk_start + chunk_size]
+                mask = self._overlap_mask(
+                    (left, top, right, bottom, area),
+                    candidates,
+                    # Column vectors broadcast against the word row vectors
+                    cell_lefts[chunk, None],
+                    cell_tops[chunk, None],
+                    cell_rights[chunk, None],
+                    cell_bottoms[chunk, None],
+                )
+                for index, row in zip(chunk, mask):
+                    matches[index] = [
+                        self.words[positions[i]][5] for i in candidates[row]
+                    ]
+        return matches
+
+    @staticmethod
+    def _overlap_mask(words, candidates, cell_left, cell_top, cell_right, cell_bottom):
+        """boxes x candidates matrix of the words_in_box() overlap rule"""
+        left, top, right, bottom, area = (values[candidates] for values in words)
+        overlap_width = numpy.minimum(right, cell_right) - numpy.maximum(
+            left, cell_left
+        )
+        overlap_height = numpy.minimum(bottom, cell_bottom) - numpy.maximum(
+            top, cell_top
+        )
+        overlap_area = numpy.maximum(overlap_width, 0) * numpy.maximum(
+            overlap_height, 0
+        )
+        return (
+            (right > cell_left)
+            & (left < cell_right)
+            & (bottom > cell_top)
+            & (top < cell_bottom)
+            & (overlap_area > MIN_WORD_OVERLAP * area)
+        )
+
+    def page_arrays(self, page):
+        """Positions of a page's words and their left/top/right/bottom/area"""
+        arrays = self._page_arrays.get(page)
+        if arrays is None:
+            positions = [
+                position
+                for position, word in enumerate(self.words)
+                if word[5].get("Page", 1) == page
+            ]
+            coordinates = numpy.array(
+                [self.words[position][:5] for position in positions], dtype=float
+            ).reshape(-1, 5)
+            arrays = self._page_arrays[page] = (positions, tuple(coordinates.T))
+        return arrays
+
+    def geometry_words(self, block):
+        """WORD blocks inside the bounding box of a block without children"""
+        box = block["Geometry"]["BoundingBox"]
+        page = block.get("Page", 1)
+        if not self.vectorized:
+            return self.words_in_box(box, page=page)
+
+        if page not in self._matched_pages:
+            self._match_page(page)
+        words = self._geometry_words.get(block["Id"])
+        if words is None:
+            words = self.words_in_boxes([box], page)[0]
+        return words
+
+    def _match_page(self, page):
+        """Match every childless cell, form and line block of a page at once"""
+        targets = [
+            block
+            for block_type in GEOMETRY_BLOCK_TYPES
+            for block in self.of_type(block_type)
+            if block.get("Page", 1) == page
+            and "Text" not in block
+            and "Geometry" in block
+            and not _has_children(block)
+        ]
+        boxes = [block["Geometry"]["BoundingBox"] for block in targets]
+        for block, words in zip(targets, self.words_in_boxes(boxes, page)):
+            self._geometry_words[block["Id"]] = words
+        self._matched_pages.add(page)
+
+    def text_for(self, block):
+        """Resolve the text of a block.
+
+        Uses the block's own text when Textract provides it, then its CHILD
+        WORD relationships, and only falls back to geometry when the block has
+        no children at all.
+        """
+        if "Text" in block:
+            return block["Text"]
+
+        if _has_children(block):
+            words = self.related(block, "CHILD", block_type="WORD")
+        else:
+            words = self.geometry_words(block)
+
+        return " ".join(word["Text"] for word in words)
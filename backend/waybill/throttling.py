@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+from botocore.exceptions import ConnectionError as AWSConnectionError
+from botocore.exceptions import HTTPClientError
+from django.conf import settings
+
+from . import telemetry
+
+# Error codes AWS uses when a caller exceeds its request quota
+AWS_THROTTLING_CODES = {
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "TooManyRequestsException",
+}
+# Provider-side failures that are worth another try
+TRANSIENT_STATUS_CODES = {500, 502, 503, 504}
+# Network failures; the provider SDKs do not retry them themselves, see clients
+CONNECTION_ERRORS = (
+    AWSConnectionError,
+    HTTPClientError,
+    httpx.ConnectError,
+    httpx.TimeoutException,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def try_acquire(self):
+        """Take a token if one is available; otherwise the seconds to wait"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while wait := self.try_acquire():
+            time.sleep(wait)
+
+    async def aacquire(self):
+        while wait := self.try_acquire():
+            await asyncio.sleep(wait)
+
+
+class ProviderLimiter:
+    """Caps in-flight calls to a provider and the rate they are started at"""
+
+    def __init__(self, concurrency, rate=None):
+        self.concurrency = concurrency
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+        self._bucket = TokenBucket(rate) if rate else None
+        # Event loop -> asyncio.Semaphore; waiting coroutines queue there
+        self._gates = weakref.WeakKeyDictionary()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        with self._semaphore:
+            if self._bucket:
+                self._bucket.acquire()
+            yield
+
+    def _gate(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._gates:
+                self._gates[loop] = asyncio.Semaphore(self.concurrency)
+            return self._gates[loop]
+
+    async def _acquire(self):
+        """Take the thread semaphore without blocking the event loop.
+
+        When threaded callers hold the slots, the wait runs on the
+        limiter's own threads, one per slot, so it never ties up the
+        loop's default executor that to_thread() and sync_to_async() use.
+        """
+        if self._semaphore.acquire(blocking=False):
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix="provider-slot"
+                )
+        acquiring = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._semaphore.acquire
+        )
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The thread still takes the slot; hand it back when it does
+            acquiring.add_done_callback(lambda _: self._semaphore.release())
+            raise
+
+    @asynccontextmanager
+    async def aslot(self):
+        """slot() for coroutines; shares the limits with threaded callers"""
+        # At most `concurrency` coroutines of a loop go on to the semaphore
+        async with self._gate():
+            await self._acquire()
+            try:
+                if self._bucket:
+                    await self._bucket.aacquire()
+                yield
+            finally:
+                self._semaphore.release()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(provider, concurrency=1, rate=None):
+    """The process-wide limiter for a provider.
+
+    EXTRACTION_PROVIDER_LIMITS overrides the limits the caller declares.
+    """
+    with _limiters_lock:
+        if provider not in _limiters:
+            limits = settings.EXTRACTION_PROVIDER_LIMITS.get(provider, {})
+            _limiters[provider] = ProviderLimiter(
+                limits.get("concurrency", concurrency), limits.get("rate", rate)
+            )
+        return _limiters[provider]
+
+
+def is_throttling_error(error):
+    """Whether an exception means the provider asked us to slow down"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        code = response.get("Error", {}).get("Code")
+        return code in AWS_THROTTLING_CODES
+    return getattr(response, "status_code", None) == 429
+
+
+def is_retryable_error(error):
+    """Whether a failed provider call may succeed when made again"""
+    if is_throttling_error(error) or isinstance(error, CONNECTION_ERRORS):
+        return True
+
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        status_code = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    else:
+        status_code = getattr(error, "status_code", None) or getattr(
+            response, "status_code", None
+        )
+    return status_code in TRANSIENT_STATUS_CODES
+
+
+def backoff_delay(attempt, base_delay):
+    return base_delay * (2**attempt) * random.uniform(0.5, 1.5)
+
+
+def call_with_backoff(func, retries=None, base_delay=None):
+    """Call func, retrying with exponential backoff and jitter when throttled.
+
+    Connection errors and 5xx responses are retried the same way. This is
+    the only retry layer: the SDK clients make a single attempt per call.
+    """
+    retries = settings.EXTRACTION_BACKOFF_RETRIES if retries is None else retries
+    base_delay = (
+        settings.EXTRACTION_BACKOFF_BASE_DELAY if base_delay is None else base_delay
+    )
+
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= retries or not is_retryable_error(e):
+                raise
+            delay = backoff_delay(attempt, base_delay)
+            logger.warning("Provider call failed (%s), retrying in %.2fs", e, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+async def acall_with_backoff(func, retries=None, base_delay=None):
+    """call_with_backoff() for a coroutine function"""
+    retries = settings.EXTRACTION_BACKOFF_RETRIES if retries is None else retries
+    base_delay = (
+        settings.EXTRACTION_BACKOFF_BASE_DELAY if base_delay is None else base_delay
+    )
+
+    attempt = 0
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            if attempt >= retries or not is_retryable_error(e):
+                raise
+            delay = backoff_delay(attempt, base_delay)
+            logger.warning("Provider call failed (%s), retrying in %.2fs", e, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def call_provider(provider, func, concurrency=1, rate=None):
+    """Run a provider call inside its concurrency/rate limits with backoff"""
+    limiter = limiter_for(provider, concurrency, rate)
+
+    def limited_call():
+        with limiter.slot(), telemetry.span("provider_call", provider):
+            return func()
+
+    return call_with_backoff(limited_call)
+
+
+async def acall_provider(provider, func, concurrency=1, rate=None):
+    """call_provider() for a coroutine function"""
+    limiter = limiter_for(provider, concurrency, rate)
+
+    async def limited_call():
+        async with limiter.aslot():
+            with telemetry.span("provider_call", provider):
+                return await func()
+
+    return await acall_with_backoff(limited_call)
+
+
+def map_ordered(func, items, max_workers):
+    """Apply func to items on a bounded thread pool, keeping the input order"""
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(func, items))
@@ -0,0 +1,216 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    StopFutureHandlers,
+    StopUpload,
+)
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+from . import storage
+from .models import WaybillImage
+
+
+class StoredUploadedFile(UploadedFile):
+    """An upload already written to its final name in storage.
+
+    stored_name is the storage name to assign to the ImageField, so the
+    file is not copied again, and content_hash its SHA-256.
+    """
+
+    def __init__(self, stored_name, content_hash, **kwargs):
+        super().__init__(
+            file=default_storage.open(stored_name, "rb"),
+            **kwargs,
+        )
+        self.stored_name = stored_name
+        self.content_hash = content_hash
+
+
+# Content types presigned upload forms accept
+DIRECT_UPLOAD_CONTENT_TYPES = {
+    "image/jpeg",
+    "image/png",
+    "image/tiff",
+    "application/pdf",
+}
+DIRECT_UPLOAD_SALT = "waybill.direct-upload"
+
+
+def sign_direct_upload(names):
+    """A token naming the storage keys handed out for a direct upload.
+
+    Clients can only register files under names the app reserved for them.
+    """
+    return signing.dumps(names, salt=DIRECT_UPLOAD_SALT)
+
+
+def unsign_direct_upload(token):
+    """The storage names of a direct upload token, or None if invalid"""
+    try:
+        # Uploads may start until their forms expire and take a while after
+        names = signing.loads(
+            token, salt=DIRECT_UPLOAD_SALT, max_age=2 * settings.DIRECT_UPLOAD_EXPIRY
+        )
+    except signing.BadSignature:
+        return None
+    if not isinstance(names, list) or not names:
+        return None
+    return names
+
+
+def missing_uploads(names):
+    """The names of a direct upload that are not in storage (yet)"""
+    return [name for name in names if not default_storage.exists(name)]
+
+
+class HashedUploadedFile(UploadedFile):
+    """An upload spooled to a local temp file, with its SHA-256.
+
+    Used when the storage is remote: the file is sent on when its
+    WaybillImage is saved.
+    """
+
+    def __init__(self, file, content_hash, **kwargs):
+        super().__init__(file=file, **kwargs)
+        self.content_hash = content_hash
+
+
+class DirectUpload:
+    """A file a client POSTed straight to storage with a presigned form.
+
+    The app never saw its bytes, so it has no content hash until its job
+    takes one.
+    """
+
+    content_hash = ""
+
+    def __init__(self, stored_name):
+        self.stored_name = stored_name
+
+
+class WaybillUploadHandler(FileUploadHandler):
+    """Streams each uploaded file to its final location as it arrives.
+
+    Parts are hashed while they are written, so neither Django's temporary
+    upload files nor a second copy into MEDIA_ROOT are needed. With remote
+    storage files are spooled to a temp file instead and sent on once the
+    request is accepted. Uploads over
+    UPLOAD_MAX_FILE_SIZE or UPLOAD_MAX_BATCH_SIZE are rejected as soon as
+    the limit is crossed (or before parsing, when Content-Length already
+    exceeds the batch limit) and everything stored so far is removed.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.error = None
+        self.batch_size = 0
+        self.stored_names = []
+        # The storage file being written; not named `file`, which Django's
+        # parser would close again (and trip over None) when an upload stops
+        self.target = None
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        if content_length > settings.UPLOAD_MAX_BATCH_SIZE:
+            self.error = (
+                f"Upload of {content_length} bytes exceeds the batch limit of "
+                f"{settings.UPLOAD_MAX_BATCH_SIZE} bytes"
+            )
+            # Skip parsing entirely; no part of the body is stored
+            return QueryDict(), MultiValueDict()
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        if self.content_length and self.content_length > settings.UPLOAD_MAX_FILE_SIZE:
+            self.reject(self.file_too_large_error())
+
+        if storage.is_local(default_storage):
+            self.stored_name, self.target = self.create_target(file_name)
+            self.stored_names.append(self.stored_name)
+        else:
+            self.stored_name = None
+            self.target = tempfile.NamedTemporaryFile(
+                suffix=os.path.splitext(file_name)[1],
+                dir=settings.FILE_UPLOAD_TEMP_DIR,
+            )
+        self.digest = hashlib.sha256()
+        self.size = 0
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        self.batch_size += len(raw_data)
+        if self.size > settings.UPLOAD_MAX_FILE_SIZE:
+            self.reject(self.file_too_large_error())
+        if self.batch_size > settings.UPLOAD_MAX_BATCH_SIZE:
+            self.reject(
+                f"Upload exceeds the batch limit of "
+                f"{settings.UPLOAD_MAX_BATCH_SIZE} bytes"
+            )
+
+        self.digest.update(raw_data)
+        self.target.write(raw_data)
+
+    def file_complete(self, file_size):
+        target, self.target = self.target, None
+        kwargs = {
+            "name": self.file_name,
+            "content_type": self.content_type,
+            "size": file_size,
+            "charset": self.charset,
+            "content_type_extra": self.content_type_extra,
+        }
+        if self.stored_name is None:
+            target.seek(0)
+            return HashedUploadedFile(target, self.digest.hexdigest(), **kwargs)
+
+        target.close()
+        return StoredUploadedFile(self.stored_name, self.digest.hexdigest(), **kwargs)
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def file_too_large_error(self):
+        return (
+            f"{self.file_name} exceeds the per-file limit of "
+            f"{settings.UPLOAD_MAX_FILE_SIZE} bytes"
+        )
+
+    def create_target(self, file_name):
+        """Reserve a unique storage name and open it for writing"""
+        field = WaybillImage._meta.get_field("image")
+        name = field.generate_filename(None, file_name)
+        while True:
+            name = default_storage.get_available_name(name)
+            path = default_storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                # Exclusive create: a concurrent upload may take the same name
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                continue
+            return name, os.fdopen(fd, "wb")
+
+    def reject(self, error):
+        self.error = error
+        self.discard()
+        # Django drains the rest of the body without storing it
+        raise StopUpload(connection_reset=False)
+
+    def discard(self):
+        """Delete every file this handler stored"""
+        if self.target is not None:
+            self.target.close()
+            self.target = None
+        for name in self.stored_names:
+            default_storage.delete(name)
+        self.stored_names = []
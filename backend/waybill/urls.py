@@ -1,12 +1,45 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from .views import ExtractionModelViewSet, WaybillImageViewSet, test_api
+from .views import (
+    ExtractionModelViewSet,
+    WaybillImageViewSet,
+    batch_status,
+    bulk_upload,
+    direct_upload,
+    extraction_engines,
+    extraction_stats,
+    image_derivative,
+    metrics,
+    ocr_cache_stats,
+    provider_stats,
+    test_api,
+    upload_urls,
+)
 
 router = DefaultRouter()
 router.register(r"extraction-models", ExtractionModelViewSet)
 router.register(r"waybills", WaybillImageViewSet)
 
 urlpatterns = [
+    # Async views; ahead of the router so its detail routes do not match them
+    path("waybills/bulk_upload/", bulk_upload, name="waybill-bulk-upload"),
+    path("waybills/upload_urls/", upload_urls, name="waybill-upload-urls"),
+    path("waybills/direct_upload/", direct_upload, name="waybill-direct-upload"),
+    path(
+        "waybills/batches/<uuid:batch_id>/", batch_status, name="waybill-batch-status"
+    ),
     path("", include(router.urls)),
     path("test-api/", test_api, name="test-api"),
+    path("provider-stats/", provider_stats, name="provider-stats"),
+    path("ocr-cache-stats/", ocr_cache_stats, name="ocr-cache-stats"),
+    path("extraction-engines/", extraction_engines, name="extraction-engines"),
+    path("extraction-stats/", extraction_stats, name="extraction-stats"),
+    path("metrics/", metrics, name="metrics"),
+    # Only SHA-256 hex digests, so no other path reaches the storage
+    re_path(
+        r"^images/(?P<content_hash>[0-9a-f]{64})/"
+        r"(?P<kind>[a-z]+)-(?P<size>[0-9]+)\.jpg$",
+        image_derivative,
+        name="image-derivative",
+    ),
 ]
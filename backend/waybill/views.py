@@ -1,24 +1,56 @@
-import boto3
 import json
+import os
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
-from django.http import JsonResponse
-from .models import ExtractionModel, WaybillImage, ExtractedData
+from django.db.models import Exists, OuterRef
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseNotFound,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from . import (
+    derivatives,
+    export_artifacts,
+    exports,
+    extractors,
+    fields,
+    jobs,
+    ocr_cache,
+    storage,
+    telemetry,
+    uploads,
+)
+from .clients import provider_clients
+from .models import (
+    ExtractionModel,
+    WaybillImage,
+    ExtractedData,
+    ExtractedField,
+    ProcessingStatus,
+    UploadBatch,
+)
+from .renderers import EXPORT_RENDERERS
 from .serializers import (
     ExtractionModelSerializer,
     WaybillImageSerializer,
     ExtractedDataSerializer,
 )
-from openpyxl import Workbook
-from django.http import HttpResponse
-from datetime import datetime
-import os
-import base64
-from mistralai import Mistral
+import logging
 from django.shortcuts import render
 
+logger = logging.getLogger(__name__)
+
 
 # Simple view to test API
 @api_view(["GET"])
@@ -28,641 +60,408 @@ def test_api(request):
     return Response(serializer.data)
 
 
-class ExtractionModelViewSet(viewsets.ModelViewSet):
-    queryset = ExtractionModel.objects.all()
-    serializer_class = ExtractionModelSerializer
+@api_view(["GET"])
+def provider_stats(request):
+    """Usage of the shared provider clients in this process"""
+    return Response(provider_clients.stats())
 
 
-class WaybillImageViewSet(viewsets.ModelViewSet):
-    queryset = WaybillImage.objects.all()
-    serializer_class = WaybillImageSerializer
+@api_view(["GET"])
+def ocr_cache_stats(request):
+    """Hit/miss counters and size of the OCR result cache"""
+    return Response(ocr_cache.stats())
 
-    def get_text_for_cell(self, cell, blocks):
-        """Get text for a cell by finding overlapping word blocks"""
-        if "Text" in cell:
-            return cell["Text"]
-
-        cell_box = cell["Geometry"]["BoundingBox"]
-        cell_text = []
-
-        # Calculate cell boundaries with a small margin
-        margin = 0.005  # Add a small margin to account for slight misalignments
-        cell_left = cell_box["Left"] - margin
-        cell_right = cell_box["Left"] + cell_box["Width"] + margin
-        cell_top = cell_box["Top"] - margin
-        cell_bottom = cell_box["Top"] + cell_box["Height"] + margin
-
-        for block in blocks:
-            if block["BlockType"] == "WORD":
-                word_box = block["Geometry"]["BoundingBox"]
-                word_left = word_box["Left"]
-                word_right = word_box["Left"] + word_box["Width"]
-                word_top = word_box["Top"]
-                word_bottom = word_box["Top"] + word_box["Height"]
-
-                # Check if word significantly overlaps with cell
-                horizontal_overlap = word_right > cell_left and word_left < cell_right
-                vertical_overlap = word_bottom > cell_top and word_top < cell_bottom
-
-                if horizontal_overlap and vertical_overlap:
-                    # Calculate overlap percentage
-                    overlap_width = min(word_right, cell_right) - max(
-                        word_left, cell_left
-                    )
-                    overlap_height = min(word_bottom, cell_bottom) - max(
-                        word_top, cell_top
-                    )
-                    word_area = word_box["Width"] * word_box["Height"]
-                    overlap_area = max(0, overlap_width) * max(0, overlap_height)
-
-                    # If word overlaps significantly with the cell (>30% of word area)
-                    if overlap_area > 0.3 * word_area:
-                        cell_text.append(block["Text"])
-
-        return " ".join(cell_text)
-
-    def get_table_cells(self, table_block, blocks):
-        """Get all cells belonging to a specific table"""
-        if "Relationships" not in table_block:
-            return []
-
-        cell_ids = []
-        for relationship in table_block["Relationships"]:
-            if relationship["Type"] == "CHILD":
-                cell_ids.extend(relationship["Ids"])
-
-        cells = []
-        for block in blocks:
-            if block["Id"] in cell_ids and block["BlockType"] == "CELL":
-                # Get the text for this cell by looking at overlapping word blocks
-                block["Text"] = self.get_text_for_cell(block, blocks)
-                cells.append(block)
-
-        return cells
-
-    def extract_table_data(self, table_block, blocks):
-        """Extract table data and confidence scores from Textract blocks for a specific table"""
-        cells = {}
-        confidence_scores = {}
-
-        # Get cells for this specific table
-        table_cells = self.get_table_cells(table_block, blocks)
-
-        # Process cells
-        for cell in table_cells:
-            row_idx = cell["RowIndex"]
-            col_idx = cell["ColumnIndex"]
-
-            # Store cell text with single quote prefix for non-empty text
-            text = cell.get("Text", "").strip()
-            if text:
-                # Handle special characters and formatting
-                text = text.replace('"', '""')  # Escape double quotes
-                text = f"'{text}"
-
-            # Store cell data
-            cells[(row_idx, col_idx)] = text
-
-            # Store confidence score
-            confidence_scores[(row_idx, col_idx)] = cell.get("Confidence", 0)
-
-        if not cells:
-            return None
-
-        # Find dimensions of the table
-        max_row = max(pos[0] for pos in cells.keys())
-        max_col = max(pos[1] for pos in cells.keys())
-
-        # Create table data structure
-        table_data = {
-            "rows": [["" for _ in range(max_col)] for _ in range(max_row)],
-            "confidence_scores": [[0 for _ in range(max_col)] for _ in range(max_row)],
-        }
 
-        # Fill in the data
-        for (row_idx, col_idx), text in cells.items():
-            table_data["rows"][row_idx - 1][col_idx - 1] = text
-            table_data["confidence_scores"][row_idx - 1][col_idx - 1] = (
-                confidence_scores.get((row_idx, col_idx), 0)
-            )
+@api_view(["GET"])
+def extraction_stats(request):
+    """Per-stage pages, escalation rate, latency and cost of extractions"""
+    return Response(jobs.stage_stats())
+
+
+def metrics(request):
+    """Stage latency histograms of this process in the Prometheus text format"""
+    if not settings.METRICS_ENABLED:
+        return HttpResponseNotFound("Metrics are disabled")
+    return HttpResponse(
+        telemetry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@api_view(["GET"])
+def extraction_engines(request):
+    """Registered extraction engines with their limits and capabilities"""
+    return Response(
+        [extractor.capabilities() for extractor in extractors.engines().values()]
+    )
+
+
+@csrf_exempt
+@require_POST
+async def bulk_upload(request):
+    """Store uploaded waybill images and queue them for extraction.
+
+    An async view: under ASGI it runs on the event loop, and only parsing
+    (which streams the files to storage) and the database work that has to
+    be transactional go to a thread.
+    """
+    # Stream the files straight to storage instead of buffering the body
+    upload_handler = uploads.WaybillUploadHandler(request)
+    request.upload_handlers = [upload_handler]
+    data, files = await sync_to_async(lambda: (request.POST, request.FILES))()
 
-        return table_data
-
-    def extract_with_textract(self, image_path):
-        if not settings.AWS_ACCESS_KEY_ID or not settings.AWS_SECRET_ACCESS_KEY:
-            print("AWS credentials not found, returning demo data")
-            return {
-                "sender": {
-                    "name": "AWS Textract Demo Sender",
-                    "address": "123 AWS Street, AWS City, 12345",
-                    "phone": "123-456-7890",
-                },
-                "recipient": {
-                    "name": "AWS Textract Demo Recipient",
-                    "address": "456 AWS Avenue, AWS City, 67890",
-                    "phone": "987-654-3210",
-                },
-                "shipment": {
-                    "tracking_number": "AWS123456789",
-                    "date": "2025-03-17",
-                    "weight": "2.5 kg",
-                    "service_type": "Express",
-                },
-                "note": "This is demo data since AWS API keys are not configured.",
-            }
-
-        print(f"\nProcessing file with AWS Textract: {os.path.basename(image_path)}")
-        print(f"Full path: {image_path}")
-
-        textract = boto3.client(
-            "textract",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_REGION,
+    images = files.getlist("images")
+    extraction_model_id = data.get("extraction_model")
+
+    if upload_handler.error:
+        return JsonResponse(
+            {"error": upload_handler.error},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
         )
 
-        with open(image_path, "rb") as document:
-            print("Reading document and calling Textract API...")
-            response = textract.analyze_document(
-                Document={"Bytes": document.read()}, FeatureTypes=["TABLES", "FORMS"]
-            )
-            print("Received response from Textract API")
-
-        # Initialize the structured response
-        structured_data = {
-            "tables": [],
-            "forms": {},
-            "raw_text": "",
-            "confidence_scores": {},
-        }
+    if not images:
+        return JsonResponse(
+            {"error": "No images provided"}, status=status.HTTP_400_BAD_REQUEST
+        )
 
-        # Create a map of block IDs to blocks
-        blocks_map = {block["Id"]: block for block in response["Blocks"]}
-        print(f"Total blocks found: {len(response['Blocks'])}")
-
-        # Process tables
-        table_blocks = [
-            block for block in response["Blocks"] if block["BlockType"] == "TABLE"
-        ]
-        print(f"Found {len(table_blocks)} tables")
-
-        for i, table_block in enumerate(table_blocks, 1):
-            print(f"\nProcessing Table {i}:")
-            table_data = self.extract_table_data(table_block, response["Blocks"])
-            if table_data:
-                print(f"Table {i} data extracted successfully")
-                print(f"Rows: {len(table_data['rows'])}")
-                print(
-                    f"Columns: {len(table_data['rows'][0]) if table_data['rows'] else 0}"
-                )
-                structured_data["tables"].append(table_data)
-            else:
-                print(f"No data found in Table {i}")
-
-        # Process form fields (key-value pairs)
-        form_fields = 0
-        for block in response["Blocks"]:
-            if block["BlockType"] == "KEY_VALUE_SET" and "KEY" in block["EntityTypes"]:
-                key = self.get_text_for_cell(block, response["Blocks"])
-                value = ""
-                confidence = block.get("Confidence", 0)
-
-                # Find the corresponding value
-                for relationship in block.get("Relationships", []):
-                    if relationship["Type"] == "VALUE":
-                        for value_id in relationship["Ids"]:
-                            value_block = blocks_map[value_id]
-                            value = self.get_text_for_cell(
-                                value_block, response["Blocks"]
-                            )
-                            confidence = value_block.get("Confidence", confidence)
-
-                if key and value:
-                    form_fields += 1
-                    structured_data["forms"][key] = {
-                        "value": value,
-                        "confidence": confidence,
-                    }
-
-        print(f"\nExtracted {form_fields} form fields")
-
-        # Collect raw text
-        raw_text_lines = []
-        for block in response["Blocks"]:
-            if block["BlockType"] == "LINE":
-                raw_text_lines.append(self.get_text_for_cell(block, response["Blocks"]))
-
-        structured_data["raw_text"] = "\n".join(raw_text_lines)
-        print(f"Extracted {len(raw_text_lines)} lines of raw text")
-
-        print("\nExtraction completed successfully")
-        return structured_data
-
-    def extract_with_mistral(self, image_path):
-        if not settings.MISTRAL_API_KEY:
-            # Return dummy data for demo purposes
-            return {
-                "sender": {
-                    "name": "Mistral Demo Sender",
-                    "address": "123 Mistral Street, Mistral City, 12345",
-                    "phone": "123-456-7890",
-                },
-                "recipient": {
-                    "name": "Mistral Demo Recipient",
-                    "address": "456 Mistral Avenue, Mistral City, 67890",
-                    "phone": "987-654-3210",
-                },
-                "shipment": {
-                    "tracking_number": "MISTRAL123456789",
-                    "date": "2025-03-17",
-                    "weight": "2.5 kg",
-                    "service_type": "Express",
-                },
-                "note": "This is demo data since Mistral API key is not configured.",
-            }
-
-        try:
-            # Initialize Mistral client
-            client = Mistral(api_key=settings.MISTRAL_API_KEY)
-
-            # Read the image file and encode it to base64
-            with open(image_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode("utf-8")
-
-            # Process the image using Mistral OCR with the correct format
-            ocr_response = client.ocr.process(
-                model="mistral-ocr-latest",
-                document={
-                    "type": "image_url",
-                    "image_url": f"data:image/jpeg;base64,{image_data}",
-                },
-            )
+    async def reject(error, status_code=status.HTTP_400_BAD_REQUEST):
+        await sync_to_async(upload_handler.discard)()
+        return JsonResponse({"error": error}, status=status_code)
+
+    try:
+        extraction_model = await ExtractionModel.objects.aget(id=extraction_model_id)
+        logger.info("Using extraction model: %s", extraction_model.name)
+    except (ExtractionModel.DoesNotExist, ValueError):
+        return await reject("Invalid extraction model")
+
+    try:
+        extractor = extractors.for_model(extraction_model)
+    except extractors.UnknownEngine as e:
+        return await reject(str(e))
+
+    # Check for required API keys for the selected engine
+    if not extractor.is_configured():
+        return await reject(
+            extractor.configuration_error(), status.HTTP_503_SERVICE_UNAVAILABLE
+        )
 
-            # Convert the OCR response to a dictionary
-            response_dict = json.loads(ocr_response.model_dump_json())
-
-            # Structure the data to include all OCR information
-            structured_data = {
-                "ocr_info": {
-                    "model": response_dict.get("model", ""),
-                    "usage_info": response_dict.get("usage_info", {}),
-                },
-                "pages": [],
-            }
-
-            # Process each page
-            for page in response_dict.get("pages", []):
-                page_data = {
-                    "index": page.get("index", 0),
-                    "dimensions": page.get("dimensions", {}),
-                    "images": page.get("images", []),
-                    "markdown": page.get("markdown", ""),
-                }
-                structured_data["pages"].append(page_data)
-
-            # Add extracted text analysis
-            extracted_text = ""
-            for page in ocr_response.pages:
-                extracted_text += page.markdown + "\n"
-
-            structured_data["extracted_text"] = {
-                "raw_text": extracted_text,
-                "analysis": {
-                    "sender": {},
-                    "recipient": {},
-                    "shipment": {},
-                },
-            }
-
-            # Parse the extracted text to populate structured data
-            lines = extracted_text.split("\n")
-            for line in lines:
-                line = line.strip()
-                if "sender" in line.lower() or "from" in line.lower():
-                    structured_data["extracted_text"]["analysis"]["sender"]["info"] = (
-                        line
-                    )
-                elif "recipient" in line.lower() or "to" in line.lower():
-                    structured_data["extracted_text"]["analysis"]["recipient"][
-                        "info"
-                    ] = line
-                elif "tracking" in line.lower() or "waybill" in line.lower():
-                    structured_data["extracted_text"]["analysis"]["shipment"][
-                        "tracking_number"
-                    ] = line
-                elif "date" in line.lower():
-                    structured_data["extracted_text"]["analysis"]["shipment"][
-                        "date"
-                    ] = line
-                elif "weight" in line.lower():
-                    structured_data["extracted_text"]["analysis"]["shipment"][
-                        "weight"
-                    ] = line
-
-            return structured_data
-
-        except Exception as e:
-            print(f"Error in Mistral OCR extraction: {str(e)}")
-            # Return dummy data if there's an error with the API
-            return {
-                "sender": {
-                    "name": "Mistral Error Fallback",
-                    "address": "Error occurred during extraction",
-                    "phone": "N/A",
-                },
-                "recipient": {
-                    "name": "Mistral Error Fallback",
-                    "address": "Error occurred during extraction",
-                    "phone": "N/A",
-                },
-                "shipment": {
-                    "tracking_number": "ERROR123",
-                    "date": datetime.now().strftime("%Y-%m-%d"),
-                    "weight": "N/A",
-                    "service_type": "N/A",
-                },
-                "error": str(e),
-                "note": "This is fallback data due to an error with the Mistral API.",
-            }
-
-    @action(detail=False, methods=["post"])
-    def bulk_upload(self, request):
-        images = request.FILES.getlist("images")
-        extraction_model_id = request.data.get("extraction_model")
-
-        if not images:
-            return Response(
-                {"error": "No images provided"}, status=status.HTTP_400_BAD_REQUEST
-            )
+    # Persist the images and queue them; workers run the extraction
+    try:
+        with telemetry.span("upload_save", extraction_model.engine):
+            batch = await sync_to_async(jobs.enqueue_batch)(extraction_model, images)
+    except Exception as e:
+        logger.exception("Error uploading images")
+        return await reject(
+            f"Error uploading images: {str(e)}",
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
 
-        try:
-            extraction_model = ExtractionModel.objects.get(id=extraction_model_id)
-            print(f"\nUsing extraction model: {extraction_model.name}")
-        except ExtractionModel.DoesNotExist:
-            return Response(
-                {"error": "Invalid extraction model"},
+    jobs.ensure_workers()
+    return await batch_accepted(batch)
+
+
+async def batch_accepted(batch):
+    """The 202 response for a queued upload batch"""
+    uploaded_ids = [
+        waybill_id
+        async for waybill_id in batch.jobs.order_by("id").values_list(
+            "waybill_image_id", flat=True
+        )
+    ]
+    download_url = f"waybills/download_excel/?ids={','.join(map(str, uploaded_ids))}"
+    logger.info("Queued %d images in batch %s", len(uploaded_ids), batch.id)
+
+    return JsonResponse(
+        {
+            "message": f"Queued {len(uploaded_ids)} images for extraction",
+            "batch_id": str(batch.id),
+            "status_url": f"waybills/batches/{batch.id}/",
+            "ids": uploaded_ids,
+            "download_url": download_url,
+        },
+        status=status.HTTP_202_ACCEPTED,
+    )
+
+
+def parse_json_body(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@csrf_exempt
+@require_POST
+async def upload_urls(request):
+    """Presigned forms to upload waybill images straight to storage.
+
+    Takes {"files": [{"name": ..., "content_type": ...}]}. Each file is
+    POSTed with its form to S3; the returned token then registers them all
+    with direct_upload. Only available with S3 storage.
+    """
+    if not storage.is_s3():
+        return JsonResponse(
+            {"error": "Direct uploads need S3 storage (MEDIA_STORAGE=s3)"},
+            status=status.HTTP_501_NOT_IMPLEMENTED,
+        )
+
+    data = parse_json_body(request)
+    files = data.get("files") if data else None
+    if not files or not isinstance(files, list):
+        return JsonResponse(
+            {"error": "No files provided"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(files) > settings.DATA_UPLOAD_MAX_NUMBER_FILES:
+        return JsonResponse(
+            {
+                "error": f"At most {settings.DATA_UPLOAD_MAX_NUMBER_FILES} files "
+                "per upload"
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    forms = []
+    for file in files:
+        file = file if isinstance(file, dict) else {}
+        content_type = file.get("content_type", "")
+        if content_type not in uploads.DIRECT_UPLOAD_CONTENT_TYPES:
+            return JsonResponse(
+                {"error": f"Unsupported content type: {content_type!r}"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        name = storage.upload_name(os.path.basename(file.get("name") or "waybill"))
+        # Signing is local; no request to the storage
+        form = storage.presigned_upload(name, content_type)
+        forms.append({"name": file.get("name"), "key": name, **form})
 
-        # Check for required API keys based on the selected model
-        if (
-            extraction_model.name.lower() == "aws textract"
-            and not settings.AWS_ACCESS_KEY_ID
-        ):
-            return Response(
-                {
-                    "error": "AWS credentials are not configured. Please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables."
-                },
-                status=status.HTTP_503_SERVICE_UNAVAILABLE,
-            )
+    return JsonResponse(
+        {
+            "uploads": forms,
+            "token": uploads.sign_direct_upload([form["key"] for form in forms]),
+            "expires_in": settings.DIRECT_UPLOAD_EXPIRY,
+        }
+    )
 
-        if extraction_model.name.lower() == "mistral" and not settings.MISTRAL_API_KEY:
-            return Response(
-                {
-                    "error": "Mistral API key is not configured. Please set MISTRAL_API_KEY environment variable."
-                },
-                status=status.HTTP_503_SERVICE_UNAVAILABLE,
-            )
 
-        # Ensure media directory exists
-        media_root = os.path.join(settings.BASE_DIR, "media")
-        os.makedirs(media_root, exist_ok=True)
+@csrf_exempt
+@require_POST
+async def direct_upload(request):
+    """Queue images a client uploaded straight to storage.
+
+    Takes {"token": ..., "extraction_model": ...} with the token from
+    upload_urls, once every file was uploaded, and answers like bulk_upload.
+    """
+    data = parse_json_body(request) or {}
+    names = uploads.unsign_direct_upload(data.get("token", ""))
+    if names is None:
+        return JsonResponse(
+            {"error": "Invalid or expired upload token"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        extraction_model = await ExtractionModel.objects.aget(
+            id=data.get("extraction_model")
+        )
+    except (ExtractionModel.DoesNotExist, ValueError, TypeError):
+        return JsonResponse(
+            {"error": "Invalid extraction model"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        extractor = extractors.for_model(extraction_model)
+    except extractors.UnknownEngine as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if not extractor.is_configured():
+        return JsonResponse(
+            {"error": extractor.configuration_error()},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
 
-        uploaded_images = []
-        uploaded_ids = []  # Track the IDs of uploaded waybills
+    # One HEAD request per object; their bytes stay in storage
+    missing = await sync_to_async(uploads.missing_uploads)(names)
+    if missing:
+        return JsonResponse(
+            {"error": "Files were not uploaded", "missing": missing},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-        print(f"\nProcessing {len(images)} images:")
-        for idx, image in enumerate(images, 1):
-            try:
-                print(f"\n[{idx}/{len(images)}] Processing: {image.name}")
+    images = [uploads.DirectUpload(name) for name in names]
+    with telemetry.span("upload_save", extraction_model.engine):
+        batch = await sync_to_async(jobs.enqueue_batch)(extraction_model, images)
 
-                # Create the waybill image record
-                waybill_image = WaybillImage.objects.create(
-                    image=image, extraction_model_id=extraction_model_id
-                )
-                print(f"Created waybill record. ID: {waybill_image.id}")
-                print(f"Image saved to: {waybill_image.image.path}")
-
-                # Store the ID for the download URL
-                uploaded_ids.append(waybill_image.id)
-
-                # Process the image based on the selected model
-                try:
-                    print(f"Starting extraction with {extraction_model.name}...")
-                    if extraction_model.name.lower() == "aws textract":
-                        extracted_data = self.extract_with_textract(
-                            waybill_image.image.path
-                        )
-                        print("AWS Textract extraction completed")
-                        if "tables" in extracted_data:
-                            print(f"Found {len(extracted_data['tables'])} tables")
-                            for i, table in enumerate(extracted_data["tables"], 1):
-                                print(f"Table {i}: {len(table['rows'])} rows")
-                    elif extraction_model.name.lower() == "mistral":
-                        print("Calling Mistral API for extraction...")
-                        extracted_data = self.extract_with_mistral(
-                            waybill_image.image.path
-                        )
-                        print("Mistral API extraction completed")
-
-                    # Create ExtractedData record
-                    ExtractedData.objects.create(
-                        waybill_image=waybill_image,
-                        extracted_data=extracted_data,
-                    )
-                    print("Extraction data saved to database")
-
-                    # Mark the waybill as processed
-                    waybill_image.processed = True
-                    waybill_image.save()
-                    print(f"Waybill {waybill_image.id} marked as processed")
-
-                    uploaded_images.append(waybill_image)
-
-                except Exception as e:
-                    print(f"Error processing image {image.name}: {str(e)}")
-                    # Delete the waybill image if processing failed
-                    waybill_image.delete()
-                    return Response(
-                        {"error": f"Error processing image {image.name}: {str(e)}"},
-                        status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    )
-
-            except Exception as e:
-                print(f"Error uploading image {image.name}: {str(e)}")
-                return Response(
-                    {"error": f"Error uploading image {image.name}: {str(e)}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
+    jobs.ensure_workers()
+    return await batch_accepted(batch)
+
+
+@require_GET
+async def batch_status(request, batch_id):
+    """Per-image extraction progress of an upload batch"""
+    try:
+        batch = await UploadBatch.objects.aget(id=batch_id)
+    except UploadBatch.DoesNotExist:
+        return JsonResponse(
+            {"error": "Batch not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    return JsonResponse(await jobs.abatch_status(batch))
+
+
+@require_GET
+def image_derivative(request, content_hash, kind, size):
+    """A thumbnail or preview of a waybill image, rendered on first request.
+
+    The URL names the content hash and size, so its bytes never change and
+    clients and CDNs may keep them for a year without revalidating.
+    """
+    if settings.IMAGE_DERIVATIVES.get(kind) != int(size):
+        return HttpResponseNotFound()
 
-        if uploaded_images:
-            # Construct the download URL with the correct endpoint
-            download_url = (
-                f"waybills/download_excel/?ids={','.join(map(str, uploaded_ids))}"
+    etag = f'"{content_hash}-{kind}-{size}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    data = derivatives.get(content_hash, kind)
+    if data is None:
+        return HttpResponseNotFound()
+
+    response = HttpResponse(data, content_type=derivatives.CONTENT_TYPE)
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+class ExtractionModelViewSet(viewsets.ModelViewSet):
+    queryset = ExtractionModel.objects.all()
+    serializer_class = ExtractionModelSerializer
+
+
+class WaybillImageViewSet(viewsets.ModelViewSet):
+    queryset = WaybillImage.objects.all()
+    serializer_class = WaybillImageSerializer
+
+    def filter_queryset(self, queryset):
+        """Apply ?tracking_number= and ?min_confidence= through ExtractedField"""
+        queryset = super().filter_queryset(queryset)
+        params = self.request.query_params
+
+        tracking_number = params.get("tracking_number", "").strip()
+        if tracking_number:
+            matches = ExtractedField.objects.filter(
+                name__in=fields.TRACKING_NUMBER_NAMES,
+                lookup_value=fields.normalize_value(tracking_number, "tracking_number"),
             )
-            print(f"\nSuccessfully processed {len(uploaded_images)} images")
-            print(f"Download URL: {download_url}")
+            queryset = queryset.filter(id__in=matches.values("waybill_image_id"))
 
-            return Response(
-                {
-                    "message": f"Successfully uploaded {len(uploaded_images)} images",
-                    "ids": uploaded_ids,
-                    "download_url": download_url,
-                },
-                status=status.HTTP_201_CREATED,
+        min_confidence = params.get("min_confidence")
+        if min_confidence:
+            try:
+                min_confidence = float(min_confidence)
+            except ValueError:
+                raise ParseError("min_confidence must be a number")
+            # Waybills with scored fields, none of them below the threshold
+            scored = ExtractedField.objects.filter(
+                waybill_image=OuterRef("pk"), confidence__isnull=False
             )
-        else:
-            return Response(
-                {"error": "Failed to upload any images"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            queryset = queryset.filter(Exists(scored)).exclude(
+                Exists(scored.filter(confidence__lt=min_confidence))
             )
 
-    @action(detail=False, methods=["get"])
-    def download_excel(self, request):
-        waybill_ids = request.query_params.get("ids", "")
-        print(f"Downloading Excel for waybill IDs: {waybill_ids}")
-
-        wb = Workbook()
-        default_sheet = wb.active
-        default_sheet.title = "Summary"
-
-        # Add a header to the default sheet
-        default_sheet["A1"] = "Waybill Extraction Summary"
-        default_sheet["A2"] = "Generated on"
-        default_sheet["B2"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return queryset
 
-        # Get waybills
+    def get_export_waybills(self, request):
+        """Waybills selected by ?ids= (or all of them) and the list filters"""
+        waybill_ids = request.query_params.get("ids", "")
         if waybill_ids:
             ids_list = [
                 int(id.strip()) for id in waybill_ids.split(",") if id.strip().isdigit()
             ]
-            waybills = WaybillImage.objects.filter(id__in=ids_list)
-        else:
-            waybills = WaybillImage.objects.all()
+            return self.filter_queryset(WaybillImage.objects.filter(id__in=ids_list))
+        return self.filter_queryset(WaybillImage.objects.all())
 
-        if not waybills.exists():
-            default_sheet["A4"] = "No waybills found"
-        else:
-            # Add summary headers
-            default_sheet["A4"] = "Waybills"
-            default_sheet["A5"] = "ID"
-            default_sheet["B5"] = "Upload Date"
-            default_sheet["C5"] = "Extraction Model"
-            default_sheet["D5"] = "Processed"
-
-            # Add summary data
-            row = 6
-            for waybill in waybills:
-                default_sheet[f"A{row}"] = waybill.id
-                default_sheet[f"B{row}"] = waybill.uploaded_at.strftime(
-                    "%Y-%m-%d %H:%M:%S"
-                )
-                default_sheet[f"C{row}"] = (
-                    waybill.extraction_model.name if waybill.extraction_model else "N/A"
-                )
-                default_sheet[f"D{row}"] = "Yes" if waybill.processed else "No"
-                row += 1
-
-            # Process each waybill
-            for waybill in waybills:
-                try:
-                    extracted_data = waybill.extracteddata.extracted_data
-
-                    # Handle AWS Textract data
-                    if isinstance(extracted_data, dict) and "tables" in extracted_data:
-                        # Create sheets for each table
-                        for table_idx, table in enumerate(extracted_data["tables"], 1):
-                            sheet_name = f"Table_{table_idx}"
-                            table_sheet = wb.create_sheet(title=sheet_name)
-
-                            # Write table data
-                            for row_idx, row_data in enumerate(table["rows"]):
-                                for col_idx, cell_value in enumerate(row_data):
-                                    # Remove single quote prefix if present
-                                    if isinstance(
-                                        cell_value, str
-                                    ) and cell_value.startswith("'"):
-                                        cell_value = cell_value[1:]
-                                    table_sheet.cell(
-                                        row=row_idx + 1,
-                                        column=col_idx + 1,
-                                        value=cell_value,
-                                    )
-
-                            # Add empty row
-                            empty_row = len(table["rows"]) + 1
-
-                            # Add confidence scores header
-                            confidence_header_row = empty_row + 1
-                            table_sheet.cell(
-                                row=confidence_header_row,
-                                column=1,
-                                value="Confidence Scores % (Table Cell)",
-                            )
-
-                            # Write confidence scores
-                            for row_idx, confidence_row_data in enumerate(
-                                table["confidence_scores"]
-                            ):
-                                for col_idx, confidence in enumerate(
-                                    confidence_row_data
-                                ):
-                                    table_sheet.cell(
-                                        row=confidence_header_row + row_idx + 1,
-                                        column=col_idx + 1,
-                                        value=f"{confidence:.8f}",
-                                    )
-
-                        # Create info sheet for forms and raw text
-                        info_sheet = wb.create_sheet(title="Forms_and_Text")
-
-                        # Add form fields
-                        info_sheet["A1"] = "Form Fields"
-                        info_sheet["A2"] = "Field"
-                        info_sheet["B2"] = "Value"
-                        info_sheet["C2"] = "Confidence"
-
-                        row = 3
-                        for key, data in extracted_data.get("forms", {}).items():
-                            info_sheet[f"A{row}"] = key
-                            info_sheet[f"B{row}"] = data["value"]
-                            info_sheet[f"C{row}"] = f"{data['confidence']:.8f}"
-                            row += 1
-
-                        # Add raw text
-                        row += 2
-                        info_sheet[f"A{row}"] = "Raw Text"
-                        info_sheet[f"A{row + 1}"] = extracted_data.get("raw_text", "")
-
-                    else:
-                        # Handle non-Textract data
-                        other_sheet = wb.create_sheet(title=f"Waybill_{waybill.id}")
-                        other_sheet["A1"] = "Field"
-                        other_sheet["B1"] = "Value"
-
-                        if isinstance(extracted_data, dict):
-                            row = 2
-                            for key, value in extracted_data.items():
-                                other_sheet[f"A{row}"] = key
-                                other_sheet[f"B{row}"] = str(value)
-                                row += 1
-                        else:
-                            other_sheet["A2"] = "Raw Data"
-                            other_sheet["B2"] = str(extracted_data)
-
-                except ExtractedData.DoesNotExist:
-                    error_sheet = wb.create_sheet(title=f"Waybill_{waybill.id}")
-                    error_sheet["A1"] = "No extracted data available"
-
-        # Create response
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    @action(detail=False, methods=["get"], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request):
+        """Export waybills as xlsx (default), csv, ndjson or parquet via ?format="""
+        export_format = request.accepted_renderer.format
+        if export_format == "xlsx":
+            return self.download_excel(request)
+
+        waybill_ids = request.query_params.get("ids", "")
+        logger.info("Exporting %s for waybill IDs: %s", export_format, waybill_ids)
+        waybills = (
+            self.get_export_waybills(request)
+            .select_related("extraction_model", "extracteddata")
+            .order_by("id")
+            .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
         )
-        response["Content-Disposition"] = (
-            f'attachment; filename=waybills_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        filename = exports.export_filename(export_format)
+
+        if export_format == "parquet":
+            if exports.pyarrow is None:
+                return Response(
+                    {"error": "Parquet export requires pyarrow to be installed"},
+                    status=status.HTTP_501_NOT_IMPLEMENTED,
+                )
+            with telemetry.span("export"):
+                spooled = exports.spool_parquet(waybills)
+            return FileResponse(
+                spooled,
+                as_attachment=True,
+                filename=filename,
+                content_type=request.accepted_renderer.media_type,
+            )
+
+        if export_format == "csv":
+            chunks = exports.stream_csv(waybills)
+        else:
+            chunks = exports.stream_ndjson(waybills)
+        response = StreamingHttpResponse(
+            telemetry.timed_iter(chunks, "export"),
+            content_type=request.accepted_renderer.media_type,
         )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=["get"])
+    def download_excel(self, request):
+        waybill_ids = request.query_params.get("ids", "")
+        logger.info("Downloading Excel for waybill IDs: %s", waybill_ids)
+        waybills = self.get_export_waybills(request)
+
+        # Serve the pre-generated artifact for this exact set of waybills
+        job = export_artifacts.get_artifact(waybills)
+        if job.status in (ProcessingStatus.QUEUED, ProcessingStatus.RUNNING):
+            response = Response(
+                {"message": "The export is still being generated"},
+                status=status.HTTP_202_ACCEPTED,
+            )
+            response["Retry-After"] = "5"
+            return response
+        if job.status == ProcessingStatus.FAILED:
+            return Response(
+                {"error": f"Error generating export: {job.error}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
 
-        wb.save(response)
+        # The job id changes whenever an invalidated artifact is rebuilt
+        etag = f'"{job.key}-{job.pk}"'
+        last_modified = int(job.finished_at.timestamp())
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return not_modified
+
+        response = FileResponse(
+            export_artifacts.open_artifact(job),
+            as_attachment=True,
+            filename=exports.export_filename(),
+            content_type=exports.XLSX_CONTENT_TYPE,
+        )
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        # Let clients cache the file but revalidate it on every request
+        response["Cache-Control"] = "private, no-cache"
         return response
 
 
@@ -677,6 +476,11 @@ def index(request):
                 "/api/extraction-models/",
                 "/api/waybills/",
                 "/api/test-api/",
+                "/api/provider-stats/",
+                "/api/ocr-cache-stats/",
+                "/api/extraction-engines/",
+                "/api/extraction-stats/",
+                "/api/metrics/",
                 "/admin/",
             ],
         },
@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'waybill_project.settings')
 
 application = get_asgi_application()
+
+# Serving: drain the job queue from this process right away, including
+# jobs left queued or running when the previous process stopped
+from waybill import jobs  # noqa: E402
+
+jobs.ensure_workers()
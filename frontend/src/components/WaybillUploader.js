@@ -42,6 +42,36 @@ console.log('Environment:', {
 
 console.log('Using API base URL:', API_BASE_URL);
 
+// Batch status polling starts fast and backs off to a slower interval
+const BATCH_POLL_INITIAL_MS = 1000;
+const BATCH_POLL_MAX_INTERVAL_MS = 15000;
+// Give up waiting on a batch after this long; its jobs keep running
+const BATCH_MAX_WAIT_MS = 10 * 60 * 1000;
+
+// Poll the batch status endpoint until every image is done or failed.
+// Throws on a failed status request or once BATCH_MAX_WAIT_MS has passed.
+const waitForBatch = async (statusUrl) => {
+  const url = `${API_BASE_URL.replace(/\/+$/, '')}/${statusUrl.replace(/^\/+/, '')}`;
+  const deadline = Date.now() + BATCH_MAX_WAIT_MS;
+  let interval = BATCH_POLL_INITIAL_MS;
+  for (;;) {
+    const response = await axios.get(url, { timeout: 10000 });
+    if (response.data.finished) {
+      return response.data;
+    }
+    if (Date.now() + interval > deadline) {
+      const error = new Error(
+        `Extraction did not finish within ${BATCH_MAX_WAIT_MS / 60000} minutes. ` +
+        'It continues in the background; download the results later.'
+      );
+      error.batchTimeout = true;
+      throw error;
+    }
+    await new Promise(resolve => setTimeout(resolve, interval));
+    interval = Math.min(interval * 2, BATCH_POLL_MAX_INTERVAL_MS);
+  }
+};
+
 const WaybillUploader = () => {
   const theme = useTheme();
   const isDarkMode = theme.palette.mode === 'dark';
@@ -95,7 +125,8 @@ const WaybillUploader = () => {
 
   const { getRootProps, getInputProps, isDragActive } = useDropzone({
     accept: {
-      'image/*': ['.jpeg', '.jpg', '.png', '.pdf']
+      'image/*': ['.jpeg', '.jpg', '.png', '.tif', '.tiff'],
+      'application/pdf': ['.pdf']
     },
     onDrop: acceptedFiles => {
       setFiles(acceptedFiles.map(file => Object.assign(file, {
@@ -128,17 +159,30 @@ const WaybillUploader = () => {
         },
       });
       
-      // Store the waybill IDs and download URL from the response
+      // Store the waybill IDs and download URL from the response, so the
+      // results can be downloaded even if waiting on the batch gives up
       if (response.data && response.data.ids) {
         setUploadedWaybillIds(response.data.ids);
         setDownloadUrl(response.data.download_url);
       }
-      
-      setSuccess(true);
       setFiles([]);
+
+      // Extraction runs in the background; wait for the batch to finish
+      if (response.data && response.data.status_url) {
+        const batch = await waitForBatch(response.data.status_url);
+        if (batch.counts.failed > 0) {
+          setError(`${batch.counts.failed} of ${batch.total} images failed to process`);
+        }
+      }
+
+      setSuccess(true);
     } catch (err) {
-      console.error('Failed to upload files:', err);
-      setError(`Failed to upload files: ${err.message}`);
+      if (err.batchTimeout) {
+        setError(err.message);
+      } else {
+        console.error('Failed to upload files:', err);
+        setError(`Failed to upload files: ${err.message}`);
+      }
     } finally {
       setUploading(false);
     }
@@ -165,10 +209,18 @@ const WaybillUploader = () => {
       
       console.log('Download URL:', url);
       
-      const response = await axios.get(url, {
-        responseType: 'blob',
-      });
-      
+      // The export is built in the background; 202 means try again later
+      const deadline = Date.now() + BATCH_MAX_WAIT_MS;
+      let response = await axios.get(url, { responseType: 'blob' });
+      while (response.status === 202) {
+        const retryAfterMs = (parseInt(response.headers['retry-after'], 10) || 5) * 1000;
+        if (Date.now() + retryAfterMs > deadline) {
+          throw new Error('the export is still being generated, try again later');
+        }
+        await new Promise(resolve => setTimeout(resolve, retryAfterMs));
+        response = await axios.get(url, { responseType: 'blob' });
+      }
+
       const blobUrl = window.URL.createObjectURL(new Blob([response.data]));
       const link = document.createElement('a');
       link.href = blobUrl;